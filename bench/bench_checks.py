@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU time of result checks
+=========================
+
+CPU time spent by a failing check (the worst case: it waits for the whole
+timeout), with the former busy loop and with the Checker waiting on its
+condition, for several checks running at the same time.
+
+    python bench/bench_checks.py [timeout] [concurrent checks]
+
+"""
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'services', 'lib'))
+
+from kali.addons.checkers import Checker  # noqa: E402
+
+
+def busy_check(timeout):
+    """Comparison re-run with no sleep, as Checker.check used to"""
+    expected, returned = 'expected', 'returned'
+    start = time.time()
+    while time.time() < start + timeout:
+        if expected == returned:
+            return True
+    return False
+
+
+def checker_check(timeout):
+    checker = Checker()
+    checker.set_timeout(timeout)
+    checker.set_returned('returned')
+    checker.set_expected('expected')
+    return checker.equal()
+
+
+def measure(name, function, timeout, concurrent):
+    threads = [threading.Thread(target=function, args=(timeout,))
+               for _ in range(concurrent)]
+    wall, cpu = time.monotonic(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall, cpu = time.monotonic() - wall, time.process_time() - cpu
+    print("%-14s %d checks of %.1fs: wall %.2fs, cpu %.3fs (%.1f%% of a "
+          "core per check)" % (name, concurrent, timeout, wall, cpu,
+                               100 * cpu / wall / concurrent))
+
+
+def main(timeout, concurrent):
+    measure('busy loop', busy_check, timeout, concurrent)
+    measure('Checker', checker_check, timeout, concurrent)
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4)
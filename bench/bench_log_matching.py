@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log matching on growing journals
+================================
+
+A synthetic journal grows to N lines (1M by default) over 200 polls, as a
+Loglib cache during a soak test; at each poll the expectations (never found)
+are checked by rescanning every line, as Checker.find used to, then by the
+incremental LineMatcher.
+
+    python bench/bench_log_matching.py [lines]
+
+"""
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'services', 'lib'))
+
+from kali.addons.checkers import LineMatcher  # noqa: E402
+
+POLLS = 200
+
+
+def rescan(expected):
+    def scan(lines):
+        for line in lines:
+            if line.find(expected) >= 0:
+                return True
+        return False
+    return scan
+
+
+def grow(lines, scan):
+    journal = []
+    step = len(lines) // POLLS
+    start = time.perf_counter()
+    for poll in range(POLLS):
+        journal.extend(lines[poll * step:(poll + 1) * step])
+        scan(journal)
+    return time.perf_counter() - start
+
+
+def main(count):
+    lines = ['%d kernel: something happened on unit %d with value %d' %
+             (i, i % 97, i * 7) for i in range(count)]
+    print("%d lines, %d polls" % (count, POLLS))
+    cases = [
+        ('full rescan, 1 substring', rescan('NEVER')),
+        ('incremental, 1 substring', LineMatcher('NEVER').scan),
+        ('incremental, 5 mixed', LineMatcher(
+            ['NEVER', 'NOPE', re.compile(r'unit 9\d{2}'), 'xx', 'yy']).scan),
+    ]
+    for name, scan in cases:
+        print("%-26s %8.2fs" % (name, grow(lines, scan)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Loglib TCP throughput
+=====================
+
+Local TCP log generators stream a synthetic journal to Loglib handlers:
+the byte per byte handler thread of COMMON/Loglib, measured for a few
+seconds, then the chunked handlers served by the shared selector reactor,
+timed until the whole journal is received.
+
+    python bench/bench_loglib.py [lines] [handlers]
+
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'services', 'lib'))
+
+from kali.COMMON.Loglib import Loglib as legacy  # noqa: E402
+from kali.addons.lib.Loglib import Loglib  # noqa: E402
+
+LINE = b"Jan 01 00:00:00 omnia ots[123]: journal message with some " \
+       b"payload text %08d\n"
+LEGACY_SECONDS = 3.0
+
+
+def generator(payload):
+    """Start a TCP server sending payload to its first client"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def serve():
+        client, _ = server.accept()
+        try:
+            client.sendall(payload)
+            time.sleep(LEGACY_SECONDS + 1)
+        except OSError:
+            pass
+        client.close()
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def main(lines, handlers):
+    payload = b"".join(LINE % i for i in range(lines))
+    megabytes = len(payload) / 1e6
+
+    log = legacy.LogLib()
+    log.add_tcp_handler('127.0.0.1', generator(payload))
+    time.sleep(LEGACY_SECONDS)
+    received = log.get_size()
+    log.close()
+    print("recv(1) thread       1 handler: %9.0f B/s" %
+          (received / LEGACY_SECONDS))
+
+    logs = []
+    start = time.perf_counter()
+    for _ in range(handlers):
+        log = Loglib.LogLib()
+        log.add_tcp_handler('127.0.0.1', generator(payload))
+        logs.append(log)
+    while any(len(log.cache) < lines for log in logs):
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    print("selector reactor     %d handlers: %9.0f B/s (%.1f MB each in "
+          "%.3fs, %d threads)" % (handlers, handlers * len(payload) / elapsed,
+                                  megabytes, elapsed,
+                                  threading.active_count()))
+    for log in logs:
+        log.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTS receive throughput
+======================
+
+Multi-megabyte json replies (eg. a journal) pushed through the local fake OTS
+server, read byte per byte with recv(1) as the client used to, then with the
+buffered recv_into path of ConnectionHandler.
+
+    python bench/bench_ots_receive.py [size in MB...]
+
+"""
+import os
+import socket
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'services', 'lib'),
+                os.path.join(ROOT, 'tests')]
+
+from fake_ots import FakeOts  # noqa: E402
+from kali.COMMON.TLV import TLV  # noqa: E402
+from kali.ots_client import OtsClient  # noqa: E402
+from kali.protocol_header import create_header  # noqa: E402
+
+REQUEST = '{"run": [{"journal": [{"get": {"lines": 0}}]}]}'
+
+
+def legacy_round_trip(sock):
+    """Byte per byte read, as ConnectionHandler.communicate used to do"""
+    sock.sendall(create_header(len(REQUEST), 'json') + REQUEST.encode())
+    header = TLV()
+    while not header.complete:
+        header.populate(sock.recv(1))
+    len_tlv = TLV()
+    i = 0
+    while not len_tlv.complete:
+        len_tlv.populate(header.getVal()[i:i + 1])
+        i += 1
+    data_length = int.from_bytes(len_tlv.getVal(), byteorder='big')
+    data = b''
+    while len(data) < data_length:
+        data += sock.recv(1)
+    return data.decode()
+
+
+def measure(function):
+    start = time.perf_counter()
+    size = len(function())
+    return size, time.perf_counter() - start
+
+
+def main(sizes):
+    for megabytes in sizes:
+        server = FakeOts(reply_size=int(megabytes * 1024 * 1024))
+        sock = socket.create_connection(('127.0.0.1', server.port))
+        size, legacy = measure(lambda: legacy_round_trip(sock))
+        sock.close()
+        client = OtsClient('ots', '127.0.0.1', server.port, None,
+                           keepalive=None)
+        _, buffered = measure(
+            lambda: client.send('ots', 'journal', 'get', {'lines': 0}))
+        client.close_all()
+        server.close()
+        print("%6.2f MB  recv(1) %8.3fs %8.2f MB/s  recv_into %8.3fs "
+              "%8.2f MB/s  x%.0f" % (size / 1e6, legacy, size / legacy / 1e6,
+                                     buffered, size / buffered / 1e6,
+                                     legacy / buffered))
+
+
+if __name__ == '__main__':
+    main([float(arg) for arg in sys.argv[1:]] or [0.25, 0.5, 1])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTS reconnection delay
+======================
+
+The local fake OTS server goes down for a while (as a rebooting board) and
+comes back on the same port: measured is the delay between the server being
+up again and the client using it, for an idempotent request waiting with
+backoff and for the keepalive thread reconnecting an idle connection.
+
+    python bench/bench_ots_reconnect.py [downtime seconds] [runs]
+
+"""
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'services', 'lib'),
+                os.path.join(ROOT, 'tests')]
+
+from fake_ots import FakeOts  # noqa: E402
+from kali.ots_client import OtsClient  # noqa: E402
+
+
+def reboot(server, downtime):
+    """Take the server down, bring it up after downtime, return the up time"""
+    up = {}
+
+    def start():
+        server.up()
+        up['time'] = time.monotonic()
+
+    server.down()
+    timer = threading.Timer(downtime, start)
+    timer.start()
+    return timer, up
+
+
+def idempotent_request(server, downtime):
+    client = OtsClient('ots', '127.0.0.1', server.port, None, keepalive=None)
+    try:
+        timer, up = reboot(server, downtime)
+        assert client.send('ots', 'dbus', 'ping', idempotent=True)
+        timer.join()
+        return time.monotonic() - up['time']
+    finally:
+        client.close_all()
+
+
+def keepalive(server, downtime):
+    client = OtsClient('ots', '127.0.0.1', server.port, None, keepalive=0.2)
+    try:
+        timer, up = reboot(server, downtime)
+        while client.is_connected('ots'):
+            time.sleep(0.001)
+        timer.join()
+        while not client.is_connected('ots'):
+            time.sleep(0.001)
+        return time.monotonic() - up['time']
+    finally:
+        client.close_all()
+
+
+def main(downtime, runs):
+    server = FakeOts()
+    try:
+        for name, function in (('idempotent request', idempotent_request),
+                               ('keepalive', keepalive)):
+            delays = [function(server, downtime) for _ in range(runs)]
+            print("%-20s down %.1fs: back after %.3fs mean, %.3fs max" % (
+                name, downtime, sum(delays) / runs, max(delays)))
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 3)
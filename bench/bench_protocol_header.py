@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTS header codec microbenchmarks
+================================
+
+Fixed layout (struct, precompiled prefixes) against the generic TLV path, for
+encoding and decoding the E0 {DF01, DF02} header.
+
+    python bench/bench_protocol_header.py [iterations]
+
+"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'services', 'lib'))
+
+from kali.COMMON.TLV import APDU2TLV, TLV  # noqa: E402
+from kali.ots_client import read_header_length  # noqa: E402
+from kali.protocol_header import check_header  # noqa: E402
+from kali.protocol_header import create_header  # noqa: E402
+from kali.protocol_header import create_header_tlv  # noqa: E402
+from kali.protocol_header import decode_header  # noqa: E402
+
+LENGTH = 5 * 1024 * 1024
+
+
+def decode_tlv(raw):
+    """Generic TLV decoding, the fallback of read_header_length"""
+    tag, length, value = APDU2TLV(raw, 0)[0]
+    header = TLV(tag, value, length)
+    fields = APDU2TLV(value, 0)
+    len_tlv = TLV(fields[0][0], fields[0][2], fields[0][1])
+    format_tlv = TLV(fields[1][0], fields[1][2], fields[1][1])
+    check_header(header) and check_header(len_tlv) and \
+        check_header(format_tlv)
+    return int.from_bytes(len_tlv.getVal(), byteorder='big')
+
+
+def decode_populate(raw):
+    """Byte per byte TLV.populate, as the client used to read headers"""
+    header = TLV()
+    for i in range(len(raw)):
+        header.populate(raw[i:i + 1])
+    len_tlv = TLV()
+    value = header.getVal()
+    for i in range(len(value)):
+        if len_tlv.complete:
+            break
+        len_tlv.populate(value[i:i + 1])
+    return int.from_bytes(len_tlv.getVal(), byteorder='big')
+
+
+def main(number):
+    header = create_header(LENGTH, 'json')
+    cases = [
+        ('encode fixed', lambda: create_header(LENGTH, 'json')),
+        ('encode tlv', lambda: create_header_tlv(LENGTH, 'json')),
+        ('decode fixed', lambda: decode_header(header)),
+        ('decode fixed + checks', lambda: read_header_length(header)),
+        ('decode tlv', lambda: decode_tlv(header)),
+        ('decode populate', lambda: decode_populate(header)),
+    ]
+    for name, function in cases:
+        seconds = timeit.timeit(function, number=number)
+        print("%-22s %8.3f us" % (name, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
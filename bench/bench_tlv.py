@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLV parsing benchmarks
+======================
+
+Large synthetic APDU dump (nested EMV-like records) parsed by APDU2TLV and
+walked by zero-copy TLV views, then serialized back. Comparison of two large
+TLVs collections by linear scans and through the tag index.
+
+    python bench/bench_tlv.py [records]
+
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'services', 'lib'))
+
+from kali.COMMON.TLV import APDU2TLV, TLV, TLVs  # noqa: E402
+from kali.COMMON.TLV import dump_tlvs, iter_tlv_views  # noqa: E402
+
+
+def tlv(tag, value):
+    return TLV(tag, value).hexdump()
+
+
+def synthetic_dump(records):
+    inner = tlv(b'\x9f\x02', b'\x00\x00\x00\x01\x00\x00') + \
+        tlv(b'\x5a', b'\x41\x11' * 4) + tlv(b'\x9f\x1a', b'\x08\x40')
+    record = tlv(b'\x70', inner + tlv(b'\xa5', tlv(b'\x50', b'VISA' * 10) +
+                                      tlv(b'\xbf\x0c',
+                                          tlv(b'\x9f\x4d', b'\x0b\x0a'))))
+    return (record + tlv(b'\xdf\x10', os.urandom(100))) * records
+
+
+def timed(name, function):
+    start = time.perf_counter()
+    result = function()
+    print("%-34s %8.3fs" % (name, time.perf_counter() - start))
+    return result
+
+
+def concatenate(tlvs):
+    """Serialization by repeated +=, as TLVs.hexdump used to do"""
+    dump = b''
+    for item in tlvs:
+        dump += item.hexdump()
+    return dump
+
+
+def scan_compare(own, compared):
+    """Identity comparison by linear scans, as TLVs.compare_tlvs used to"""
+    def contains(items, others):
+        return all(any(item.compare_tlv(other) for item in items)
+                   for other in others)
+    return contains(own, compared) and contains(compared, own)
+
+
+def main(records):
+    data = synthetic_dump(records)
+    print("%d records, %.1f MB" % (records, len(data) / 1e6))
+    fields = timed('APDU2TLV (copies)', lambda: APDU2TLV(data, 0))
+    views = timed('iter_tlv_views', lambda: list(iter_tlv_views(data)))
+    assert len(fields) == len(views)
+    timed('find nested tag in every record',
+          lambda: [view.find(b'\x9f\x4d') for view in views])
+    tlvs = [TLV(tag, value, length) for tag, length, value in fields]
+    timed('serialize TLVs by +=', lambda: concatenate(tlvs))
+    timed('serialize TLVs by join', lambda: dump_tlvs(tlvs))
+    assert timed('serialize views by join', lambda: dump_tlvs(views)) == data
+    items = [TLV(i.to_bytes(3, 'big'), os.urandom(8))
+             for i in range(records // 4)]
+    own, compared = TLVs(list(items)), TLVs(list(reversed(items)))
+    print("compare %d TLVs" % len(items))
+    assert timed('compare by scans', lambda: scan_compare(items, items[::-1]))
+    assert timed('compare_tlvs (index)',
+                 lambda: own.compare_tlvs(compared, True))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -45,3 +45,5 @@ TEST_FOLDER = os.path.abspath(os.path.join('test_cases', 'tests'))
 ROOT_FOLDER = os.path.abspath('test_cases')
 SKIP_ITEMS = ['__pycache__', '__init__.py', 'data', 'lib', 'wizard_procedure_8_5_28.py', 'test_files']
 CONFIG_FILE = 'launcher_config.ini'
+DISCOVERY_INDEX = os.path.abspath('.discovery_index.json')
+JOURNAL_FILE = os.path.abspath('.kali_journal.jsonl')
@@ -0,0 +1,226 @@
+"""
+TEST DISCOVERY
+==============
+
+Find the test cases under the tests folder without importing them: number,
+title and tags of each KaliTest class are read from its source with `ast`
+and cached in an index file, refreshed only for the files changed since the
+previous launch (mtime, then content hash). Test modules are imported only
+when the test is run.
+
+"""
+import ast
+import hashlib
+import importlib
+import json
+import os
+
+INDEX_VERSION = 2
+TEST_CLASS = 'KaliTest'
+TAGS_ATTR = 'tags'
+# Methods setting number, title and tags, in call order
+SETUP_METHODS = ('__init__', 'setup')
+
+
+class TestEntry:
+    """
+    TestEntry class definition: a discovered test, loaded on demand
+
+    Params:
+        path(str): abs path of the test file
+        module(str): module name, importable from the test cases root
+        number(str): test number (None if not statically known)
+        title(str): test title (None if not statically known)
+        tags(list): test tags (None if not statically known)
+    """
+    def __init__(self, path, module, number=None, title=None, tags=None):
+        self.path = path
+        self.module = module
+        self.number = number
+        self.title = title
+        self.tags = tags
+        self._test = None
+
+    def load(self):
+        """
+        Import the test module
+
+        Returns:
+            (class): KaliTest class
+
+        Raises:
+            AttributeError if cannot find KaliTest class
+        """
+        if self._test is None:
+            self._test = getattr(importlib.import_module(self.module), TEST_CLASS)
+        return self._test
+
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return None
+
+
+def _walk(nodes):
+    """Yield the nodes under nodes, without entering nested definitions"""
+    definitions = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+    todo = [node for node in nodes if not isinstance(node, definitions)]
+    while todo:
+        node = todo.pop()
+        yield node
+        todo.extend(child for child in ast.iter_child_nodes(node) if not isinstance(child, definitions))
+
+
+def _method_nodes(test_class):
+    """Return the calls and assignments of the setup methods, in call order"""
+    methods = {node.name: node for node in test_class.body
+               if isinstance(node, ast.FunctionDef) and node.name in SETUP_METHODS}
+    nodes = []
+    for name in SETUP_METHODS:
+        if name in methods:
+            nodes.extend(sorted((node for node in _walk(methods[name].body)
+                                 if isinstance(node, (ast.Call, ast.Assign))),
+                                key=lambda node: (node.lineno, node.col_offset)))
+    return nodes
+
+
+def _is_self_tags(node):
+    return isinstance(node, ast.Attribute) and node.attr == TAGS_ATTR and \
+        isinstance(node.value, ast.Name) and node.value.id == 'self'
+
+
+def parse_test(source):
+    """
+    Read the metadata of the KaliTest class from a test source: only the
+    class attributes and the __init__ and setup methods are read
+
+    Params:
+        source(bytes): source of the test file
+
+    Returns:
+        (dict): number, title and tags (None when not literal), or None if
+            the source has no KaliTest class
+    """
+    tree = ast.parse(source)
+    test_class = next((node for node in tree.body
+                       if isinstance(node, ast.ClassDef) and node.name == TEST_CLASS), None)
+    if test_class is None:
+        return None
+    info = {'number': None, 'title': None, 'tags': []}
+    for node in test_class.body:
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == TAGS_ATTR
+                                                for target in node.targets):
+            info['tags'] = _literal(node.value)
+    for node in _method_nodes(test_class):
+        if isinstance(node, ast.Assign):
+            if any(_is_self_tags(target) for target in node.targets):
+                info['tags'] = _literal(node.value)
+            continue
+        func = node.func
+        if not isinstance(func, ast.Attribute):
+            continue
+        if func.attr == '__init__':
+            # super().__init__(kali, logger, title, number) or
+            # KaliTestCase.__init__(self, kali, logger, title, number)
+            first = 2 if isinstance(func.value, ast.Call) else 3
+            args = node.args[first:first + 2]
+            if len(args) > 0:
+                info['title'] = _literal(args[0])
+            if len(args) > 1:
+                info['number'] = _literal(args[1])
+            for keyword in node.keywords:
+                if keyword.arg in ('test_title', 'test_number'):
+                    info[keyword.arg[5:]] = _literal(keyword.value)
+        elif func.attr in ('set_tags', 'add_tags') and isinstance(func.value, ast.Name) and \
+                func.value.id == 'self':
+            tags = _literal(node.args[0]) if node.args else None
+            if tags is None or info['tags'] is None:
+                info['tags'] = None
+            elif func.attr == 'set_tags':
+                info['tags'] = list(tags)
+            else:
+                info['tags'] = info['tags'] + list(tags)
+        elif _is_self_tags(func.value):
+            # self.tags.append(...) and the like
+            info['tags'] = None
+    if info['tags'] is not None:
+        info['tags'] = list(info['tags'])
+    return info
+
+
+class DiscoveryIndex:
+    """
+    DiscoveryIndex class definition: cache of test metadata on disk
+
+    Params:
+        path(str): index file (created at first save)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self._dirty = False
+        if os.path.isfile(path):
+            try:
+                with open(path) as fp:
+                    index = json.load(fp)
+                if index.get('version') == INDEX_VERSION:
+                    self.files = index['files']
+            except (ValueError, KeyError):
+                self.files = {}
+
+    def get(self, path, module, stat=None):
+        """
+        Return the test entry of a test file, parsing it only if changed
+
+        Params:
+            path(str): abs path of the test file
+            module(str): module name of the test
+            stat(obj): os.stat_result of path, if already known
+
+        Returns:
+            (obj): TestEntry object, None if the file has no KaliTest class
+        """
+        stat = stat or os.stat(path)
+        cached = self.files.get(path)
+        if cached is None or cached['mtime'] != stat.st_mtime or cached['size'] != stat.st_size:
+            with open(path, 'rb') as fp:
+                source = fp.read()
+            digest = hashlib.sha1(source).hexdigest()
+            if cached is None or cached['hash'] != digest:
+                try:
+                    info = parse_test(source)
+                except SyntaxError:
+                    info = None
+                cached = {'hash': digest, 'info': info}
+            cached.update(mtime=stat.st_mtime, size=stat.st_size)
+            self.files[path] = cached
+            self._dirty = True
+        info = cached['info']
+        if info is None:
+            return None
+        return TestEntry(path, module, info['number'], info['title'], info['tags'])
+
+    def prune(self, paths):
+        """
+        Forget the files not found anymore
+
+        Params:
+            paths(set): abs paths of the files discovered
+        """
+        for path in set(self.files) - set(paths):
+            del self.files[path]
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the index on file (atomically), if changed
+        """
+        if not self._dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump({'version': INDEX_VERSION, 'files': self.files}, fp)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
@@ -1,13 +1,33 @@
 from test_logger import MyLogger, FileLogger
 from test_cases.KALI.kali import Kali
 from test_cases.KALI.define import TestCases
+from test_cases.KALI.metrics import Metrics, JsonlSink, PrometheusSink
+from test_cases.KALI.reporters import JunitReporter, JsonlReporter, CheckpointJournal, FSYNC_POLICIES, \
+    FSYNC_ALWAYS
+from test_cases.KALI.test_case import KaliTestResultManager
 from argparse import ArgumentParser
 import configparser
 from lib.helpers import check_ip
+from scheduler import ParallelScheduler, TimingHistory, read_environments, reserve_environments, \
+    release_environments, REGRESSION_RATIO
+from discovery import DiscoveryIndex
 import os
 import sys
 import importlib
-from define import OTS_LABEL, BANNER, SETUP, RUNNING, RESULT, TEST_FOLDER, ROOT_FOLDER, SKIP_ITEMS, CONFIG_FILE
+from collections import OrderedDict
+from define import OTS_LABEL, BANNER, SETUP, RUNNING, RESULT, TEST_FOLDER, ROOT_FOLDER, SKIP_ITEMS, CONFIG_FILE, \
+    DISCOVERY_INDEX, JOURNAL_FILE
+
+
+def test_module(test_path):
+    """
+    Return the module name of a test file, importable from ROOT_FOLDER
+
+    Params:
+        test_path(str): path where test case is stored
+    """
+    test_path_l = test_path.split(os.sep)
+    return '.'.join(['tests', test_path_l[-3], test_path_l[-2], test_path_l[-1].split('.')[0]])
 
 
 def import_test(test_path):
@@ -23,18 +43,180 @@ def import_test(test_path):
     Raises:
         AttributeError if cannot find KaliTest class
     """
-    test_path_l = test_path.split(os.sep)
-    suite = test_path_l[-3]
-    chapter = test_path_l[-2]
-    test = test_path_l[-1].split('.')[0]
-    module = '.'.join(['tests', suite, chapter, test])
-    module = importlib.import_module(module)
+    module = importlib.import_module(test_module(test_path))
     try:
         return getattr(module, 'KaliTest')
     except AttributeError as e:
         raise e
 
 
+def filtered_out(kali, entry):
+    """
+    Check the tags of a discovered test before importing it. Tests whose
+    tags are not statically known are checked by Kali.run after setup
+
+    Params:
+        kali(obj): Kali object
+        entry(obj): TestEntry object
+
+    Returns:
+        True if the test is refused by tag rules
+    """
+    return entry.tags is not None and not kali.is_test_allowed(entry.tags)
+
+
+def already_completed(kali, entry):
+    """
+    Check if a discovered test has been completed by the run being resumed.
+    Tests whose number/title are not statically known are checked by
+    Kali.run
+
+    Params:
+        kali(obj): Kali object
+        entry(obj): TestEntry object
+
+    Returns:
+        True if the test must not run again
+    """
+    return (entry.number, entry.title) in kali.skip_tests
+
+
+def print_banner(kali, entry, chapter_path):
+    """
+    Print the test banner, instancing the test only if its number/title
+    are not statically known
+
+    Params:
+        kali(obj): Kali object
+        entry(obj): TestEntry object
+        chapter_path(str): path of the chapter containing the test
+    """
+    number, title = entry.number, entry.title
+    if number is None or title is None:
+        test_obj = entry.load()(kali, kali.logger)
+        number, title = test_obj.test_number, test_obj.test_title
+    kali.info(BANNER % (title, number, chapter_path))
+
+
+def create_metrics(metrics_paths, suffix=None):
+    """
+    Create the metrics object collecting the steps of the tests
+
+    Params:
+        metrics_paths(tuple): (jsonl path, prometheus path), None items are skipped
+        suffix(str): appended to paths (eg. environment name in worker processes)
+
+    Returns:
+        (obj): Metrics object, None if no path is given
+    """
+    if not metrics_paths or not any(metrics_paths):
+        return None
+    jsonl_path, prom_path = metrics_paths
+    if suffix:
+        jsonl_path = jsonl_path and '%s.%s' % (jsonl_path, suffix)
+        prom_path = prom_path and '%s.%s' % (prom_path, suffix)
+    metrics = Metrics()
+    if jsonl_path:
+        metrics.add_sink(JsonlSink(jsonl_path))
+    if prom_path:
+        metrics.add_sink(PrometheusSink(prom_path))
+    return metrics
+
+
+def create_reporters(report_paths, suffix=None, resume=False):
+    """
+    Create the reporters streaming the test results
+
+    Params:
+        report_paths(tuple): (junit path, jsonl path, fsync policy), None paths are skipped
+        suffix(str): appended to paths and to the suite name (eg. environment name in worker processes)
+        resume(bool): continue the files of an interrupted run
+
+    Returns:
+        (list): ResultReporter objects
+    """
+    if not report_paths:
+        return []
+    junit_path, jsonl_path, fsync = report_paths
+    if suffix:
+        junit_path = junit_path and '%s.%s' % (junit_path, suffix)
+        jsonl_path = jsonl_path and '%s.%s' % (jsonl_path, suffix)
+    reporters = []
+    if junit_path:
+        reporters.append(JunitReporter(junit_path, fsync, suite='kali.%s' % suffix if suffix else 'kali',
+                                       resume=resume))
+    if jsonl_path:
+        reporters.append(JsonlReporter(jsonl_path, fsync, extra={'environment': suffix} if suffix else None,
+                                       resume=resume))
+    return reporters
+
+
+def add_reporters(kali, report_paths, suffix=None, resume=False):
+    """
+    Add to Kali the reporters streaming the test results
+
+    Params:
+        kali(obj): Kali object
+        report_paths(tuple): see create_reporters
+        suffix(str): see create_reporters
+        resume(bool): see create_reporters
+    """
+    for reporter in create_reporters(report_paths, suffix, resume):
+        kali.add_reporter(reporter)
+
+
+def failed_result():
+    """
+    Return a closed test result with a single failed step, for tests that
+    could not run (eg. their worker process crashed). Its duration is None,
+    so the timing history ignores it
+    """
+    result = KaliTestResultManager()
+    result.add_failed()
+    result.close()
+    result.duration = None
+    return result
+
+
+def run_shard(environment, entries, port, addons_required, max_duration, out_path, tags, metrics_paths=None,
+              report_paths=None, journal_path=None, resume=False):
+    """
+    Worker process: run the given tests on an environment with its own Kali
+
+    Params:
+        environment(tuple): (name, ip) of the environment
+        entries(list): list of (index, (chapter_path, TestEntry)) tuples
+        port(int): OTS port
+        addons_required(bool): True if all addons are required
+        max_duration(int): max duration for each test case
+        out_path(str): path where store logs (suffixed by environment name)
+        tags(str): tag expression tests must satisfy
+        metrics_paths(tuple): (jsonl path, prometheus path) of the step metrics (suffixed by environment name)
+        report_paths(tuple): (junit path, jsonl path, fsync policy) of the results (suffixed by environment name)
+        journal_path(str): checkpoint journal (suffixed by environment name)
+        resume(bool): continue the journal of an interrupted run
+
+    Returns:
+        (list): list of (index, (number, title), KaliTestResultManager)
+    """
+    name, ip = environment
+    k = Kali()
+    k.set_logger(FileLogger('%s.%s' % (out_path, name)) if out_path else MyLogger())
+    k.set_metrics(create_metrics(metrics_paths, name))
+    add_reporters(k, report_paths, name, resume)
+    results = []
+    try:
+        launcher = TestLauncher(k, ip, port, addons_required, max_duration, tags=tags,
+                                journal_path=journal_path and '%s.%s' % (journal_path, name), resume=resume)
+        for index, (chapter_path, entry) in entries:
+            done = len(k.test_cases)
+            launcher.run_test(entry, chapter_path)
+            results.extend((index, key, k.test_cases[key]) for key in list(k.test_cases)[done:])
+    finally:
+        k.close()
+    return results
+
+
 class TestSuite:
     """
     TestSuite class definition
@@ -88,7 +270,7 @@ class TestChapter:
         Add a test case to the chapter
 
         Params:
-            chapter(obj): KaliTestCase object (or subclass)
+            test(obj): TestEntry object
         """
         self.tests.append(test)
 
@@ -96,10 +278,14 @@ class TestChapter:
         """
         Execute each test in the chapter
         """
-        for test in self.tests:
-            test_obj = test(self.kali, self.kali.logger)
-            self.kali.info(BANNER % (test_obj.test_title, test_obj.test_number, self.path))
-            self.kali.run(test, ots_label=OTS_LABEL)
+        for entry in self.tests:
+            if already_completed(self.kali, entry):
+                continue
+            print_banner(self.kali, entry, self.path)
+            if filtered_out(self.kali, entry):
+                self.kali.skipped("TEST SKIPPED")
+                continue
+            self.kali.run(entry.load(), ots_label=OTS_LABEL)
 
 
 class TestLauncher:
@@ -112,22 +298,64 @@ class TestLauncher:
         port(int): OTS port
         addons_required(bool): True if all addons are required, False otherwise
         max_duration(int): max duration for each test case
+        connect(bool): connect to OTS and setup addons (False when tests run in worker processes)
+        out_path(str): path where workers store logs
+        history(obj): TimingHistory object, updated after each run and used to balance environments
+        tags(str): tag expression tests must satisfy, overriding the one in config file
+        metrics_paths(tuple): (jsonl path, prometheus path) where workers store step metrics
+        report_paths(tuple): (junit path, jsonl path, fsync policy) where workers stream the results
+        journal_path(str): checkpoint journal recording each completed test (suffixed by environment name in
+            worker processes)
+        resume(bool): continue the journal of an interrupted run: completed tests are not run again and the
+            OTS address (or the environments) of that run are used
     """
-    def __init__(self, kali, ip='172.20.100.254', port=10000, addons_required=False, max_duration=None):
+    def __init__(self, kali, ip='172.20.100.254', port=10000, addons_required=False, max_duration=None,
+                 connect=True, out_path=None, history=None, tags=None, metrics_paths=None, report_paths=None,
+                 journal_path=None, resume=False):
         self.kali = kali
         self.kali.info(SETUP)
         self.path = TEST_FOLDER
         sys.path.append(ROOT_FOLDER)
+        self.journal_path = journal_path
+        self.resume = resume
+        self.journal = None
+        self.restored = set()
+        if connect and journal_path:
+            self.journal = CheckpointJournal(journal_path, resume=resume, run_info={'ip': ip, 'port': port})
+            if resume:
+                # Reattaching to the OMNIA of the interrupted run
+                ip = self.journal.run_info.get('ip', ip)
+                port = self.journal.run_info.get('port', port)
+                self.restore(self.journal)
+            self.kali.add_reporter(self.journal)
         self.ip = ip
         self.port = port
         self.addons_required = addons_required
         self.max_duration = max_duration
+        self.out_path = out_path
+        self.history = history
+        self.tags = tags
+        self.metrics_paths = metrics_paths
+        self.report_paths = report_paths
+        self.index = DiscoveryIndex(DISCOVERY_INDEX)
+        self.discovered = set()
         self.test_suites = []
-        self.kali.start_connection_ots(OTS_LABEL, ip, port)
-        if addons_required:
-            self.setup_all_addons()
+        if connect:
+            self.kali.start_connection_ots(OTS_LABEL, ip, port)
+            if addons_required:
+                self.setup_all_addons()
         self.set_tags()
 
+    def restore(self, journal):
+        """
+        Load the results of the tests completed by the interrupted run, they
+        are not run again
+
+        Params:
+            journal(obj): CheckpointJournal object
+        """
+        self.restored.update(self.kali.resume(journal))
+
     def setup_all_addons(self):
         """
         Setup all needed addons
@@ -148,6 +376,8 @@ class TestLauncher:
             self.set_tag_rules(config)
         except KeyError:
             self.kali.error("Invalid config file")
+        if self.tags:
+            self.kali.set_tag_expression(self.tags)
 
     def set_tag_rules(self, config):
         refused_tags = config["RULES"]["deny"].split(',')
@@ -160,6 +390,9 @@ class TestLauncher:
             self.kali.accepted_tags = accepted_tags
         else:
             self.kali.accepted_tags = self.get_default_tags(config)
+        expression = config["RULES"].get("expression", "")
+        if expression != '':
+            self.kali.set_tag_expression(expression)
 
     def get_default_tags(self, config):
         tags = []
@@ -181,6 +414,10 @@ class TestLauncher:
             except KeyboardInterrupt:
                 self.kali.failed('Check failed!')
                 self.kali.info('Tests execution interrupted. Exiting...')
+                if self.journal is not None:
+                    # The interrupted test is not completed: --resume runs it again
+                    self.kali.reporters.remove(self.journal)
+                    self.journal.close()
                 self.kali._cur_test_case.add_failed()
                 self.kali.end_test_case()
                 self.kali.info(self.kali.prettyprint_test_cases_result())
@@ -190,16 +427,197 @@ class TestLauncher:
                 self.kali._cur_test_case.add_failed()
                 self.kali.failed('Check failed!')
                 self.kali.end_test_case()
+        self.record_timings()
+        self.kali.info(RESULT)
+        try:
+            self.kali.info(self.kali.prettyprint_test_cases_result())
+        except Exception as e:
+            self.kali.error(e)
+
+    def record_timings(self):
+        """
+        Store the tests durations in the timing history and report regressions
+        """
+        if self.history is None:
+            return
+        test_cases = OrderedDict((key, result) for key, result in self.kali.test_cases.items()
+                                 if key not in self.restored)
+        for number, title, expected, duration in self.history.record(test_cases):
+            self.kali.warning('Test %s %s runtime regressed: %.1fs (expected %.1fs)' %
+                              (number, title, duration, expected))
+        self.history.save()
+
+    def run_test(self, entry, chapter_path):
+        """
+        Execute a single test, recording it as failed on unexpected errors
+
+        Params:
+            entry(obj): TestEntry object
+            chapter_path(str): path of the chapter containing the test
+        """
+        try:
+            if already_completed(self.kali, entry):
+                return
+            print_banner(self.kali, entry, chapter_path)
+            if filtered_out(self.kali, entry):
+                self.kali.skipped("TEST SKIPPED")
+                return
+            self.kali.run(entry.load(), ots_label=OTS_LABEL)
+        except Exception as e:
+            self.kali.error(e)
+            if self.kali._cur_test_case is not None and not self.kali._cur_test_case.is_closed():
+                self.kali._cur_test_case.add_failed()
+                self.kali.failed('Check failed!')
+                self.kali.end_test_case()
+
+    def get_test_entries(self):
+        """
+        Return the discovered tests, in execution order
+
+        Returns:
+            (list): list of (chapter_path, TestEntry) tuples
+        """
+        return [(chapter.path, entry)
+                for ts in self.test_suites for chapter in ts.chapters for entry in chapter.tests]
+
+    def get_test_key(self, entry):
+        """
+        Return the (number, title) of a test, instancing it only if they are
+        not statically known
+
+        Params:
+            entry(obj): TestEntry object
+
+        Returns:
+            (tuple): (number, title), (module, path) if the test cannot be
+                instanced
+        """
+        if entry.number is not None and entry.title is not None:
+            return entry.number, entry.title
+        try:
+            test_obj = entry.load()(self.kali, self.kali.logger)
+            return test_obj.test_number, test_obj.test_title
+        except Exception:
+            return entry.module, entry.path
+
+    def shard_crashed(self, environment, entries, error):
+        """
+        Record the tests of a crashed worker: the ones completed according to
+        its checkpoint journal keep their results, the others are failed and
+        appended to the worker result files, so the run does not pass
+
+        Params:
+            environment(tuple): (name, ip) of the environment
+            entries(list): list of (index, (chapter_path, TestEntry)) tuples
+                scheduled on the environment
+            error(Exception): worker error
+
+        Returns:
+            (list): list of (index, (number, title), KaliTestResultManager)
+        """
+        name = environment[0]
+        completed = {}
+        journal_path = self.journal_path and '%s.%s' % (self.journal_path, name)
+        if journal_path and os.path.isfile(journal_path):
+            journal = CheckpointJournal(journal_path, resume=True)
+            completed = journal.restore()
+            journal.close()
+        reporters = create_reporters(self.report_paths, name, resume=True)
+        results = []
+        try:
+            for index, (_, entry) in entries:
+                key = self.get_test_key(entry)
+                if key in completed:
+                    results.append((index, key, completed[key]))
+                    continue
+                self.kali.error('Test %s %s not completed: environment %s crashed (%s)' %
+                                (key[0], key[1], name, error))
+                result = failed_result()
+                for reporter in reporters:
+                    reporter.report(key[0], key[1], result)
+                results.append((index, key, result))
+        finally:
+            for reporter in reporters:
+                reporter.close()
+        return results
+
+    def get_test_weights(self, entries):
+        """
+        Return the expected duration of the tests, read from the timing
+        history (or the duration declared by tests never run)
+
+        Params:
+            entries(list): list of (chapter_path, TestEntry) tuples
+
+        Returns:
+            (list): seconds, in the same order of entries
+        """
+        weights = []
+        for _, entry in entries:
+            if entry.number is None or entry.title is None:
+                test_obj = entry.load()(self.kali, self.kali.logger)
+                weights.append(self.history.estimate(test_obj.test_number, test_obj.test_title,
+                                                     test_obj.get_duration()))
+            else:
+                weights.append(self.history.estimate(entry.number, entry.title))
+        return weights
+
+    def run_parallel(self, environments_config, jobs=None):
+        """
+        Shard the tests across the free environments and execute them in
+        parallel, one worker process for each environment
+
+        Params:
+            environments_config(str): environments config file (eg. config/omnia.ini)
+            jobs(int): max number of environments to be used
+        """
+        environments = None
+        if self.resume and self.journal_path and os.path.isfile(self.journal_path):
+            # Reattaching to the environments of the interrupted run, still marked as busy
+            journal = CheckpointJournal(self.journal_path, resume=True)
+            environments = [tuple(env) for env in journal.run_info.get('environments', [])]
+            journal.close()
+            for name, _ in environments:
+                env_journal = CheckpointJournal('%s.%s' % (self.journal_path, name), resume=True)
+                self.restore(env_journal)
+                env_journal.close()
+        if not environments:
+            environments = read_environments(environments_config)[:jobs]
+            if not environments:
+                self.kali.error('No free environment found in %s' % environments_config)
+                return False
+            if self.journal_path:
+                CheckpointJournal(self.journal_path, run_info={'environments': environments}).close()
+        self.create_test_suite_structure()
+        self.kali.info(RUNNING)
+        names = [name for name, _ in environments]
+        reserve_environments(environments_config, names)
+        try:
+            scheduler = ParallelScheduler(environments, run_shard, self.kali, on_crash=self.shard_crashed)
+            # Tests refused by their static tags are not even scheduled
+            entries = [(path, entry) for path, entry in self.get_test_entries()
+                       if not filtered_out(self.kali, entry) and not already_completed(self.kali, entry)]
+            weights = self.get_test_weights(entries) if self.history is not None else None
+            results = scheduler.run(entries, self.port, self.addons_required,
+                                    self.max_duration, self.out_path, self.tags, self.metrics_paths,
+                                    self.report_paths, self.journal_path, self.resume, weights=weights)
+        finally:
+            release_environments(environments_config, names)
+        self.kali.test_cases.update(results)
+        self.record_timings()
         self.kali.info(RESULT)
         try:
             self.kali.info(self.kali.prettyprint_test_cases_result())
         except Exception as e:
             self.kali.error(e)
+        return True
 
     def create_test_suite_structure(self):
         """
-        Iterate over tests directory to find all available test suites
+        Iterate over tests directory to find all available test suites.
+        Tests are read from the discovery index, not imported
         """
+        self.discovered = set()
         _dir = os.fsencode(self.path)
         for suite_name in os.listdir(_dir):
             suite_name = os.fsdecode(suite_name)
@@ -209,6 +627,8 @@ class TestLauncher:
                 self.kali.info('New Test Suite found: ' + test_suite.name)
                 self.test_suites.append(test_suite)
                 self.create_test_chapter_structure(suite_path, test_suite)
+        self.index.prune(self.discovered)
+        self.index.save()
 
     def create_test_chapter_structure(self, suite_path, test_suite):
         """
@@ -235,16 +655,17 @@ class TestLauncher:
             chapter_path(str): path where chapter is stored
             test_chapter(obj): TestChapter object
         """
-        for test_name in os.listdir(os.fsencode(chapter_path)):
-            test_name = os.fsdecode(test_name)
-            test_path = os.path.join(chapter_path, test_name)
-            if test_name not in SKIP_ITEMS:
-                try:
-                    test = import_test(test_path)
-                    test_chapter.add(test)
-                except AttributeError:
-                    self.kali.warning("Skipped file: " + str(test_name))
-                    break
+        for item in os.scandir(chapter_path):
+            if item.name in SKIP_ITEMS or not item.is_file():
+                continue
+            entry = None
+            if item.name.endswith('.py'):
+                self.discovered.add(item.path)
+                entry = self.index.get(item.path, test_module(item.path), item.stat())
+            if entry is None:
+                self.kali.warning("Skipped file: " + str(item.name))
+                break
+            test_chapter.add(entry)
 
 
 if __name__ == '__main__':
@@ -255,7 +676,37 @@ if __name__ == '__main__':
     parser.add_argument('-a', '--addons', action='store_true', help='Instance all addons')
     parser.add_argument('-m', '--max-duration', type=int, help='Max duration for each test case', default=None)
     parser.add_argument('-v', '--version', type=str, help='OMNIA version label', default=None)
+    parser.add_argument('-e', '--environments', type=str, default=None,
+                        help='Environments config file: run tests in parallel on every free environment')
+    parser.add_argument('-j', '--jobs', type=int, help='Max number of environments used in parallel', default=None)
+    parser.add_argument('-t', '--timings', type=str, default=None,
+                        help='Timing history file: updated after each run, used to balance environments')
+    parser.add_argument('-T', '--tags', type=str, default=None,
+                        help='Tag expression tests must satisfy, eg. "smoke and (webui or dbus) and not slow"')
+    parser.add_argument('-r', '--regression-ratio', type=float, default=REGRESSION_RATIO,
+                        help='Report tests slower than their expected duration by this ratio')
+    parser.add_argument('--metrics-jsonl', type=str, default=None,
+                        help='File where store a JSON line for each check, OTS round trip and WebUI action')
+    parser.add_argument('--metrics-prom', type=str, default=None,
+                        help='Prometheus text file where store the step counters')
+    parser.add_argument('--junit', type=str, default=None,
+                        help='JUnit XML file where stream the test results (one file per environment with -e)')
+    parser.add_argument('--results-jsonl', type=str, default=None,
+                        help='File where stream a JSON line for each test result (one file per environment with -e)')
+    parser.add_argument('--fsync', type=str, choices=FSYNC_POLICIES, default=FSYNC_ALWAYS,
+                        help='When result files are synced to disk')
+    parser.add_argument('--journal', type=str, nargs='?', default=None, const=JOURNAL_FILE,
+                        help='Checkpoint journal recording each completed test, synced after each event (one file '
+                             'per environment with -e). Disabled by default, %s if no file is given' % JOURNAL_FILE)
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume an interrupted run from its journal (%s if --journal is not given): completed '
+                             'tests are skipped' % JOURNAL_FILE)
     args = parser.parse_args()
+    if args.resume and args.journal is None:
+        args.journal = JOURNAL_FILE
+    metrics_paths = (args.metrics_jsonl, args.metrics_prom)
+    report_paths = (args.junit, args.results_jsonl, args.fsync)
+    history = TimingHistory(args.timings, args.regression_ratio) if args.timings else None
 
     k = Kali()
 
@@ -265,10 +716,24 @@ if __name__ == '__main__':
         l = MyLogger()
     k.set_logger(l)
 
-    if check_ip(args.ip):
+    if args.environments:
+        k.info('Running test cases in parallel...')
+        launcher = TestLauncher(k, args.ip, args.port, args.addons, args.max_duration, connect=False,
+                                out_path=args.out_path, history=history, tags=args.tags,
+                                metrics_paths=metrics_paths, report_paths=report_paths, journal_path=args.journal,
+                                resume=args.resume)
+        launcher.run_parallel(args.environments, args.jobs)
+    elif check_ip(args.ip):
         k.info('Running test cases...')
-        launcher = TestLauncher(k, args.ip, args.port, args.addons, args.max_duration)
+        k.set_metrics(create_metrics(metrics_paths))
+        add_reporters(k, report_paths, resume=args.resume)
+        launcher = TestLauncher(k, args.ip, args.port, args.addons, args.max_duration, history=history,
+                                tags=args.tags, journal_path=args.journal, resume=args.resume)
         launcher.run()
     else:
         k.error('Invalid arguments')
-l
\ No newline at end of file
+    if k.metrics is not None:
+        k.metrics.close()
+        k.set_metrics(None)
+    while k.reporters:
+        k.reporters.pop().close()
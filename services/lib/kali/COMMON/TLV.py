@@ -47,15 +47,156 @@ def createTLV(tag, length, value):
     return TLV(tag, value, length)
 
 
+def iter_tlv_views(data, offset=0, end=None):
+    """Walk a BER-TLV buffer without copying it.
+
+    Args:
+        data (bytes/bytearray/memoryview): buffer to be parsed
+        offset (int): position of the first TLV in buffer
+        end (int): position where parsing stops (default: end of buffer)
+
+    Yields:
+        TLVView: one view for each TLV found at this nesting level
+
+    Raises:
+        ValueError: if the buffer is truncated
+    """
+    buf = data if isinstance(data, memoryview) else memoryview(data)
+    if end is None:
+        end = len(buf)
+    i = offset
+    while i < end:
+        start = i
+        i += 1
+        if buf[start] & 0x1F == 0x1F:
+            while i < end and buf[i] & 0x80 == 0x80:
+                i += 1
+            i += 1
+        if i >= end:
+            raise ValueError("Truncated TLV at offset %d" % start)
+        len_start = i
+        first = buf[i]
+        i += 1
+        if first & 0x80:
+            i += first & 0x7F
+            length = int.from_bytes(buf[len_start + 1:i], byteorder='big')
+        else:
+            length = first
+        if i + length > end:
+            raise ValueError("Truncated TLV at offset %d" % start)
+        yield TLVView(buf, start, len_start, i, i + length)
+        i += length
+
+
+def dump_tlvs(tlvs):
+    """Serialize a sequence of TLV (or TLVView) objects in a single join."""
+    return b"".join(tlv.hexdump() for tlv in tlvs)
+
+
+class TLVView(object):
+    """Read only TLV backed by offsets into a shared buffer.
+
+    Tag, length and value are exposed as memoryview slices, constructed
+    TLVs decode their children only when accessed.
+    """
+    __slots__ = ('_buf', 'offset', 'len_offset', 'val_offset', 'end',
+                 '_children')
+
+    def __init__(self, buf, offset, len_offset, val_offset, end):
+        self._buf = buf
+        self.offset = offset
+        self.len_offset = len_offset
+        self.val_offset = val_offset
+        self.end = end
+        self._children = None
+
+    def __str__(self):
+        return hexlify(self.hexdump()).decode("latin 1").upper()
+
+    def __repr__(self):
+        return "TLVView(%s)" % hexlify(self.tag).decode("latin 1").upper()
+
+    @property
+    def tag(self):
+        return self._buf[self.offset:self.len_offset]
+
+    @property
+    def length(self):
+        return self.end - self.val_offset
+
+    @property
+    def value(self):
+        return self._buf[self.val_offset:self.end]
+
+    def is_constructed(self):
+        return self._buf[self.offset] & 0x20 == 0x20
+
+    @property
+    def children(self):
+        if self._children is None:
+            if self.is_constructed():
+                self._children = tuple(iter_tlv_views(
+                    self._buf, self.val_offset, self.end))
+            else:
+                self._children = ()
+        return self._children
+
+    def find(self, tag):
+        """Depth first search of tag inside this TLV children.
+
+        Only the constructed TLVs on the way are decoded.
+        """
+        for child in self.children:
+            if child.tag == tag:
+                return child
+            if child.is_constructed():
+                found = child.find(tag)
+                if found is not None:
+                    return found
+        return None
+
+    # TLV compatible getters, returning bytes copies
+    def getTag(self):
+        return bytes(self.tag)
+
+    def getLen(self):
+        return bytes(self._buf[self.len_offset:self.val_offset])
+
+    def getVal(self):
+        return bytes(self.value)
+
+    def getTLV(self):
+        return bytes(self._buf[self.offset:self.end])
+
+    def getSize(self):
+        return self.end - self.offset
+
+    def hexdump(self):
+        return self._buf[self.offset:self.end]
+
+    def to_tlv(self):
+        return TLV(self.getTag(), self.getVal(), self.getLen())
+
+
 class TLVs(object):
+    """Ordered collection of TLV objects.
+
+    A tag -> TLVs index is kept beside the list, so lookups by tag and
+    presence checks don't need to scan the whole collection. The list is
+    private (the one given is copied, getTLVs returns a tuple), TLVs are
+    added through addTLV only. TLVs are indexed by the tag they have when
+    added: don't change the tag of a TLV already inside a collection.
+    """
 
     def __init__(self, TLVlist=None):
         self.__list = []
+        self.__index = {}
         if type(TLVlist) is list:
             for tlv in TLVlist:
                 if type(tlv) is not TLV:
                     raise TypeError("Not all TLV passed are TLV object")
-            self.__list = TLVlist
+            for tlv in TLVlist:
+                self.addTLV(tlv)
 
     def __iter__(self):
         return iter(self.__list)
@@ -67,9 +208,10 @@ class TLVs(object):
         if type(tlv) is not TLV:
             raise TypeError("try to add no TLV object")
         self.__list.append(tlv)
+        self.__index.setdefault(bytes(tlv.getTag()), []).append(tlv)
 
     def getTLVs(self):
-        return self.__list
+        return tuple(self.__list)
 
     def getLen(self):
         return len(self.__list)
@@ -79,39 +221,42 @@ class TLVs(object):
             print(tlv.toStr_hex())
 
     def get_TLV(self, TAG):
-        for tlv in self.__list:
-            if tlv.getTag() == TAG:
-                return tlv
+        found = self.get_TLVs_by_tag(TAG)
+        if found:
+            return found[0]
         return None
 
+    def get_TLVs_by_tag(self, TAG):
+        """Return all the TLVs having the given tag, in insertion order."""
+        return list(self.__index.get(bytes(TAG), ()))
+
+    def canonical_set(self):
+        """Return the set of canonical forms of the TLVs in the collection."""
+        return {tlv.canonical() for tlv in self.__list}
+
     def TLVisPresent(self, TLVobj):
-        for tlv in self.__list:
+        if type(TLVobj) is not TLV:
+            raise TypeError("Object received is not a TLV")
+        for tlv in self.__index.get(bytes(TLVobj.getTag()), ()):
             if tlv.compare_tlv(TLVobj):
                 return True
         return False
 
     def compare_tlvs(self, tlvs_compared, indentity=False):
         if type(tlvs_compared) is TLVs:
-            for cmpTLV in tlvs_compared:
-                if not self.TLVisPresent(cmpTLV):
-                    return False
+            own = self.canonical_set()
+            compared = tlvs_compared.canonical_set()
             if indentity:
-                return tlvs_compared.compare_tlvs(self)
-            return True
+                return own == compared
+            return compared <= own
         else:
             raise TypeError("Object received is not a TLVs")
 
     def toStr(self):
-        b = ""
-        for tlv in self.__list:
-            b += tlv.toStr()
-        return b
+        return "".join(tlv.toStr() for tlv in self.__list)
 
     def hexdump(self):
-        b = b""
-        for tlv in self.__list:
-            b += tlv.hexdump()
-        return b
+        return dump_tlvs(self.__list)
 
     def pretty_dump(self):
         dump = ""
@@ -147,7 +292,8 @@ class TLV(object):
         return hexlify(self.hexdump()).decode("latin 1").upper()
 
     def copy(self):
-        return copy.deepcopy(self)
+        # All the fields are immutable, a shallow copy is enough
+        return copy.copy(self)
             
     def setTLV(self, tag, val, ln=None):
         self.__Tag = tag
@@ -228,6 +374,11 @@ class TLV(object):
         else:
             return b""
 
+    def canonical(self):
+        """Hashable form of the TLV: TLVs having the same tag, length and
+        value share the same canonical form."""
+        return bytes(self.__Tag), bytes(self.__Len), bytes(self.__Val)
+
     def compare_tlv(self, TLVcompared):
         if type(TLVcompared) is TLV:
             if TLVcompared.getTag() == self.getTag() and \
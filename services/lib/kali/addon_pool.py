@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KALI Addon Pool
+===============
+
+Idle addons kept alive between tests. Addons are indexed by addon type and
+setup kwargs: a test asking for an addon equal to one released by a previous
+test gets it back after a health check, without running close and setup
+again (eg. no new browser for the WebUI addon, no new log handler for the
+log addon).
+
+"""
+import time
+from collections import OrderedDict
+
+# Max number of idle addons kept by the pool
+POOL_MAX_IDLE = 8
+# Seconds after which an idle addon is closed
+POOL_IDLE_TIMEOUT = 600
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class AddonPool(object):
+    """AddonPool class definition.
+
+    Args:
+        max_idle (int): max number of idle addons kept, the oldest are closed.
+        idle_timeout (float): seconds after which an idle addon is closed.
+        logger (object): logger object.
+    """
+
+    def __init__(self, max_idle=POOL_MAX_IDLE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 logger=None):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.logger = logger
+        # (key, id(addon)) -> (addon, release time), oldest first
+        self._idle = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(addon_type, kwargs):
+        """
+        Args:
+            addon_type (class): addon class.
+            kwargs (dict): addon setup kwargs.
+
+        Returns:
+            tuple: hashable key of the addon.
+        """
+        return addon_type, _freeze(kwargs)
+
+    def __len__(self):
+        return len(self._idle)
+
+    def acquire(self, addon_type, kwargs):
+        """
+        Take a healthy idle addon of the given type and setup kwargs.
+
+        Args:
+            addon_type (class): addon class.
+            kwargs (dict): addon setup kwargs.
+
+        Returns:
+            object: the addon, None if no healthy addon is available.
+        """
+        self.expire()
+        key = self.make_key(addon_type, kwargs)
+        for entry in [entry for entry in self._idle if entry[0] == key]:
+            addon, _ = self._idle.pop(entry)
+            if self.__is_healthy(addon):
+                self.hits += 1
+                return addon
+            self.evict(addon)
+        self.misses += 1
+        return None
+
+    def release(self, addon_type, kwargs, addon):
+        """
+        Give back an addon, reset so that another test can use it. Addons
+        failing the reset are closed.
+
+        Args:
+            addon_type (class): addon class.
+            kwargs (dict): addon setup kwargs.
+            addon (object): the addon.
+
+        Returns:
+            bool: True if the addon has been pooled, False if closed.
+        """
+        try:
+            reset = addon.reset()
+        except Exception as e:
+            self.__log("Unable to reset addon %s: %s" % (type(addon).__name__, e))
+            reset = False
+        if not reset:
+            self.evict(addon)
+            return False
+        key = self.make_key(addon_type, kwargs)
+        self._idle[(key, id(addon))] = (addon, time.monotonic())
+        while len(self._idle) > self.max_idle:
+            self.evict(self._idle.popitem(last=False)[1][0])
+        return True
+
+    def expire(self):
+        """
+        Close the addons idle for more than idle_timeout.
+        """
+        if self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        for entry, (addon, released) in list(self._idle.items()):
+            if released < deadline:
+                del self._idle[entry]
+                self.evict(addon)
+
+    def evict(self, addon):
+        """
+        Close an addon no longer pooled.
+
+        Args:
+            addon (object): the addon.
+
+        Returns:
+            bool: True if addon has been closed correctly.
+        """
+        try:
+            return bool(addon.close())
+        except Exception as e:
+            self.__log("Unable to close addon %s: %s" % (type(addon).__name__, e))
+            return False
+
+    def close(self):
+        """
+        Close all idle addons.
+        """
+        while self._idle:
+            self.evict(self._idle.popitem(last=False)[1][0])
+
+    def __is_healthy(self, addon):
+        try:
+            return addon.is_healthy()
+        except Exception as e:
+            self.__log("Health check of addon %s failed: %s" % (type(addon).__name__, e))
+            return False
+
+    def __log(self, message):
+        if self.logger:
+            self.logger.warning(message)
@@ -18,11 +18,19 @@ class KaliAddOn(object):
     Attributes:
         logger (object): logger object
         checker (object): :class:`~src.addons.checkers.Checker`
+        metrics (object): :class:`~src.metrics.Metrics` object set by Kali,
+            None if metrics are disabled
+        poll_count (int): checks done by the last get_result
+        addon_key (str): key of the addon in Kali, set by Kali
     """
 
     def __init__(self, **kwargs):
         self.logger = None
         self.checker = Checker()
+        self.metrics = None
+        self.poll_count = 0
+        self.addon_key = None
+        self._timed_action = False
         self.wait_for_check = None
         self.check_timeout = None
         self.test_case = None
@@ -49,6 +57,30 @@ class KaliAddOn(object):
         """
         raise NotImplementedError("setup method not overridden")
 
+    # Pool hooks
+    def reset(self):
+        """
+        Bring the addon back to a clean state when a test releases it, so
+        that another test can reuse it (see :class:`~src.addon_pool.AddonPool`)
+        instead of closing it.
+
+        Returns:
+            bool: True if the addon can be reused, False to close it.
+        """
+        self.checker.set_expected(None)
+        self.checker.set_returned(None)
+        self.checker.current_test = None
+        return True
+
+    def is_healthy(self):
+        """
+        Check if a pooled addon is still usable before handing it out again.
+
+        Returns:
+            bool: True if the addon is usable, False to close it.
+        """
+        return True
+
     # Checker utils
     def set_check(self, value):
         """
@@ -98,17 +130,30 @@ class KaliAddOn(object):
             raise KaliExceptionValueError(
                 "Unexpected test value passed: %s" % test)
         expeted = self.checker.expected
-        returned = self.checker.returned
         answer = False
+        interval = self.checker.poll_interval_min
+        self.poll_count = 0
         while time.time() < timeout_start + timeout:
+            # Notifications arriving during the check wake the wait below
+            since = self.checker.updates
+            returned = self.checker.returned
             answer = check_method(**kwargs)
+            self.poll_count += 1
             if answer:
                 self.passed("Check passed!")
                 if self.checker.current_test:
                     self.checker.current_test.add_passed()
                 return answer
-            self.checker.set_returned(returned)
+            # The failed check resets the values: restoring them is not a
+            # new returned value, nothing is notified
+            if self.checker.returned is None:
+                self.checker.returned = returned
             self.set_check(expeted)
+            # Sleeping until a new value is notified (or polling with backoff)
+            remaining = timeout_start + timeout - time.time()
+            if remaining > 0:
+                interval = self.checker.backoff_wait(since, interval,
+                                                     remaining)
         self.failed("Check failed!")
         if self.checker.current_test:
             self.checker.current_test.add_failed()
@@ -204,13 +249,17 @@ class KaliOtsAddOn(KaliAddOn):
         self.ots_client = ots_client
         self.ots_label = ots_label
 
+    def is_healthy(self):
+        return self.ots_client is not None and \
+            self.ots_client.is_connected(self.ots_label)
+
     # OTS utils
     def send_command_to_ots(self, interface, method, arg_dict):
         if self.ots_client is None:
             self.error(
                 'No OTSClient found: do Kali method start_connection_ots')
             return False
-        elif not self.ots_client.is_connected(self.ots_label):
+        elif not self.ots_client.try_reconnect(self.ots_label):
             self.error('No connection %s found or is not connected' %
                        self.ots_label)
             return False
@@ -223,3 +272,29 @@ class KaliOtsAddOn(KaliAddOn):
             self.checker.set_returned(resp)
             return resp
         return resp
+
+    def send_commands_to_ots(self, commands):
+        """
+        Send several commands to OTS in a single pipelined batch.
+
+        Args:
+            commands (list): list of (interface, method, arg_dict) tuples.
+
+        Returns:
+            list: OTS responses in the same order of commands, False if the
+            batch could not be sent.
+        """
+        if self.ots_client is None:
+            self.error(
+                'No OTSClient found: do Kali method start_connection_ots')
+            return False
+        elif not self.ots_client.try_reconnect(self.ots_label):
+            self.error('No connection %s found or is not connected' %
+                       self.ots_label)
+            return False
+
+        resp = self.ots_client.send_many(key_label=self.ots_label,
+                                         commands=commands)
+        if resp:
+            self.checker.set_returned(resp)
+        return resp
@@ -6,9 +6,123 @@ KALI CHECK RESULT
 =================
 
 """
+import re
+import threading
 import time
 from ..exceptions import *
 
+# Backoff bounds (seconds) used to re-evaluate values changed in place,
+# without a notification (eg. a list filled by another thread)
+POLL_INTERVAL_MIN = 0.005
+POLL_INTERVAL_MAX = 0.25
+
+_PATTERN_TYPE = type(re.compile(''))
+
+
+class LineMatcher(object):
+    """Incremental matcher of one or more expectations over a growing list of
+    lines.
+
+    Each call to :meth:`scan` only examines the lines appended since the
+    previous call. Expectations can be substrings or compiled regular
+    expressions; they are combined in a single regular expression used to
+    skip the lines not matching any of them.
+
+    Attributes:
+        expectations (list): expectations as compiled regular expressions.
+        pending (set): indexes of expectations not found yet.
+        offset (int): index of the first line not scanned yet.
+    """
+
+    def __init__(self, expected, match_all=True):
+        if isinstance(expected, (list, tuple, set, frozenset)):
+            expected = list(expected)
+        else:
+            expected = [expected]
+        if not expected:
+            raise KaliExceptionValueError("No expectation passed")
+        self.expectations = []
+        # Plain substrings are matched with `in`, faster than a regex search
+        self._literals = []
+        for item in expected:
+            if isinstance(item, str):
+                self._literals.append(item)
+                item = re.compile(re.escape(item))
+            elif isinstance(item, _PATTERN_TYPE):
+                self._literals.append(None)
+            else:
+                raise KaliExceptionTypeError(
+                    "Expectation must be a str or a compiled regex, not %s"
+                    % type(item).__name__)
+            self.expectations.append(item)
+        self.match_all = match_all
+        self.pending = set(range(len(self.expectations)))
+        self.offset = 0
+        self._cursor = None
+        self._combined = None
+        if len(self.expectations) > 1 and \
+                len({p.flags for p in self.expectations}) == 1:
+            self._combined = re.compile(
+                '|'.join('(?:%s)' % p.pattern for p in self.expectations),
+                self.expectations[0].flags)
+
+    def done(self):
+        """
+        Returns:
+            bool: True if all (or any, if match_all is False) expectations
+            have been found.
+        """
+        if self.match_all:
+            return not self.pending
+        return len(self.pending) < len(self.expectations)
+
+    def scan(self, lines):
+        """
+        Scan the lines appended since the last call.
+
+        Args:
+            lines (list): lines to be scanned, may grow between calls. If it
+                shrinks (eg. it has been cleared) scan restarts from the top.
+                Objects providing a `cursor` method (eg. Loglib LogBuffer)
+                are read through a cursor.
+
+        Returns:
+            bool: same as :meth:`done`.
+        """
+        if hasattr(lines, 'cursor'):
+            return self.__scan_buffer(lines)
+        if self.offset > len(lines):
+            self.offset = 0
+        end = len(lines)
+        for index in range(self.offset, end):
+            if self.__match(lines[index]):
+                self.offset = index + 1
+                return True
+        self.offset = end
+        return self.done()
+
+    def __scan_buffer(self, buffer):
+        # Log buffers evict old lines: indexes move, a cursor does not
+        if self._cursor is None or self._cursor.buffer is not buffer:
+            self._cursor = buffer.cursor()
+        for line in self._cursor.read():
+            if self.__match(line):
+                return True
+        return self.done()
+
+    def __match(self, line):
+        if self._combined is not None and not self._combined.search(line):
+            return False
+        for pending in list(self.pending):
+            literal = self._literals[pending]
+            if literal is not None:
+                found = literal in line
+            else:
+                found = self.expectations[pending].search(line)
+            if found:
+                self.pending.discard(pending)
+        return self.done()
+
 
 class Checker:
     """Checker class definition.
@@ -24,6 +138,10 @@ class Checker:
         self.logger = None
         self.timeout = None
         self.current_test = None
+        self.poll_interval_min = POLL_INTERVAL_MIN
+        self.poll_interval_max = POLL_INTERVAL_MAX
+        self._condition = threading.Condition()
+        self._updates = 0
 
     def set_timeout(self, timeout):
         """
@@ -34,6 +152,70 @@ class Checker:
         """
         self.timeout = timeout
 
+    def set_polling(self, interval_min=POLL_INTERVAL_MIN,
+                    interval_max=POLL_INTERVAL_MAX):
+        """
+        Setter the backoff used to re-evaluate returned values between two
+        notifications.
+
+        Args:
+            interval_min (float): first wait, in seconds
+            interval_max (float): longest wait, in seconds. None disables
+                polling: the check is re-evaluated only when notified.
+        """
+        self.poll_interval_min = interval_min
+        self.poll_interval_max = interval_max
+
+    @property
+    def updates(self):
+        """Counter of the notifications received so far."""
+        return self._updates
+
+    def notify(self):
+        """
+        Wake up the checks waiting for a new returned value. Sources filling
+        the returned object in place (eg. Loglib handlers) should call it.
+        """
+        with self._condition:
+            self._updates += 1
+            self._condition.notify_all()
+
+    def wait_for_update(self, since, timeout):
+        """
+        Wait until a notification newer than `since` arrives or timeout
+        expires.
+
+        Args:
+            since (int): value of :attr:`updates` already handled
+            timeout (float): seconds
+
+        Returns:
+            bool: True if notified, False on timeout.
+        """
+        with self._condition:
+            if self._updates == since and timeout > 0:
+                self._condition.wait(timeout)
+            return self._updates != since
+
+    def backoff_wait(self, since, interval, remaining):
+        """
+        Wait for a notification newer than `since`, polling with backoff.
+
+        Args:
+            since (int): value of :attr:`updates` already handled
+            interval (float): current polling interval, in seconds
+            remaining (float): time left before the check timeout
+
+        Returns:
+            float: polling interval to be used for the next wait.
+        """
+        if self.poll_interval_max is None:
+            self.wait_for_update(since, remaining)
+            return interval
+        if self.wait_for_update(since, min(interval, remaining)):
+            return self.poll_interval_min
+        return min(interval * 2, self.poll_interval_max)
+
     def check(self, callback, reset_callback=None):
         """
         Abstract method.
@@ -60,13 +242,19 @@ class Checker:
             raise KaliExceptionValueError(
                 "No value set for returned/expected value/s")
         answer = None
-        while time.time() < timeout_start + self.timeout:
+        interval = self.poll_interval_min
+        while True:
+            since = self._updates
             answer = callback()
             if not isinstance(answer, bool):
                 raise KaliExceptionValueError(
                     "Callback function doesn't return boolean value")
             if answer:
                 return answer
+            remaining = timeout_start + self.timeout - time.time()
+            if remaining <= 0:
+                break
+            interval = self.backoff_wait(since, interval, remaining)
         if reset_callback is None:
             self.reset()
         else:
@@ -90,6 +278,7 @@ class Checker:
             returned_values (object): returned values.
         """
         self.returned = returned_values
+        self.notify()
 
     def reset(self):
         """
@@ -207,16 +396,44 @@ class Checker:
         return not self.__equal()
 
     def find(self):
+        """
+        Check if expected is found in returned. Expected can be a substring,
+        a compiled regular expression or a list of them: in this case all of
+        them must be found. On lists of lines (eg. Loglib cache) only the new
+        lines are examined at each poll.
+
+        Returns:
+            bool: True if expected has been found, false otherwise.
+        """
+        return self.__find(match_all=True)
+
+    def find_any(self):
+        """
+        Same as :meth:`find`, passing if at least one of the expectations is
+        found.
+
+        Returns:
+            bool: True if an expectation has been found, false otherwise.
+        """
+        return self.__find(match_all=False)
+
+    def __find(self, match_all):
         if isinstance(self.returned, dict):
             values_list = [value for value in self.returned.values()]
             for value in values_list:
                 if self.expected in value:
                     return True
             return False
-        if isinstance(self.returned, list):
-            return self.check(self.__find_in_list, self.returned.clear)
+        if isinstance(self.returned, list) or \
+                hasattr(self.returned, 'cursor'):
+            matcher = LineMatcher(self.expected, match_all)
+            return self.check(lambda: self.__find_in_list(matcher),
+                              self.returned.clear)
         elif isinstance(self.returned, str):
-            return self.check(self.__find_in_string)
+            if isinstance(self.expected, str):
+                return self.check(self.__find_in_string)
+            matcher = LineMatcher(self.expected, match_all)
+            return self.check(lambda: matcher.scan([self.returned]))
         else:
             raise KaliExceptionTypeError(
                 "Find not support for this kinde of object")
@@ -224,13 +441,11 @@ class Checker:
     def __find_in_string(self):
         return self.expected in self.returned
 
-    def __find_in_list(self, ):
-        if not isinstance(self.returned, list):
+    def __find_in_list(self, matcher):
+        if not isinstance(self.returned, list) and \
+                not hasattr(self.returned, 'cursor'):
             raise KaliExceptionTypeError("")
-        for line in self.returned:
-            if line.find(self.expected) >= 0:
-                return True
-        return False
+        return matcher.scan(self.returned)
 
     def callback(self, callback):
         return callback(self.expected, self.returned)
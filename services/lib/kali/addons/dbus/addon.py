@@ -87,6 +87,28 @@ class KaliDbusOmniaAddon(KaliOtsAddOn):
         }
         return self.send_command_to_ots("dbus", "do_method", arg_dict=args)
 
+    def do_methods(self, calls):
+        """
+            Send several do_method calls to ots in a single pipelined batch
+            and fill Kali checker with the list of server responses
+
+            Args:
+                calls (list): list of (interface, method, passed_args) tuples,
+                see do_method for details
+
+            Returns:
+                list: server responses, in the same order of calls
+        """
+        commands = []
+        for interface, method, passed_args in calls:
+            args = {
+                "interface": interface,
+                "method": method,
+                'arg_dict': self._get_args(passed_args)
+            }
+            commands.append(("dbus", "do_method", args))
+        return self.send_commands_to_ots(commands)
+
     def _get_args(self, passed_args):
         args_dict = {}
         i = 0
@@ -1,29 +1,360 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import mmap
+import os
+import selectors
 import socket
 import threading
-from time import sleep
-from binascii import hexlify
+from array import array
+from bisect import bisect_left
+from itertools import islice
 from serial import Serial, SerialException
 
 EOL = "\n"
 EOLb = b"\n"
+# Minimum amount of evicted bytes before LogBuffer compacts its storage
+COMPACT_THRESHOLD = 1 << 16
+# Max number of bytes read from a stream at once
+MAX_CHUNK_SIZE = 65536
+# Read timeout of serial ports not served by the reactor
+SERIAL_TIMEOUT = 0.1
+
+
+class LogCursor(object):
+    """
+    Read position inside a LogBuffer. Each read returns the lines appended
+    since the previous one; lines evicted before being read are counted in
+    `lost`.
+    """
+    def __init__(self, buffer, position):
+        self.buffer = buffer
+        self.position = position
+        self.lost = 0
+
+    def read(self, max_lines=None):
+        """Return the new lines as a list of str"""
+        return self.buffer.read(self, max_lines)
+
+    def read_bytes(self, max_lines=None):
+        """Return the new lines as a single EOL separated bytes block"""
+        return self.buffer.read_bytes(self, max_lines)
+
+
+class LogBuffer(object):
+    """
+    Compact store of log lines: lines are stored one after the other in a
+    single bytearray, with their end offsets in an array. Line and byte
+    budgets evict the oldest lines, which can be spilled to a file on disk.
+
+    It behaves like the list of str previously used as Loglib cache
+    (append, len, index, iteration, clear).
+    """
+    def __init__(self, max_lines=None, max_bytes=None, spill_path=None):
+        self._data = bytearray()
+        # End offsets (EOL included) of the lines stored in _data
+        self._ends = array('Q')
+        # Index in _ends and offset in _data of the oldest line retained
+        self._first = 0
+        self._head = 0
+        # Number of lines dropped from the head since creation
+        self.evicted = 0
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self._spill = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ends) - self._first
+
+    def __iter__(self):
+        return iter(self.cursor().read())
+
+    def __getitem__(self, index):
+        with self._lock:
+            if isinstance(index, slice):
+                return [self._line(self._first + i)
+                        for i in range(*index.indices(len(self)))]
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("LogBuffer index out of range")
+            return self._line(self._first + index)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LogBuffer)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def _start(self, index):
+        return self._head if index == self._first else self._ends[index - 1]
+
+    def _line(self, index):
+        return self._data[self._start(index):self._ends[index] - 1].decode(
+            'utf-8', 'replace')
+
+    def get_bytes(self):
+        """Size in bytes of the lines retained (EOL included)"""
+        return (self._ends[-1] if len(self) else self._head) - self._head
+
+    def set_budget(self, max_lines=None, max_bytes=None, spill_path=None):
+        """
+        Set line and byte budgets, None means unbounded. Lines exceeding the
+        budgets are evicted from the oldest and written to spill_path, if set.
+        """
+        with self._lock:
+            self.max_lines = max_lines
+            self.max_bytes = max_bytes
+            if spill_path != self.spill_path:
+                self._close_spill()
+                self.spill_path = spill_path
+            self._enforce()
+
+    def append(self, line):
+        self.append_raw(line.encode('utf-8', 'replace'))
+
+    def extend(self, lines):
+        self.extend_raw(line.encode('utf-8', 'replace') for line in lines)
+
+    def append_raw(self, line):
+        """Append a single line (bytes, without EOL)"""
+        with self._lock:
+            self._data += line
+            self._data += EOLb
+            self._ends.append(len(self._data))
+            self._enforce()
+
+    def extend_raw(self, lines):
+        """Append several lines (bytes, without EOL)"""
+        with self._lock:
+            for line in lines:
+                self._data += line
+                self._data += EOLb
+                self._ends.append(len(self._data))
+            self._enforce()
 
+    def clear(self):
+        """Discard all lines (they are not spilled)"""
+        with self._lock:
+            self.evicted += len(self)
+            self._data = bytearray()
+            self._ends = array('Q')
+            self._first = 0
+            self._head = 0
+
+    def cursor(self, from_start=True):
+        """
+        Return a LogCursor placed on the oldest line retained or, if
+        from_start is False, after the last line appended.
+        """
+        with self._lock:
+            position = self.evicted
+            if not from_start:
+                position += len(self)
+            return LogCursor(self, position)
+
+    def _cursor_range(self, cursor, max_lines):
+        if cursor.position < self.evicted:
+            cursor.lost += self.evicted - cursor.position
+            cursor.position = self.evicted
+        start = self._first + cursor.position - self.evicted
+        end = len(self._ends)
+        if max_lines is not None:
+            end = min(end, start + max_lines)
+        cursor.position += max(end - start, 0)
+        return start, end
+
+    def read(self, cursor, max_lines=None):
+        with self._lock:
+            start, end = self._cursor_range(cursor, max_lines)
+            return [self._line(i) for i in range(start, end)]
+
+    def read_bytes(self, cursor, max_lines=None):
+        with self._lock:
+            start, end = self._cursor_range(cursor, max_lines)
+            if start >= end:
+                return b""
+            return bytes(self._data[self._start(start):self._ends[end - 1] - 1])
+
+    def dump(self):
+        """Return all lines retained as a single EOL separated str"""
+        with self._lock:
+            if not len(self):
+                return ""
+            return self._data[self._head:self._ends[-1] - 1].decode(
+                'utf-8', 'replace')
+
+    def write_to(self, fp):
+        """Write all lines retained to a binary file object, without copies"""
+        with self._lock:
+            with memoryview(self._data) as view:
+                with view[self._head:self._head + self.get_bytes()] as chunk:
+                    return fp.write(chunk)
+
+    def spilled(self):
+        """Return a read only mmap of the spill file (None if empty)"""
+        with self._lock:
+            if self._spill is not None:
+                self._spill.flush()
+            if self.spill_path is None or not os.path.isfile(self.spill_path)\
+                    or os.path.getsize(self.spill_path) == 0:
+                return None
+            with open(self.spill_path, 'rb') as fp:
+                return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
 
-class HandlerAbstract(threading.Thread):
-    def __init__(self, cache):
-        threading.Thread.__init__(self)
+    def close(self):
+        with self._lock:
+            self._close_spill()
+
+    def _close_spill(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def _enforce(self):
+        drop = 0
+        if self.max_lines is not None and len(self) > self.max_lines:
+            drop = len(self) - self.max_lines
+        if self.max_bytes is not None and self.get_bytes() > self.max_bytes:
+            # Oldest line to keep is the first one starting at new_head or
+            # after it
+            new_head = self._ends[-1] - self.max_bytes
+            drop = max(drop, bisect_left(self._ends, new_head, self._first)
+                       + 1 - self._first)
+        if drop > 0:
+            self._evict(min(drop, len(self)))
+
+    def _evict(self, count):
+        first = self._first + count
+        head = self._ends[first - 1]
+        if self.spill_path is not None:
+            if self._spill is None:
+                self._spill = open(self.spill_path, 'ab')
+            with memoryview(self._data) as view:
+                with view[self._head:head] as chunk:
+                    self._spill.write(chunk)
+        self._first = first
+        self._head = head
+        self.evicted += count
+        if head >= COMPACT_THRESHOLD and head * 2 >= len(self._data):
+            del self._data[:head]
+            self._ends = array('Q', (end - head for end in
+                                     islice(self._ends, first, None)))
+            self._first = 0
+            self._head = 0
+
+
+class LogReactor(threading.Thread):
+    """
+    Single thread serving all stream handlers (TCP, serial): it waits on
+    their file descriptors through selectors and reads whatever is ready.
+    Registrations are done by the reactor thread itself, other threads queue
+    them and wake it up.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self, name="LogReactor", daemon=True)
+        self.selector = selectors.DefaultSelector()
+        self.handlers = set()
+        self._calls = []
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+    def register(self, handler):
+        self.call(lambda: self._register(handler))
+
+    def unregister(self, handler):
+        self.call(lambda: self._unregister(handler))
+
+    def call(self, function):
+        """Run function in the reactor thread and wait for its result"""
+        if threading.current_thread() is self or not self.is_alive():
+            return function()
+        done = threading.Event()
+        result = []
+        with self._lock:
+            self._calls.append((function, result, done))
+        try:
+            self._wakeup_w.send(b"\0")
+        except BlockingIOError:
+            # Wakeup already pending
+            pass
+        done.wait()
+        if isinstance(result[0], BaseException):
+            raise result[0]
+        return result[0]
+
+    def _register(self, handler):
+        if handler not in self.handlers:
+            self.selector.register(handler, selectors.EVENT_READ, handler)
+            self.handlers.add(handler)
+
+    def _unregister(self, handler):
+        if handler in self.handlers:
+            self.handlers.discard(handler)
+            self.selector.unregister(handler)
+
+    def _run_calls(self):
+        with self._lock:
+            calls, self._calls = self._calls, []
+        for function, result, done in calls:
+            try:
+                result.append(function())
+            except Exception as e:
+                result.append(e)
+            done.set()
+
+    def run(self):
+        while True:
+            for key, _ in self.selector.select():
+                handler = key.data
+                if handler is None:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif handler in self.handlers and not handler.on_readable():
+                    self._unregister(handler)
+                    handler.close()
+            self._run_calls()
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+
+def get_reactor():
+    """Return the LogReactor shared by all handlers, starting it if needed"""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None or not _reactor.is_alive():
+            _reactor = LogReactor()
+            _reactor.start()
+        return _reactor
+
+
+class HandlerAbstract(object):
+    def __init__(self, cache, listeners=None):
         self.size = 0
         self.limit = None
         self.cache = cache
+        self.listeners = listeners if listeners is not None else []
         self.status = True
-        self.not_recorded = None
+        # Bytes received after the last EOL
+        self.not_recorded = b""
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
 
     def run(self):
         while self.status:
             self.get_loglines()
-            sleep(.001)
 
     def set_limit(self, limit):
         self.limit = limit
@@ -31,20 +362,35 @@ class HandlerAbstract(threading.Thread):
     def get_size(self):
         return self.size
 
-    def append_line(self, lines):
-        if self.limit is not None and self.size + len(lines.replace(EOL, "")) > self.limit:
+    def append_data(self, data):
+        """
+        Record the complete lines of data (bytes), keeping the last partial
+        line until its EOL is received. Lines are stored undecoded: the
+        cache decodes them when read, so multibyte characters split across
+        chunks are preserved.
+        """
+        data = self.not_recorded + data
+        end = data.rfind(EOLb)
+        if end < 0:
+            self.not_recorded = data
+            return True
+        lines = data[:end].split(EOLb)
+        size = end + 1 - len(lines)
+        if self.limit is not None and self.size + size > self.limit:
             return False
-        lines_list = lines.split(EOL)
-        if self.not_recorded is not None:
-            lines_list[0] = self.not_recorded + lines_list[0]
-            self.not_recorded = None
-        for singleline in lines_list[:-1]:
-            self.cache.append(singleline)
-            self.size += len(singleline)
-        if len(lines_list[-1]) > 0:
-            self.not_recorded = lines_list[-1]
+        self.not_recorded = data[end + 1:]
+        self.cache.extend_raw(lines)
+        self.size += size
+        self.notify()
         return True
 
+    def append_line(self, lines):
+        return self.append_data(lines.encode('utf-8'))
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+
     def get_loglines(self):
         raise NotImplementedError("get_loglines not implemented")
 
@@ -54,13 +400,75 @@ class HandlerAbstract(threading.Thread):
     def get_log_size(self):
         return self.size
 
+    def is_alive(self):
+        return self.status
+
     def stop(self):
         self.status = False
 
 
-class HandlerTcp(HandlerAbstract):
-    def __init__(self, ip, port, cache):
-        super(HandlerTcp, self).__init__(cache)
+class HandlerStream(HandlerAbstract):
+    """
+    Handler reading a file descriptor through the shared LogReactor. Falls
+    back to a dedicated thread if the stream has no file descriptor that
+    selectors can wait on (eg. serial ports on Windows).
+    """
+    def __init__(self, cache, listeners=None, reactor=None):
+        super(HandlerStream, self).__init__(cache, listeners)
+        self.reactor = reactor
+
+    def start(self):
+        try:
+            self.fileno()
+        except (AttributeError, OSError, ValueError):
+            self.set_blocking()
+            return super(HandlerStream, self).start()
+        if self.reactor is None:
+            self.reactor = get_reactor()
+        self.reactor.register(self)
+
+    def fileno(self):
+        raise NotImplementedError("fileno not implemented")
+
+    def set_blocking(self):
+        """Make read_chunk wait for data, used without reactor"""
+        pass
+
+    def read_chunk(self):
+        """
+        Returns:
+            bytes: data available, may be empty.
+        Raises:
+            OSError: if the stream is closed.
+        """
+        raise NotImplementedError("read_chunk not implemented")
+
+    def on_readable(self):
+        try:
+            chunk = self.read_chunk()
+        except (OSError, SerialException):
+            return False
+        if chunk:
+            self.append_data(chunk)
+        return True
+
+    def get_loglines(self):
+        if not self.on_readable():
+            self.stop()
+            self.close()
+
+    def unregister(self):
+        if self.reactor is not None:
+            self.reactor.unregister(self)
+
+    def stop(self):
+        super(HandlerStream, self).stop()
+        self.unregister()
+
+
+class HandlerTcp(HandlerStream):
+    def __init__(self, ip, port, cache, listeners=None, reactor=None):
+        super(HandlerTcp, self).__init__(cache, listeners, reactor)
         self.s = socket.socket()
         self.port = port
         self.ipadd = ip
@@ -73,46 +481,54 @@ class HandlerTcp(HandlerAbstract):
             connection = True
         except ConnectionRefusedError:
             connection = False
+        self.s.setblocking(False)
         return connection
 
     def tcp_disconnect(self):
         if self.s is not None:
+            self.unregister()
             self.s.close()
             self.s = None
 
     def close(self):
         self.tcp_disconnect()
 
-    def get_loglines(self):
-        try:
-            buffer = 1
-            data = self.s.recv(buffer)
-        except (BrokenPipeError, OSError, AttributeError):
-            self.tcp_disconnect()
-            return False
-        try:
-            data = data.decode('utf-8')
-        except UnicodeDecodeError:
-            data = "Unexpected char received: " + hexlify(data).decode('utf-8').upper()
-        self.append_line(data)
-        return True
+    def is_alive(self):
+        return self.status and self.s is not None
 
+    def fileno(self):
+        return self.s.fileno()
 
-class HandlerSerial(HandlerAbstract):
-    def __init__(self, cache, com_port, baud_rate):
-        super(HandlerSerial, self).__init__(cache)
+    def set_blocking(self):
+        self.s.setblocking(True)
+
+    def read_chunk(self):
+        try:
+            data = self.s.recv(MAX_CHUNK_SIZE)
+        except BlockingIOError:
+            return b""
+        except AttributeError:
+            raise OSError("Socket closed")
+        if not data:
+            raise OSError("Connection closed by peer")
+        return data
+
+
+class HandlerSerial(HandlerStream):
+    def __init__(self, cache, com_port, baud_rate, listeners=None,
+                 reactor=None):
+        super(HandlerSerial, self).__init__(cache, listeners, reactor)
         self.serial = Serial()
         self.SerialHandler = True
         self.serial.port = com_port
         self.serial.baudrate = baud_rate
+        # Reads return what is available, the reactor waits for data
+        self.serial.timeout = 0
         self.string = None
         self.line = None
         if not self.serial_interface():
             self.close_serial()
 
-    def get_loglines(self):
-        self.get_serial()
-
     def serial_interface(self):
         try:
             self.serial.open()
@@ -120,13 +536,20 @@ class HandlerSerial(HandlerAbstract):
             return False
         return self.serial.is_open
 
+    def fileno(self):
+        return self.serial.fileno()
+
+    def is_alive(self):
+        return self.status and self.serial.is_open
+
+    def set_blocking(self):
+        self.serial.timeout = SERIAL_TIMEOUT
+
+    def read_chunk(self):
+        return self.serial.read(self.serial.in_waiting or 1)
+
     def get_serial(self):
-        while True:
-            try:
-                line = self.serial.readline().decode("utf-8")
-                self.append_line(line)
-            except UnicodeDecodeError:
-                pass
+        return self.read_chunk()
 
     def send(self, string):
         if isinstance(string, str):
@@ -144,6 +567,7 @@ class HandlerSerial(HandlerAbstract):
         return True
 
     def close(self):
+        self.unregister()
         self.close_serial()
 
     def close_serial(self):
@@ -152,47 +576,54 @@ class HandlerSerial(HandlerAbstract):
 
 
 class HandlerInput(HandlerAbstract):
-    def __init__(self, cache):
-        super(HandlerInput, self).__init__(cache)
+    def __init__(self, cache, listeners=None):
+        super(HandlerInput, self).__init__(cache, listeners)
 
     def close(self):
         pass
 
     def get_loglines(self):
         self.cache.append(input('>>'))
+        self.notify()
 
 
 class LogLib(object):
-    def __init__(self):
+    def __init__(self, max_lines=None, max_bytes=None, spill_path=None):
         self.length = []
-        self.cache = []
-        self.cache_backup = []
+        self.cache = LogBuffer(max_lines, max_bytes, spill_path)
+        self.cache_backup = LogBuffer()
         self.handlers = []
+        self.listeners = []
         self.res = 0
         self.count = 0
 
     def __del__(self):
         self.close()
 
-    def set_limit(self, limit):
-        handler_limit = limit // len(self.handlers)
-        for handler in self.handlers:
-            handler.set_limit(handler_limit)
-        if len(self.handlers) > 0:
-            self.handlers[0].set_limit(self.handlers[0] + limit % len(self.handlers))
+    def set_limit(self, limit, max_lines=None, spill_path=None):
+        """Set the byte (and line) budget of the cache shared by handlers"""
+        self.cache.set_budget(max_lines=max_lines, max_bytes=limit,
+                              spill_path=spill_path)
+
+    def add_listener(self, listener):
+        """Register a callable invoked each time new lines reach the cache"""
+        if listener not in self.listeners:
+            self.listeners.append(listener)
 
     def add_tcp_handler(self, ip, port):
-        new_handler = HandlerTcp(ip, port, cache=self.cache)
+        new_handler = HandlerTcp(ip, port, cache=self.cache,
+                                 listeners=self.listeners)
         new_handler.start()
         self.handlers.append(new_handler)
 
     def add_serial_handler(self, com_port, baud_rate):
-        new_handler = HandlerSerial(self.cache, com_port, baud_rate)
+        new_handler = HandlerSerial(self.cache, com_port, baud_rate,
+                                    listeners=self.listeners)
         new_handler.start()
         self.handlers.append(new_handler)
 
     def add_input_handler(self):
-        new_handler = HandlerInput(self.cache)
+        new_handler = HandlerInput(self.cache, listeners=self.listeners)
         new_handler.start()
         self.handlers.append(new_handler)
 
@@ -200,11 +631,16 @@ class LogLib(object):
         self.cache.clear()
 
     def backup(self, limit):
-        self.cache_backup.extend(self.cache)
-        if len(self.cache_backup) >= limit:
-            del self.cache_backup[0:len(self.cache)]
+        self.cache_backup.set_budget(max_lines=limit)
+        self.cache_backup.extend_raw(
+            self.cache.cursor().read_bytes().split(EOLb) if len(self.cache)
+            else [])
         return len(self.cache_backup)
 
+    def is_alive(self):
+        """True if there are handlers and all of them are still receiving"""
+        return bool(self.handlers) and all(handler.is_alive() for handler in self.handlers)
+
     def get_size(self):
         size = 0
         for handler in self.handlers:
@@ -212,12 +648,13 @@ class LogLib(object):
         return size
 
     def dump(self):
-        return EOL.join(x for x in self.cache)
+        return self.cache.dump()
 
     def close(self):
         for handler in self.handlers:
             handler.close()
             handler.stop()
+        self.cache.close()
 
     def write(self, string):
         for handler in self.handlers:
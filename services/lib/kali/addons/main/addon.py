@@ -60,7 +60,7 @@ class KaliMainAddon(KaliOtsAddOn):
             self.error(
                 'No OTSClient found: do Kali method start_connection_ots')
             return False
-        elif not self.ots_client.is_connected(self.ots_label):
+        elif not self.ots_client.try_reconnect(self.ots_label):
             self.error('No connection %s found or is not connected' %
                        self.ots_label)
             return False
@@ -76,7 +76,7 @@ class KaliMainAddon(KaliOtsAddOn):
             self.error(
                 'No OTSClient found: do Kali method start_connection_ots')
             return False
-        elif not self.ots_client.is_connected(self.ots_label):
+        elif not self.ots_client.try_reconnect(self.ots_label):
             self.error('No connection %s found or is not connected' %
                        self.ots_label)
             return False
@@ -57,6 +57,25 @@ class KaliLogOmniaAddon(KaliOtsAddOn):
         self.wrapper.close()
         return True
 
+    def reset(self):
+        """
+        Clear the log cache, keeping the connection to the OTS listener
+
+        Returns:
+            bool: True as default
+        """
+        KaliOtsAddOn.reset(self)
+        self.wrapper.clear()
+        self.analyze()
+        return True
+
+    def is_healthy(self):
+        """
+        Returns:
+            bool: True if the log stream is still connected
+        """
+        return self.connected and self.wrapper.is_alive()
+
     def connect(self, ip, port):
         """
         Connect method is used to connect the OTS listener daemon
@@ -105,6 +124,7 @@ class KaliLogOmniaAddon(KaliOtsAddOn):
         Returns:
             bool: True as default
         """
+        self.wrapper.add_listener(self.checker.notify)
         self.checker.set_returned(self.wrapper.cache)
         return True
 
@@ -121,7 +141,7 @@ class KaliLogOmniaAddon(KaliOtsAddOn):
             self.error(
                 'No OTSClient found: do Kali method start_connection_ots')
             return False
-        elif not self.ots_client.is_connected(self.ots_label):
+        elif not self.ots_client.try_reconnect(self.ots_label):
             self.error('Connection %s nor found' % self.ots_label)
             return False
 
@@ -103,6 +103,7 @@ class KaliSerialOmniaAddon(KaliAddOn):
         Returns:
             bool: True as default
         """
+        self.wrapper.add_listener(self.checker.notify)
         self.checker.set_returned(self.wrapper.cache)
 
     def write(self, **kwargs):
@@ -25,13 +25,32 @@ from selenium.common.exceptions import ElementNotInteractableException
 from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import WebDriverException
 from selenium.common.exceptions import StaleElementReferenceException
+from .sessions import SESSIONS, WebDriverSession
+from .locators import LocatorCache, STATE_JS
 from .pages_data import INPUTS_DICT, BTN, \
-    LED_DICT, LED_GREEN_IMG, LED_BLACK_IMG, LED_RED_IMG, ELEMENT_DICT, \
+    LED_DICT, LED_COLORS, ELEMENT_DICT, \
     CHECKBOX_FIELD
 from ..abstract import KaliAddOn
+from ...metrics import timed_action
+from ...probes import AngularIdleProbe, ConditionProbe, ElementProbe, \
+    FileProbe, StableProbe, SCRIPT_TIMEOUT_MARGIN
 from ...exceptions import *
 
 
+# Max seconds waited for a download to complete
+DOWNLOAD_TIMEOUT = 30
+# Seconds between two uptime checks, and max seconds waited after the
+# expected uptime
+UPTIME_INTERVAL = 5
+UPTIME_MARGIN = 30
+# Max seconds waited for black leds (maybe still loading) to turn on, and
+# seconds between two checks
+LED_LOADING_TIMEOUT = 2
+LED_LOADING_INTERVAL = 0.2
+# Login page element whose text ends with the default password
+LOGIN_PASSWORD_XPATH = '/html/body/div/form/div[3]/span[2]'
+
+
 class KaliWebUiAddon(KaliAddOn):
     """
 
@@ -39,12 +58,28 @@ class KaliWebUiAddon(KaliAddOn):
     """
 
     def __init__(self, **kwargs):
+        self.session = None
+        self._is_logged = False
         KaliAddOn.__init__(self, **kwargs)
 
         self.is_logged = False
         self.driver = None
+        self.locators = LocatorCache()
         self.addon_type = 'webui'
 
+    @property
+    def is_logged(self):
+        """Login state, kept by the browser session when shared"""
+        if self.session is not None:
+            return self.session.is_logged
+        return self._is_logged
+
+    @is_logged.setter
+    def is_logged(self, value):
+        self._is_logged = value
+        if self.session is not None:
+            self.session.is_logged = value
+
     # MANDATORY
     def setup(self):
         """
@@ -59,40 +94,70 @@ class KaliWebUiAddon(KaliAddOn):
             browser(str): choose between Firefox,Chrome. Default is Chrome
             download_folder(str): the path where to download files. Default is
                 'download' in working dir.
+            headless(bool): run the browser headless, without virtual
+                display. Default is False
+            shared_session(bool/str): attach to the browser session shared
+                by the addons with the same name (True for the default one),
+                browser and options, keeping cookies and login state across
+                addons. Default is False (own browser, quit on close)
 
         """
-        self.display = Display(visible=True, size=(1280, 720))
-        self.display.start()
         self.download_folder = self.kwargs.get(
             'download_folder') or "%s/download" % os.getcwd()
         browser = self.kwargs.get('browser') or 'Chrome'
+        self.headless = bool(self.kwargs.get('headless', False))
+        shared = self.kwargs.get('shared_session', False)
         self.driver = None
-        n_try = 0
-        try:
-            self.__configure(browser)
-        except ConnectionResetError as e:
-            print('NOT CONFIG')
-            n_try += 1
-            sleep(0.5)
-            if n_try <= 3:
-                self.close()
-                self.setup()
-            else:
-                raise KaliExceptionWebUiDriver(e)
-        self.driver.set_window_size(1280, 720)
+        started = True
+        if shared:
+            key = (shared if isinstance(shared, str) else 'default', browser,
+                   self.headless, self.download_folder)
+            self.session, started = SESSIONS.attach(
+                key, lambda: self.__start_session(browser))
+        else:
+            self.session = self.__start_session(browser)
+        self.driver = self.session.driver
         base_url = self.ip
         omnia_port = self.kwargs.get('port', '3000')
         self.base_url = "http://%s:%s" % (base_url, omnia_port)
         if not self.check_timeout:
             self.check_timeout = 5
-        self.driver.get(self.base_url)
+        self.__set_script_timeout()
+        if started or not self.driver.current_url.startswith(self.base_url):
+            self.driver.get(self.base_url)
         return True
 
+    def __start_session(self, browser):
+        display = None
+        if not self.headless:
+            display = Display(visible=True, size=(1280, 720))
+            display.start()
+        driver = None
+        for n_try in range(4):
+            try:
+                driver = self.__configure(browser)
+                break
+            except ConnectionResetError as e:
+                self.debug('Browser driver not configured (try %d): %s' %
+                           (n_try + 1, e))
+                error = e
+                sleep(0.5)
+            except Exception:
+                if display is not None:
+                    display.stop()
+                raise
+        if driver is None:
+            if display is not None:
+                display.stop()
+            raise KaliExceptionWebUiDriver(error)
+        driver.set_window_size(1280, 720)
+        return WebDriverSession(driver, display)
+
     def __configure(self, browser):
         if browser == 'Chrome':
-            self.__config_chrome()
+            return self.__config_chrome()
         elif browser == 'Firefox':
-            self.__config_firefox()
+            return self.__config_firefox()
         else:
             raise KaliExceptionWebUiDriver(
                 'No config found for %s browser. Try: Chrome or Firefox'
@@ -102,9 +167,12 @@ class KaliWebUiAddon(KaliAddOn):
         chromeOptions = webdriver.ChromeOptions()
         prefs = {"download.default_directory": self.download_folder}
         chromeOptions.add_experimental_option("prefs", prefs)
+        if self.headless:
+            chromeOptions.add_argument('--headless')
+            chromeOptions.add_argument('--window-size=1280,720')
         # chromedriver = "path/to/chromedriver.exe" #
         # executable_path=chromedriver,
-        self.driver = webdriver.Chrome(chrome_options=chromeOptions)
+        return webdriver.Chrome(chrome_options=chromeOptions)
 
     def __config_firefox(self):
         fp = webdriver.FirefoxProfile()
@@ -113,18 +181,59 @@ class KaliWebUiAddon(KaliAddOn):
         fp.set_preference("browser.download.dir", self.download_folder)
         fp.set_preference("browser.helperApps.neverAsk.saveToDisk",
                           "application/x-msdos-program")
-        self.driver = webdriver.Firefox(firefox_profile=fp)
+        firefoxOptions = webdriver.FirefoxOptions()
+        if self.headless:
+            firefoxOptions.add_argument('-headless')
+        return webdriver.Firefox(firefox_profile=fp, options=firefoxOptions)
+
+    def reset(self):
+        """Log out dropping cookies and go back to the base url, keeping the
+        browser open for the next test. A shared session keeps its cookies
+        and login state"""
+        KaliAddOn.reset(self)
+        if not self.kwargs.get('shared_session'):
+            self.driver.delete_all_cookies()
+            self.is_logged = False
+        self.driver.get(self.base_url)
+        return True
+
+    def is_healthy(self):
+        """True if the browser session still answers"""
+        if self.session is None:
+            return False
+        return self.session.is_healthy()
 
     def close(self):
-        """Called when the test is finish"""
-        self.display.stop()
+        """Called when the test is finish: quit the browser, or detach from
+        the shared session"""
+        session, self.session = self.session, None
         self.driver = None
+        if session is None:
+            return True
+        self._is_logged = session.is_logged
+        if self.kwargs.get('shared_session'):
+            SESSIONS.detach(session)
+        else:
+            session.quit()
+        return True
 
+    @timed_action
     def start(self, url, browser='Chrome'):
         """Dosent Work"""
         return True  # dosent work anymore
         self.setup(browser=browser, url=url)
 
+    def set_check_timeout(self, timeout):
+        """
+        Setter the default timeout value, also of the driver scripts
+
+        Args:
+            timeout (int/float): seconds
+        """
+        KaliAddOn.set_check_timeout(self, timeout)
+        if self.driver is not None:
+            self.__set_script_timeout()
+
     def set_wait_timeout(self, seconds):
         """To set up the main timeout to wait before fail.
 
@@ -136,6 +245,9 @@ class KaliWebUiAddon(KaliAddOn):
             self.check_timeout = float(seconds)
         except Exception:
             self.logger.erro("Timeout not setted, wrong format, use float")
+            return
+        if self.driver is not None:
+            self.__set_script_timeout()
     # INTERNAL
 
     def __str__(self):
@@ -268,11 +380,14 @@ class KaliWebUiAddon(KaliAddOn):
         """
 
         in_type = _type
+        hidden = bool(INPUTS_DICT.get(label, {}).get('hidden'))
+        element = self.locators.lookup(self.driver, label, _type, hidden)
+        if element:
+            return element
 
         if label in INPUTS_DICT:
             element = INPUTS_DICT[label]
             in_type = element['type']
-            hidden = element.get('hidden')
             # TODO DRY
             if hidden:
                 element = self.__find_visible_by(
@@ -290,10 +405,12 @@ class KaliWebUiAddon(KaliAddOn):
                     if _type != in_type:
                         raise WebUIWrongArgTypeException("Label does not\
                             match with the %s type or element" % _type)
+                self.locators.store(self.driver, label, _type, element)
                 return element
             #import pdb;pdb.set_trace()
             raise WebUIWrongArgTypeException(
                 'Element not found label: ' + label)
+        self.locators.store(self.driver, label, _type, element)
         return element
 
     def __set_return_by_element(self, element):
@@ -316,47 +433,28 @@ class KaliWebUiAddon(KaliAddOn):
 
     def __led_satus_from_img(self, led_img_url):
         file_name = os.path.split(led_img_url)[1]
-        if file_name == LED_GREEN_IMG:
-            return "Green"
-        elif file_name == LED_BLACK_IMG:
-            return 'Black'
-        elif file_name == LED_RED_IMG:
-            return 'Red'
-        else:
-            raise KaliExceptionWebUiDriver('No valid led file')
-
-    def __angular_status(self):
-        try:
-            java_script_to_load_angular = """
-            var injector = window.angular.element('body').injector();
-            var $http = injector.get('$http');
-            return ($http.pendingRequests.length === 0);"""
-            angualar_js = "return angular.element(document).injector()" +\
-                ".get('$http').pendingRequests.length === 0"
-            return self.driver.execute_script(angualar_js)
-        except WebDriverException:
-            # No Angular Founded
-            return True
-
-    def __js_document_status(self):
-        return self.driver.execute_script("return document.readyState")
+        if file_name in LED_COLORS:
+            return LED_COLORS[file_name]
+        raise KaliExceptionWebUiDriver('No valid led file')
 
     def __wait_js_angular(self):
-        timeout_start = time.time()
-        timeout = 1.0
-        if self.check_timeout:
-            timeout = self.check_timeout
-        while not self.__angular_status() or not self.__js_document_status():
-            if time.time() > timeout_start + timeout:
-                break
+        """Wait in the page for the document to be loaded and Angular to
+        have no pending request, at most check_timeout"""
+        AngularIdleProbe(self.driver, self.check_timeout or 1.0).wait()
         return True
 
+    def __set_script_timeout(self):
+        # The in-page waits must end before the driver script timeout
+        self.driver.set_script_timeout(
+            (self.check_timeout or 1.0) + SCRIPT_TIMEOUT_MARGIN)
+
     # METHODS
 
     # angular wait return
     # angular.element(document).injector().get('$http').pendingRequests.length
     # === 0
 
+    @timed_action
     def get_leds_status(self, visible):
         """ To get the actual status of led in homepage
 
@@ -365,37 +463,60 @@ class KaliWebUiAddon(KaliAddOn):
 
         """
         self.__wait_js_angular()
-        led_status_dict = {}
-        for key in LED_DICT:
-            led_status_dict[key] = {}
-            if visible:
-                section = self.__find_visible_by(
-                    By.XPATH, "//h4[contains(text(), '%s')]" % key)
-            else:
-                section = self.driver
-            for led_label in LED_DICT[key]:
-                labeldiv = section.find_element_by_xpath(
-                    "//h4[contains(text(), '%s')]" +
-                    "/following::div[contains(text(), '%s')]" %
-                    (key, led_label))
-
-                img_div = labeldiv.find_element_by_xpath(
-                    ".//following-sibling::div")
-                led_status = None
-                timeout_start = time.time()
-                while not led_status or led_status == 'Black':
-                    led_status_img = img_div.find_element_by_css_selector(
-                        "img")
-                    try:
-                        led_status_image = led_status_img.get_attribute("src")
-                    except StaleElementReferenceException:
-                        continue
-                    led_status = self.__led_satus_from_img(led_status_image)
-                    if time.time() > timeout_start + 2:
-                        break
-                led_status_dict[key][led_label] = led_status
-        return led_status_dict
+        leds = {}
+
+        def loaded():
+            leds.update(self.get_state(leds=True, visible=visible)['leds'])
+            # Black leds may be still loading
+            return all(led_status not in (None, 'Black')
+                       for section_leds in leds.values()
+                       for led_status in section_leds.values())
+        ConditionProbe(loaded, timeout=LED_LOADING_TIMEOUT,
+                       interval=LED_LOADING_INTERVAL, name='Leds').wait()
+        return leds
+
+    @timed_action
+    def get_state(self, labels=None, leds=False, visible=True):
+        """Collect the state of many labels, and of the leds, with a single
+        WebDriver call. Labels are looked for as __get_element does, without
+        waiting for them to appear.
+
+        Args:
+            labels(list/dict): labels to look for, or dict of label: input
+                type (text, select, checkbox, td...)
+            leds(bool): collect the color of the leds in LED_DICT too
+            visible(bool): the led sections must be visible
 
+        Returns:
+            dict: {'route': page route,
+                'labels': {label: {'found', 'visible', 'tag', 'type',
+                    'value', 'checked', 'text'}},
+                'leds': {section: {led label: 'Green', 'Red', 'Black' or
+                    None if not found}}}
+            'value' is as get_value: checked for checkboxes, value for
+            inputs, text otherwise. Also set as checker returned.
+        """
+        if not isinstance(labels, dict):
+            labels = dict.fromkeys(labels or ())
+        queries = [self.locators.query(
+            label, _type, bool(INPUTS_DICT.get(label, {}).get('hidden')))
+            for label, _type in labels.items()]
+        state = self.driver.execute_script(
+            STATE_JS, queries, LED_DICT if leds else {}, visible)
+        for label, found in state['labels'].items():
+            locator = found.pop('locator', None)
+            if locator:
+                self.locators.add(label, labels[label], state['route'],
+                                  locator)
+        state['leds'] = {
+            section: {led_label: LED_COLORS.get(os.path.split(src)[1])
+                      if src else None
+                      for led_label, src in section_leds.items()}
+            for section, section_leds in state['leds'].items()}
+        self.checker.set_returned(state)
+        return state
+
+    @timed_action
     def led_status(self, section, label, visible):
         """
         Set checker returned with the color of the led are you checking for
@@ -407,10 +528,15 @@ class KaliWebUiAddon(KaliAddOn):
         """
         leds_status_dict = self.get_leds_status(visible)
         try:
-            self.checker.set_returned(leds_status_dict[section][label])
+            status = leds_status_dict[section][label]
         except KeyError as e:
             raise KaliExceptionWebUiDriver("No Led found <%s>" % e)
+        if status is None:
+            raise KaliExceptionWebUiDriver(
+                "No Led found <%s: %s>" % (section, label))
+        self.checker.set_returned(status)
 
+    @timed_action
     def led_is(self, section, label, color, visible):
         """Check if Led color is the same given.
 
@@ -428,6 +554,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.led_status(section, label, visible)
         return self.get_result('equal')
 
+    @timed_action
     def led_is_green(self, section, label, visible=True):
         """Check if led is Green.
 
@@ -441,6 +568,7 @@ class KaliWebUiAddon(KaliAddOn):
         """
         return self.led_is(section, label, 'Green', visible)
 
+    @timed_action
     def led_is_red(self, section, label, visible=True):
         """Check if led is Red.
 
@@ -453,6 +581,7 @@ class KaliWebUiAddon(KaliAddOn):
         """
         return self.led_is(section, label, 'Red', visible)
 
+    @timed_action
     def led_is_black(self, section, label, visible=True):
         """Check if led is Blac.
 
@@ -465,15 +594,18 @@ class KaliWebUiAddon(KaliAddOn):
         """
         return self.led_is(section, label, 'Black', visible)
 
+    @timed_action
     def page_refresh(self):
         self.driver.refresh()
 
+    @timed_action
     def scroll_on_save(self):
         save_button = self.driver.find_element_by_css_selector(
             'div.col-lg-8:nth-child(4) > button:nth-child(2)')
         self.driver.execute_script(
             "return arguments[0].scrollIntoView();", save_button)
 
+    @timed_action
     def scroll_down(self, popup=None, label=None):
         """Util to scroll the web page to the bottom.
 
@@ -492,15 +624,19 @@ class KaliWebUiAddon(KaliAddOn):
             self.driver.execute_script(
                 "window.scrollTo(0, document.body.scrollHeight);")
 
+    @timed_action
     def scroll_modal(self):
         """Use it to scroll the modal popup"""
         # modal-content
-        sleep(1)
+        AngularIdleProbe(self.driver, self.check_timeout).wait()
         self.driver.execute_script(
             "return $('.slide-frame').scrollTop($('.slide-frame').height() +\
  $('.modal-body').height()+10);")
-        sleep(3)
+        StableProbe(lambda: self.driver.execute_script(
+            "return $('.slide-frame').scrollTop();"), timeout=3).wait()
+        AngularIdleProbe(self.driver, self.check_timeout).wait()
 
+    @timed_action
     def press_key(self, key, n=1):
         """
         :param key: input keyboard parameter
@@ -530,10 +666,12 @@ class KaliWebUiAddon(KaliAddOn):
             # TODO: specify a right exception
             return False
 
+    @timed_action
     def open_url(self, url):
         """Use it to directly open a url in the browser."""
         self.driver.get(url)
 
+    @timed_action
     def refresh(self):
         """Use it to refrash the current page."""
         self.is_logged = False
@@ -546,6 +684,7 @@ class KaliWebUiAddon(KaliAddOn):
             except ElementClickInterceptedException:
                 continue
 
+    @timed_action
     def click_on_save(self, ):
         """Use it to click the Save button."""
         save_btn = self.__find_visible_by(By.XPATH,
@@ -555,6 +694,7 @@ class KaliWebUiAddon(KaliAddOn):
             return True
         return False
 
+    @timed_action
     def click_on_cancel(self):
         """Use it to click on Cancel button."""
         cancel_btn = self.__find_visible_by(By.CSS_SELECTOR,
@@ -564,6 +704,7 @@ class KaliWebUiAddon(KaliAddOn):
             return True
         return None
 
+    @timed_action
     def click_on_logout(self):
         """Use it to click on Logout button."""
         if self.click_button('ADMIN') and self.click_button('LOGOUT'):
@@ -574,6 +715,7 @@ class KaliWebUiAddon(KaliAddOn):
         element_present = EC.element_to_be_clickable(
             (By.XPATH, "//*[normalize-space(.)='" + label + "']"))
 
+    @timed_action
     def click_button(self, label, double=False, button=None, hidden=False):
         """
         Click on visible button with have the text of the label.
@@ -592,7 +734,14 @@ class KaliWebUiAddon(KaliAddOn):
         actionchains = None
         if double:
             actionchains = webdriver.ActionChains(self.driver)
-        if label in INPUTS_DICT:
+        cached = None
+        by_label = label not in INPUTS_DICT or \
+            INPUTS_DICT[label]['type'] == BTN
+        if by_label:
+            cached = self.locators.lookup(self.driver, label, BTN, hidden)
+        if cached:
+            button = cached
+        elif label in INPUTS_DICT:
             if INPUTS_DICT[label]['type'] == BTN:
                 button = self.__find_visible_by(INPUTS_DICT[label]['by'],
                                                 INPUTS_DICT[label]['value'],
@@ -613,6 +762,8 @@ class KaliWebUiAddon(KaliAddOn):
                     element_present)
                 button = self.driver.find_element_by_css_selector(
                     "*[value=\"" + label + "\"]")
+        if by_label and button and not cached:
+            self.locators.store(self.driver, label, BTN, button)
         try:
             if not double:
                 self.driver.execute_script(
@@ -638,11 +789,33 @@ class KaliWebUiAddon(KaliAddOn):
                     continue
             raise KaliExceptionWebUiDriver('Button not found')
 
+    @timed_action
+    def wait_for_label(self, label, timeout=None):
+        """
+        Wait until an element with the text of the label is displayed (eg.
+        a button appearing at the end of a long operation).
+
+        Args:
+            label (str): the text of the element
+            timeout (float): max seconds to wait. Default is check_timeout
+
+        Returns:
+            bool: True if the element is displayed (also set as checker
+                returned), False on timeout
+        """
+        displayed = ElementProbe(
+            self.driver, By.XPATH, "//*[normalize-space(.)=\"" + label + "\"]",
+            timeout=timeout or self.check_timeout, interval=2).wait()
+        self.checker.set_returned(displayed)
+        return displayed
+
+    @timed_action
     def click_to_close(self):
         """Use it to click on 'x' or on Close button, to close the modal popup.
         """
         self.ng_click(function='dismiss()')
 
+    @timed_action
     def ng_click(self, function):
         """ Click button only when the ng-click function are filled
             Args:
@@ -653,6 +826,7 @@ class KaliWebUiAddon(KaliAddOn):
                                          "*[ng-click='" + function + "']")
         element.click()
 
+    @timed_action
     def resize_window(self, sizes):
         """ Resize the browser window
         Args:
@@ -660,6 +834,7 @@ class KaliWebUiAddon(KaliAddOn):
         """
         self.driver.set_window_size(sizes[0], sizes[1])
 
+    @timed_action
     def set_value(self, value, label=None, input_type=None, obj=None):
         """
         Sets value to a input element
@@ -701,6 +876,7 @@ class KaliWebUiAddon(KaliAddOn):
                 return False
         return True
 
+    @timed_action
     def set_select(self, label, option):
         """
         Selects the option matching 'option' for the combo-box labeled 'label'
@@ -717,6 +893,7 @@ class KaliWebUiAddon(KaliAddOn):
         if element:
             return self.set_value(option, obj=element, input_type='select')
 
+    @timed_action
     def set_input(self, label, value):
         """
         Sets value to a input element
@@ -732,6 +909,7 @@ class KaliWebUiAddon(KaliAddOn):
         if element:
             return self.set_value(value, obj=element, input_type='text')
 
+    @timed_action
     def set_checkbox(self, label, check):
         """
         Check un check the checkbox
@@ -747,6 +925,7 @@ class KaliWebUiAddon(KaliAddOn):
         if element:
             return self.set_value(check, obj=element, input_type='checkbox')
 
+    @timed_action
     def set_datetime(self, date):
         """
         Set given date in correct way to next dateTime input
@@ -761,6 +940,7 @@ class KaliWebUiAddon(KaliAddOn):
         element = self.__find_visible_by(By.ID, 'dateTime')
         self.set_value(value=date, input_type='text', obj=element)
 
+    @timed_action
     def upload_file(self, file_path, hidden=False):
         """Set file to upload
 
@@ -779,6 +959,7 @@ class KaliWebUiAddon(KaliAddOn):
             raise KaliExceptionWebUiDriver('File: %s not found' % file_path)
         return True
 
+    @timed_action
     def click_to_download(self, button_label, file_name=None):
         """
         Download file in download folder
@@ -791,20 +972,28 @@ class KaliWebUiAddon(KaliAddOn):
 
         """
 
+        existing = os.listdir(self.download_folder) \
+            if os.path.isdir(self.download_folder) else ()
         self.click_button(button_label)
         element_present = EC.visibility_of_element_located(
             (By.CSS_SELECTOR, ".showSweetAlert.visible"))
         WebDriverWait(self.driver, self.check_timeout).until(
             element_present)
-        sleep(1)
-        return_file_name = max(glob.iglob('%s/*.*' % self.download_folder),
-                               key=os.path.getctime)
+        download = FileProbe(self.download_folder, existing,
+                             timeout=DOWNLOAD_TIMEOUT)
+        if download.wait():
+            return_file_name = download.found
+        else:
+            return_file_name = max(
+                glob.iglob('%s/*.*' % self.download_folder),
+                key=os.path.getctime)
         if file_name:
             new_file_path_name = os.path.join(self.download_folder, file_name)
             shutil.move(return_file_name, new_file_path_name)
             return_file_name = new_file_path_name
         self.checker.set_returned(return_file_name)
 
+    @timed_action
     def find_select(self, label):
         """
         Check if combo select box is present in the current page.
@@ -823,6 +1012,7 @@ class KaliWebUiAddon(KaliAddOn):
         except TimeoutException:
             self.checker.set_returned(False)
 
+    @timed_action
     def find_input(self, label):
         """
         Check if input is present in the current page.
@@ -838,6 +1028,7 @@ class KaliWebUiAddon(KaliAddOn):
         except TimeoutException:
             self.checker.set_returned(False)
 
+    @timed_action
     def find_checkbox(self, label):
         """
         Check if checkbox is present in the current page.
@@ -858,6 +1049,7 @@ class KaliWebUiAddon(KaliAddOn):
             self.checker.set_returned(False)
             return False
 
+    @timed_action
     def checkbox_status(self, label):
         """Use it to get the status of a checkbox.
 
@@ -872,6 +1064,10 @@ class KaliWebUiAddon(KaliAddOn):
 
 
         """
+        found = self.get_state({label: 'checkbox'})['labels'][label]
+        if found['found']:
+            self.checker.set_returned(found['checked'])
+            return found['checked']
         if self.find_checkbox(label):
 
             checkbox = self.__get_element(label, 'checkbox')
@@ -883,6 +1079,7 @@ class KaliWebUiAddon(KaliAddOn):
                 self.checker.set_returned(False)
                 return False
 
+    @timed_action
     def get_value(self, label, _type=None):
         """
         Get value of a input element
@@ -900,6 +1097,10 @@ class KaliWebUiAddon(KaliAddOn):
 
         """
         self.__wait_js_angular()
+        state = self.get_state({label: _type})['labels'][label]
+        if state['found'] and state['tag'] != 'select':
+            self.checker.set_returned(state['value'])
+            return state['value']
         found = self.__get_element(label, _type)
         if found:
             if found.tag_name == 'input':
@@ -915,6 +1116,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.checker.set_returned('')
         return False
 
+    @timed_action
     def get_value_and_check(self, label, expected, _type=None, result='equal'):
         """
         Check if element (input, select, tc ecc) have the gived value
@@ -929,6 +1131,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.set_check(expected)
         self.get_result(result)
 
+    @timed_action
     def find_text(self, text):
         """
         Check if text is present inside Html Dom.
@@ -965,6 +1168,7 @@ class KaliWebUiAddon(KaliAddOn):
             self.checker.set_returned(True)
             return True
 
+    @timed_action
     def find_text_and_check(self, text, expected=True, result='equal'):
         """Search text in page.
 
@@ -978,6 +1182,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.set_check(expected)
         return self.get_result(result)
 
+    @timed_action
     def find_element(self, _type, value):
         element_attribute = ELEMENT_DICT[_type]
         search_path = "%s[%s$='%s']" % (_type, element_attribute, value)
@@ -987,6 +1192,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.checker.set_returned(False)
         return False
 
+    @timed_action
     def find_element_and_check(self, _type, value, expected=True):
         """ Looking for a html element in the page.
 
@@ -1002,6 +1208,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.set_check(expected)
         self.get_result('equal')
 
+    @timed_action
     def check_login(self, psw):
         self.set_value(psw, label='Password')
         self.click_button('Login')
@@ -1014,6 +1221,7 @@ class KaliWebUiAddon(KaliAddOn):
         self.checker.set_returned(False)
         return False
 
+    @timed_action
     def send_key(self, key_button):
         element = self.driver.switch_to.active_element
         key_to_send = None
@@ -1025,10 +1233,23 @@ class KaliWebUiAddon(KaliAddOn):
 
     # MACRO
 
+    @timed_action
     def macro_wait_and_check_uptime(self,
                                     wait_minutes=1,
                                     time_label='Up Time',
                                     click_button=None):
+        """
+        Wait for the uptime shown on the page to grow by wait_minutes, then
+        check it.
+
+        Args:
+            wait_minutes (int): minutes the uptime has to grow.
+            time_label (str): label of the uptime table cell.
+            click_button (str): label of the button refreshing the uptime.
+                It is clicked before each read of the uptime (every
+                UPTIME_INTERVAL seconds), so it must be idempotent: a
+                refresh button, not one with other side effects.
+        """
         new_date = None
         datetime_obj = None
         ele_text = self.get_value(label=time_label, _type='td')
@@ -1057,13 +1278,19 @@ class KaliWebUiAddon(KaliAddOn):
         else:
             new_date = 'up %s hours' % new_hour
         # print(new_date)
-        sleep(60 * wait_minutes)
-        if click_button:
-            self.click_button(click_button)
+
+        def uptime_reached():
+            # the page shows the new uptime only once refreshed
+            if click_button:
+                self.click_button(click_button)
+            return self.get_value(label=time_label, _type='td') == new_date
+        ConditionProbe(uptime_reached, timeout=60 * wait_minutes +
+                       UPTIME_MARGIN, interval=UPTIME_INTERVAL).wait()
         # print(self.get_value(label=time_label, _type='td'))
         self.get_value_and_check(
             label=time_label, _type='td', expected=new_date)
 
+    @timed_action
     def macro_ip_configurator(self,
                               side_selection,
                               side_a,
@@ -1155,7 +1382,7 @@ class KaliWebUiAddon(KaliAddOn):
         WebDriverWait(self.driver, self.check_timeout).until(next_btn_present)
 
         try:
-            sleep(1)
+            AngularIdleProbe(self.driver, self.check_timeout).wait()
             if self.driver.find_element_by_xpath(self.next).is_displayed():
                 self.driver.find_element_by_xpath(self.next).click()
         except NoSuchElementException:
@@ -1163,28 +1390,58 @@ class KaliWebUiAddon(KaliAddOn):
 
         # Save
         try:
-            sleep(1)
+            AngularIdleProbe(self.driver, self.check_timeout).wait()
             if self.driver.find_element_by_xpath(
                     self.omnia_save).is_displayed():
                 self.driver.find_element_by_xpath(self.omnia_save).click()
         except NoSuchElementException:
             pass
 
+    @timed_action
     def macro_login(self, password=None):
         """
-        Automatic login in webui.
+        Automatic login in webui, skipped if the (shared) browser session is
+        still logged.
 
         """
-
+        if self.is_logged:
+            if self.__is_home_page():
+                self.checker.set_returned(True)
+                return True
+            self.is_logged = False
         element_present = EC.presence_of_element_located(
-            (By.XPATH, '/html/body/div/form/div[3]/span[2]'))
+            (By.XPATH, LOGIN_PASSWORD_XPATH))
         WebDriverWait(self.driver, self.check_timeout).until(element_present)
-        ppn = self.__find_visible_by(By.XPATH,
-                                     '/html/body/div/form/div[3]/span[2]')
+        ppn = self.__find_visible_by(By.XPATH, LOGIN_PASSWORD_XPATH)
         if not password:
             password = ppn.text[-6:]
         self.check_login(psw=password)
 
+    def __is_home_page(self):
+        """
+        Check that the page shows the logged in home page: the page may be
+        still loading (eg. redirecting to the login page after the session
+        expired), so it waits for Angular and for either the home page or
+        the login page to show up.
+
+        Returns:
+            bool: True if logged in.
+        """
+        home = INPUTS_DICT['Home_Page']
+
+        def home_page():
+            return bool(self.driver.find_elements(home['by'], home['value']))
+
+        def login_page():
+            return bool(self.driver.find_elements(By.XPATH,
+                                                  LOGIN_PASSWORD_XPATH))
+        AngularIdleProbe(self.driver, self.check_timeout).wait()
+        ConditionProbe(lambda: home_page() or login_page(),
+                       timeout=self.check_timeout, interval=0.2,
+                       name='Home or login page').wait()
+        return home_page() and not login_page()
+
+    @timed_action
     def macro_cloud_remote_config(self,
                                   gvr_id=None,
                                   nickname=None,
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebUi Locator Cache
+===================
+
+Resolving a label to an element costs several WebDriver round trips (waits,
+full DOM XPath scans, jQuery lookups, scrolling every candidate). The
+LocatorCache keeps, for each (label, type), the concrete locator of the
+element found on each page route, so a repeated lookup is a single
+execute_script call. A cached locator matching no visible element is stale:
+the lookup misses and the caller resolves the label again.
+
+The cache is seeded with LOCATOR_INDEX, built from pages_data: the
+INPUTS_DICT locators, which are valid on any route, also reachable through
+their 'label_text'. Labels with an index locator are not cached per route.
+
+An element with an id is cached by id. Otherwise its positional XPath is
+only cached together with the label and tag of the element: a lookup
+checks the element found is still that tag and labelled by that label (as
+resolved by approximation: its text or value, or the text of the element
+preceding it or one of its ancestors), since another element may take the
+same position once the page changes.
+
+"""
+from selenium.webdriver.common.by import By
+
+from .pages_data import INPUTS_DICT
+
+# Route of the locators valid on every page
+ANY_ROUTE = '*'
+
+# Locator kinds understood by the lookup script
+XPATH = 'xpath'
+CSS = 'css'
+
+# Functions shared by the scripts: path(e) is the unique XPath of e,
+# locator(e, label) its cached locator and labelled(e, locator) whether e
+# passes the label/tag check of the locator
+_LOCATOR_FUNCTIONS_JS = """
+function path(e) {
+    if (e.id && document.getElementById(e.id) === e)
+        return '//*[@id="' + e.id + '"]';
+    if (!e.parentElement) return '/' + e.tagName.toLowerCase();
+    var index = 1;
+    for (var s = e.previousElementSibling; s; s = s.previousElementSibling)
+        if (s.tagName === e.tagName) index++;
+    return path(e.parentElement) + '/' + e.tagName.toLowerCase() +
+        '[' + index + ']';
+}
+function locator(e, label) {
+    if (e.id && document.getElementById(e.id) === e)
+        return ['xpath', path(e)];
+    return ['xpath', path(e), label, e.tagName.toLowerCase()];
+}
+function normalized(e) {
+    return e ? (e.textContent || '').replace(/\\s+/g, ' ').trim() : null;
+}
+function labelled(e, locator) {
+    var label = locator[2];
+    if (!label) return true;
+    if (e.tagName.toLowerCase() !== locator[3]) return false;
+    if (e.value === label) return true;
+    for (var a = e; a && a !== document.body; a = a.parentElement)
+        if (normalized(a) === label ||
+            normalized(a.previousElementSibling) === label) return true;
+    return false;
+}
+"""
+
+# Returns [route, element or null]: the element of the route (or any route)
+# locator, scrolled into view, null if missing, not visible or failing the
+# label check
+_LOOKUP_JS = _LOCATOR_FUNCTIONS_JS + """
+var locators = arguments[0], hidden = arguments[1];
+var route = location.pathname + location.hash;
+var locator = locators[route] || locators['*'];
+if (!locator) return [route, null];
+var element = locator[0] === 'css' ? document.querySelector(locator[1]) :
+    document.evaluate(locator[1], document, null,
+                      XPathResult.FIRST_ORDERED_NODE_TYPE,
+                      null).singleNodeValue;
+if (!element || !labelled(element, locator)) return [route, null];
+if (!hidden) {
+    element.scrollIntoView(false);
+    if (!(element.offsetWidth || element.offsetHeight ||
+          element.getClientRects().length)) return [route, null];
+}
+return [route, element];
+"""
+
+# Returns [route, locator of arguments[0] labelled arguments[1]]
+_LOCATOR_JS = _LOCATOR_FUNCTIONS_JS + """
+return [location.pathname + location.hash, locator(arguments[0], arguments[1])];
+"""
+
+# Returns the state of many labels and LEDs at once (see
+# KaliWebUiAddon.get_state): arguments are the label queries built by
+# LocatorCache.query, LED_DICT and whether LED sections must be visible
+STATE_JS = _LOCATOR_FUNCTIONS_JS + """
+var queries = arguments[0], leds = arguments[1], ledsVisible = arguments[2];
+var route = location.pathname + location.hash;
+function visible(e) {
+    return !!(e.offsetWidth || e.offsetHeight || e.getClientRects().length);
+}
+function literal(s) {
+    if (s.indexOf("'") < 0) return "'" + s + "'";
+    if (s.indexOf('"') < 0) return '"' + s + '"';
+    return "concat('" + s.replace(/'/g, "',\\"'\\",'") + "')";
+}
+function all(locator, context) {
+    if (locator[0] === 'css')
+        return Array.prototype.slice.call(
+            document.querySelectorAll(locator[1]));
+    var found = document.evaluate(locator[1], context || document, null,
+        XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null), elements = [];
+    for (var i = 0; i < found.snapshotLength; i++)
+        elements.push(found.snapshotItem(i));
+    return elements;
+}
+function first(elements, hidden) {
+    if (hidden) return elements[0] || null;
+    for (var i = 0; i < elements.length; i++)
+        if (visible(elements[i])) return elements[i];
+    return null;
+}
+function matches(e, type) {
+    return !type || e.tagName.toLowerCase() === type ||
+        e.getAttribute('type') === type;
+}
+function find(e, selector) {
+    try { return e.querySelector(selector); } catch (error) { return null; }
+}
+function approximate(label, type) {
+    var element = first(all(
+        ['xpath', '//*[normalize-space(.)=' + literal(label) + ']']), false);
+    if (!element) return null;
+    var input = type ? find(element, type) ||
+        find(element, 'input[type="' + type + '"]') : null;
+    input = input || element.nextElementSibling;
+    if (input && !matches(input, type)) input = find(input, type);
+    return input && matches(input, type) ? input : null;
+}
+function state(e, label, approximated) {
+    var tag = e.tagName.toLowerCase(), type = e.getAttribute('type');
+    var text = (e.innerText === undefined ? e.textContent : e.innerText);
+    text = (text || '').trim();
+    var value = text;
+    if (tag === 'input') value = type === 'checkbox' ? e.checked : e.value;
+    return {found: true, visible: visible(e), tag: tag, type: type,
+            value: value, checked: !!e.checked, text: text,
+            locator: approximated ? locator(e, label) : null};
+}
+function labelledFirst(l, hidden) {
+    return first(all(l).filter(function (e) { return labelled(e, l); }),
+                 hidden);
+}
+var result = {route: route, labels: {}, leds: {}};
+queries.forEach(function (q) {
+    var element = null, approximated = false;
+    if (q.locators[route]) element = labelledFirst(q.locators[route], q.hidden);
+    if (!element && q.locators['*'])
+        element = first(all(q.locators['*']), q.hidden);
+    if (!element && q.approximate) {
+        element = approximate(q.label, q.type);
+        approximated = !!element;
+    }
+    result.labels[q.label] = element ?
+        state(element, q.label, approximated) : {found: false};
+});
+Object.keys(leds).forEach(function (section) {
+    var heads = all(['xpath', '//h4[contains(text(), ' + literal(section) +
+                     ')]']);
+    var head = ledsVisible ? first(heads, false) : heads[0];
+    result.leds[section] = {};
+    leds[section].forEach(function (label) {
+        var src = null;
+        var div = head && all(['xpath', 'following::div[contains(text(), ' +
+                               literal(label) + ')]'], head)[0];
+        var sibling = div && all(['xpath', 'following-sibling::div'],
+                                 div)[0];
+        var img = sibling && sibling.querySelector('img');
+        if (img) src = img.src;
+        result.leds[section][label] = src;
+    });
+});
+return result;
+"""
+
+
+def _to_locator(by, value):
+    """
+    Convert a selenium (by, value) pair to a lookup script locator.
+
+    Returns:
+        tuple: (kind, expression), None if by is not supported.
+    """
+    if by == By.XPATH:
+        return XPATH, value
+    if by == By.CSS_SELECTOR:
+        return CSS, value
+    if '"' in value:
+        return None
+    if by == By.ID:
+        return XPATH, '//*[@id="%s"]' % value
+    if by == By.NAME:
+        return XPATH, '//*[@name="%s"]' % value
+    return None
+
+
+def build_index(inputs=None):
+    """
+    Build the locator index of the known page elements.
+
+    Args:
+        inputs (dict): elements as pages_data.INPUTS_DICT (the default).
+
+    Returns:
+        dict: (locator, type, hidden) indexed by label, the 'label_text' of
+        the elements included.
+    """
+    index = {}
+    aliases = {}
+    for label, element in (INPUTS_DICT if inputs is None else inputs).items():
+        locator = _to_locator(element['by'], element['value'])
+        if locator is None:
+            continue
+        entry = (locator, element['type'], bool(element.get('hidden')))
+        index[label] = entry
+        if element.get('label_text'):
+            aliases.setdefault(element['label_text'], entry)
+    for label, entry in aliases.items():
+        index.setdefault(label, entry)
+    return index
+
+
+LOCATOR_INDEX = build_index()
+
+
+class LocatorCache(object):
+    """LocatorCache class definition.
+
+    Args:
+        index (dict): locator index seeding the cache, see
+            :func:`build_index`.
+
+    Attributes:
+        hits (int): lookups answered by the cache.
+        misses (int): lookups to resolve again.
+    """
+
+    def __init__(self, index=None):
+        self.index = LOCATOR_INDEX if index is None else index
+        # (label, type) -> {route: locator}
+        self._locators = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(routes) for routes in self._locators.values())
+
+    def __routes(self, label, _type):
+        routes = self._locators.get((label, _type))
+        if routes is None:
+            routes = self._locators[(label, _type)] = {}
+            entry = self.index.get(label)
+            # Aliases of the index only stand for elements of the same type
+            if entry is not None and (label in INPUTS_DICT or _type is None
+                                      or _type == entry[1]):
+                routes[ANY_ROUTE] = entry[0]
+        return routes
+
+    def query(self, label, _type=None, hidden=False):
+        """
+        Build the STATE_JS query of a label.
+
+        Returns:
+            dict: label, type, hidden, known locators by route and whether
+            the element may be found by approximation from the label text.
+        """
+        return {'label': label, 'type': _type, 'hidden': hidden,
+                'locators': self.__routes(label, _type),
+                'approximate': label not in INPUTS_DICT}
+
+    def add(self, label, _type, route, locator):
+        """
+        Cache the locator of the element of a label on a route, unless the
+        label has an index locator.
+
+        Args:
+            locator (list): (XPATH, path) of an element with an id, else
+                (XPATH, path, label, tag) checked by the lookups.
+        """
+        routes = self.__routes(label, _type)
+        if ANY_ROUTE not in routes:
+            routes[route] = tuple(locator)
+
+    def lookup(self, driver, label, _type=None, hidden=False):
+        """
+        Find the element of a label with the cached locators, in one
+        WebDriver call.
+
+        Args:
+            driver (object): selenium WebDriver.
+            label (str): element label.
+            _type (str): element type asked by the caller.
+            hidden (bool): accept elements not visible.
+
+        Returns:
+            object: selenium element, None if missing (or stale).
+        """
+        routes = self.__routes(label, _type)
+        if not routes:
+            self.misses += 1
+            return None
+        found = driver.execute_script(_LOOKUP_JS, routes, hidden)
+        element = found[1] if found else None
+        if not element:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return element
+
+    def store(self, driver, label, _type, element):
+        """
+        Cache the locator of an element resolved for a label, on the
+        current route.
+
+        Args:
+            driver (object): selenium WebDriver.
+            label (str): element label.
+            _type (str): element type asked by the caller.
+            element (object): selenium element.
+        """
+        if not element or ANY_ROUTE in self.__routes(label, _type):
+            return
+        found = driver.execute_script(_LOCATOR_JS, element, label)
+        if found:
+            self.add(label, _type, found[0], found[1])
+
+    def clear(self):
+        self._locators = {}
@@ -293,6 +293,12 @@ LED_GREEN_IMG = "led-green-black-300px.png"
 LED_BLACK_IMG = "led-black-300px.png"
 LED_RED_IMG = "led-red-black-300px.png"
 
+LED_COLORS = {
+    LED_GREEN_IMG: 'Green',
+    LED_BLACK_IMG: 'Black',
+    LED_RED_IMG: 'Red'
+}
+
 LED_DICT = {
 
     'Network status': ['SIDE A reachable', 'SIDE B reachable'],
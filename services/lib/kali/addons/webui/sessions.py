@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebUi Browser Sessions
+======================
+
+Browser sessions (WebDriver and its virtual display) shared by WebUi addons.
+An addon set up with shared_session attaches to the session of the same name,
+browser and options started by a previous addon, so the browser starts and
+logs in once per run: cookies and login state survive the addons. Shared
+sessions are quit when the run exits.
+
+"""
+import atexit
+import threading
+
+from selenium.common.exceptions import WebDriverException
+
+
+class WebDriverSession(object):
+    """WebDriverSession class definition: a browser and its display.
+
+    Args:
+        driver (object): selenium WebDriver.
+        display (object): pyvirtualdisplay Display, None in headless mode.
+
+    Attributes:
+        users (int): addons attached to the session.
+        is_logged (bool): the browser is logged in the webui.
+    """
+
+    def __init__(self, driver, display=None):
+        self.driver = driver
+        self.display = display
+        self.users = 0
+        self.is_logged = False
+
+    def is_healthy(self):
+        """True if the browser still answers"""
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+        except WebDriverException:
+            return False
+        return True
+
+    def quit(self):
+        """
+        Quit the browser and stop the display.
+        """
+        driver, self.driver = self.driver, None
+        display, self.display = self.display, None
+        try:
+            if driver is not None:
+                driver.quit()
+        except WebDriverException:
+            pass
+        finally:
+            if display is not None:
+                display.stop()
+
+
+class WebDriverRegistry(object):
+    """WebDriverRegistry class definition: shared sessions by key, thread
+    safe. Sessions stay open when their last addon detaches, until close."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def attach(self, key, factory):
+        """
+        Attach to the healthy session of the given key, started with
+        factory if missing.
+
+        Args:
+            key (tuple): hashable session key (name, browser, options).
+            factory (callable): returns a new :class:`WebDriverSession`.
+
+        Returns:
+            tuple: (:class:`WebDriverSession`, bool True if the session has
+            just been started).
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            started = False
+            if session is not None and not session.is_healthy():
+                session.quit()
+                session = None
+            if session is None:
+                session = self._sessions[key] = factory()
+                started = True
+            session.users += 1
+            return session, started
+
+    def detach(self, session):
+        """
+        Detach an addon from a session, the browser is kept open.
+
+        Args:
+            session (object): :class:`WebDriverSession`.
+        """
+        with self._lock:
+            session.users = max(session.users - 1, 0)
+
+    def close(self):
+        """
+        Quit all the shared sessions.
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.quit()
+
+
+SESSIONS = WebDriverRegistry()
+atexit.register(SESSIONS.close)
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASYNC OMNIA TESTING SERVER CLIENT
+=================================
+
+asyncio based OTS client: a single event loop can drive many OMNIA boards
+(or many labels on the same board) at the same time, without threads.
+
+"""
+import asyncio
+import threading
+import time
+
+from .exceptions import KaliExceptionOtsConnection
+from .exceptions import KaliExceptionOtsInvalidHeader
+from .exceptions import KaliExceptionValueError
+
+from .ots_client import LIVENESS_TTL
+from .ots_client import OtsClient
+from .ots_client import PIPELINE_DEPTH
+from .ots_client import RECONNECT_TIMEOUT
+from .ots_client import SOCK_TIMEOUT
+from .ots_client import backoff_delay
+from .ots_client import read_header_length
+from .protocol_header import create_header
+
+
+class AsyncConnectionHandler(object):
+    """
+        AsyncConnectionHandler class definition. Handle a connection through
+        asyncio streams
+
+        Args:
+            ip        (str): ots ip address
+            port      (int): ots port
+            reader    (object): asyncio.StreamReader object
+            writer    (object): asyncio.StreamWriter object
+            connected (bool): connection status
+            last_activity (float): monotonic time of the last round trip
+    """
+
+    def __init__(self, ip, port):
+        self.ip = ip
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.last_activity = None
+        self._attempts = 0
+        # OTS answers in order: a request and its answer must not interleave
+        # with other requests of the same connection
+        self.lock = asyncio.Lock()
+
+    async def connect(self, ip, port):
+        """Connect to given ip,port.
+
+        Args:
+            ip   (str): ots ip address
+            port (int): ots port
+        Raises:
+            KaliOtsConnectionException:
+             :exc:`~src.exceptions.KaliOtsConnectionException`
+                if connection refused
+            KaliExceptionValueError:
+             :exc:`~src.exceptions.KaliExceptionValueError`
+            if ip and port type is not correct
+        """
+        if self.connected:
+            return True
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(str(ip), int(port)), SOCK_TIMEOUT)
+            self.connected = True
+        except ValueError as e:
+            raise KaliExceptionValueError(e)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise KaliExceptionOtsConnection("Connection refused: %s" % e)
+        self.last_activity = time.monotonic()
+        self._attempts = 0
+        return True
+
+    async def disconnect(self):
+        """
+           Close stream
+        """
+        self.connected = False
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.writer = None
+            self.reader = None
+
+    async def reconnect(self):
+        if self.connected:
+            await self.disconnect()
+        return await self.connect(self.ip, self.port)
+
+    async def wait_reconnect(self, timeout=RECONNECT_TIMEOUT):
+        """
+            Reconnect, retrying with backoff until timeout, see
+            :meth:`~src.ots_client.ConnectionHandler.wait_reconnect`
+
+            Args:
+                timeout (float): max seconds to wait
+            Returns:
+                bool: True if connected
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return await self.connect(self.ip, self.port)
+            except KaliExceptionOtsConnection:
+                self._attempts += 1
+            delay = backoff_delay(self._attempts)
+            if time.monotonic() + delay > deadline:
+                return False
+            await asyncio.sleep(delay)
+
+    def is_connected(self):
+        """
+           Check if stream is connected
+
+            Returns:
+                bool: True if stream connected, False otherwise
+        """
+        return self.connected
+
+    def is_alive(self, max_age=LIVENESS_TTL):
+        """
+           Check if a round trip succeeded in the last max_age seconds
+
+            Returns:
+                bool: True if the connection is known alive
+        """
+        return self.connected and self.last_activity is not None and \
+            time.monotonic() - self.last_activity < max_age
+
+    async def _send_request(self, json_):
+        data = create_header(len(json_), 'json') + json_.encode()
+        self.writer.write(data)
+        await self.writer.drain()
+        self.bytes_sent += len(data)
+
+    async def _recv_header(self):
+        # Header tag is a single byte (E0), followed by first length byte
+        header = await self.reader.readexactly(2)
+        length = header[1]
+        if length & 0x80:
+            len_bytes = await self.reader.readexactly(length & 0x7F)
+            header += len_bytes
+            length = int.from_bytes(len_bytes, byteorder='big')
+        header += await self.reader.readexactly(length)
+        self.bytes_received += len(header)
+        return header
+
+    async def _recv_response(self):
+        data_length = read_header_length(
+            await asyncio.wait_for(self._recv_header(), SOCK_TIMEOUT))
+        if data_length == 0:
+            # If no data received, stream is disconnected
+            raise OSError
+        data = await asyncio.wait_for(self.reader.readexactly(data_length),
+                                      SOCK_TIMEOUT)
+        self.bytes_received += len(data)
+        return data.decode()
+
+    async def communicate(self, json_):
+        """
+            Send a json to server and wait for answer
+
+            Args:
+                json_ (str): json data to be sent
+            Returns:
+                str: server response
+            Raises:
+                KaliOtsConnectionException:
+                 :exc:`~src.exceptions.KaliExceptionKeyError`
+                    if communication error
+        """
+        return (await self.communicate_many([json_]))[0]
+
+    async def communicate_many(self, json_list, depth=PIPELINE_DEPTH):
+        """
+            Send several jsons back-to-back and collect the answers, see
+            :meth:`~src.ots_client.ConnectionHandler.communicate_many`
+
+            Args:
+                json_list (list): json data to be sent
+                depth     (int):  max number of requests waiting for answer
+            Returns:
+                list: server responses, in the same order of json_list
+        """
+        if depth < 1:
+            raise KaliExceptionValueError(
+                "Pipeline depth must be at least 1, not %s" % depth)
+        responses = []
+        sent = 0
+        async with self.lock:
+            if not self.connected:
+                raise KaliExceptionOtsConnection(
+                    "Communication error: not connected")
+            try:
+                while len(responses) < len(json_list):
+                    while sent < len(json_list) and \
+                            sent - len(responses) < depth:
+                        await self._send_request(json_list[sent])
+                        sent += 1
+                    responses.append(await self._recv_response())
+            except (OSError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError) as e:
+                await self.disconnect()
+                raise KaliExceptionOtsConnection(
+                    "Communication error: %s" % e)
+            except KaliExceptionOtsInvalidHeader:
+                # The stream is out of sync, replies in flight are unread
+                await self.disconnect()
+                raise
+            self.last_activity = time.monotonic()
+        return responses
+
+
+class AsyncOtsClient(OtsClient):
+    """
+        AsyncOtsClient class definition. Managing connections to ots through
+        asyncio. The connection methods are coroutines, json packing and
+        logging are shared with :class:`~src.ots_client.OtsClient`.
+
+        Attributes:
+            logger (object): logger object.
+            connections (dict): dict of
+                `~src.async_ots_client.AsyncConnectionHandler`
+    """
+
+    def __init__(self, logger=None):
+        # No keepalive thread: lost connections are reestablished by the
+        # idempotent requests
+        OtsClient.__init__(self, logger=logger, keepalive=None)
+        if logger:
+            self.set_logger(logger)
+
+    async def send(self, key_label, interface, method, argument_dic=None,
+                   idempotent=False):
+        """
+            Send a json command to specified ots and wait for response
+
+            Args:
+                key_label    (str):  connection key
+                interface    (str):  target interface on ots
+                method       (str):  method of interface to be executed
+                argument_dic (dict): dict containing method arguments
+                idempotent   (bool): the command can be executed twice: if
+                    the connection is lost, wait for it and send it again
+            Returns:
+                str: ots response
+        """
+        returned = await self.send_many(
+            key_label, [(interface, method, argument_dic)], depth=1,
+            idempotent=idempotent)
+        if returned is False:
+            return False
+        return returned[0]
+
+    async def send_many(self, key_label, commands, depth=PIPELINE_DEPTH,
+                        idempotent=False):
+        """
+            Send several json commands to specified ots in pipeline, see
+            :meth:`~src.ots_client.OtsClient.send_many`
+
+            Args:
+                key_label (str):  connection key
+                commands  (list): list of (interface, method, argument_dic)
+                    tuples, argument_dic may be omitted
+                depth     (int):  max number of requests waiting for answer
+                idempotent (bool): the commands can be executed twice, see
+                    send
+            Returns:
+                list: ots responses, in the same order of commands
+        """
+        to_send = []
+        for command in commands:
+            interface, method = command[0], command[1]
+            argument_dic = command[2] if len(command) > 2 else None
+            json_to_send = self.json_pack(interface=interface,
+                                          method=method,
+                                          argument_dic=argument_dic)
+            self.debug("Sending %s to %s" % (method, interface))
+            self.debug(json_to_send)
+            to_send.append(json_to_send)
+        connection = self.connections[key_label]
+        step = self._start_step(
+            key_label, commands[0][1] if len(commands) == 1 else 'send_many',
+            connection)
+        try:
+            try:
+                returned = await connection.communicate_many(to_send, depth)
+            except KaliExceptionOtsConnection:
+                if not idempotent or not await connection.wait_reconnect():
+                    raise
+                returned = await connection.communicate_many(to_send, depth)
+        except KaliExceptionOtsConnection:
+            self.error("Unable to communicate with %s" % key_label)
+            self._end_step(step, False)
+            return False
+        except KaliExceptionOtsInvalidHeader as e:
+            self.error(e)
+            self._end_step(step, False)
+            return False
+        self._end_step(step, True)
+        for response in returned:
+            self.debug("Omnia Test Server respond: %s" % response)
+        return [self.json_unpack(response, command[0], command[1])
+                for response, command in zip(returned, commands)]
+
+    async def connect(self, key, ip, port):
+        """
+           Connect to ots
+
+            Args:
+                key  (str): connection key
+                ip   (str): ots ip address
+                port (int): ots port
+            Returns:
+                object: AsyncConnectionHandler object
+        """
+        self.debug("Connecting to: %s:%s" % (ip, port))
+        if key not in self.connections:
+            self.debug("Creating new connection %s" % key)
+            conn = AsyncConnectionHandler(ip, port)
+            await conn.connect(ip, port)
+            if conn.is_connected():
+                self.connections[key] = conn
+                self.debug("New Connection Started")
+                return conn
+        else:
+            await self.connections[key].connect(ip, port)
+
+    async def disconnect(self, key):
+        """
+           Disconnect from ots
+
+            Args:
+                key  (str): connection key
+        """
+        self.debug("Disconnecting from: %s" % key)
+        if key not in self.connections:
+            self.error("Key %s not present in connection dictionary" % key)
+        else:
+            await self.connections[key].disconnect()
+
+    async def close(self, key):
+        """
+           Close connection to specified ots
+
+            Args:
+                key  (str): connection key
+        """
+        self.debug('Closing connection %s' % key)
+        await self.disconnect(key)
+        del self.connections[key]
+
+    async def reconnect(self, key):
+        """
+           Reconnect to specified ots
+
+            Args:
+                key  (str): connection key
+        """
+        self.debug("Reconnecting connection %s" % key)
+        await self.connections[key].reconnect()
+
+    async def check_connection(self, key, max_age=LIVENESS_TTL):
+        """
+           Check if specified ots answers to a ping, unless a round trip
+           succeeded in the last max_age seconds
+
+            Args:
+                key  (str): connection key
+                max_age (float): seconds a round trip proves the connection
+                    alive, 0 to always ping
+            Returns:
+                bool: True if ots is connected, False otherwise
+        """
+        connection = self.connections.get(key)
+        if connection is not None and connection.is_alive(max_age):
+            return True
+        if connection is not None and await self.send(key, "dbus", "ping",
+                                                      {}):
+            self.debug("OTS %s connected!" % key)
+            return True
+        self.debug("OTS %s not connected!" % key)
+        return False
+
+    def is_connected(self, key):
+        """
+           Check if specified ots is connected
+
+            Args:
+                key  (str): connection key
+            Returns:
+                bool: True if ots is connected, False otherwise
+        """
+        try:
+            return self.connections[key].is_connected()
+        except KeyError:
+            self.error("Connection key %s doesn't exist" % key)
+            return False
+
+    async def try_reconnect(self, key):
+        """
+           Reestablish the connection of specified ots if it was lost
+
+            Args:
+                key  (str): connection key
+            Returns:
+                bool: True if ots is connected, False otherwise
+        """
+        connection = self.connections.get(key)
+        if connection is None:
+            self.error("Connection key %s doesn't exist" % key)
+            return False
+        if connection.is_connected():
+            return True
+        try:
+            return await connection.connect(connection.ip, connection.port)
+        except KaliExceptionOtsConnection:
+            return False
+
+    async def close_all(self):
+        """
+           Close all connections
+        """
+        connections, self.connections = self.connections, {}
+        await asyncio.gather(*[connection.disconnect()
+                               for connection in connections.values()])
+        return True
+
+
+class AsyncOtsClientAdapter(object):
+    """
+        Blocking facade over :class:`AsyncOtsClient`, so that existing addons
+        can use it through `set_ots_client`. The event loop runs in a
+        dedicated daemon thread and every call is dispatched to it: calls
+        from different threads on different labels run concurrently.
+
+        Attributes:
+            client (object): :class:`AsyncOtsClient` object
+            loop   (object): event loop running the client
+            metrics (object): metrics object of the client, see
+                :class:`~src.ots_client.OtsClient`
+    """
+
+    def __init__(self, client=None, logger=None):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+        self.client = client or AsyncOtsClient(logger)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    @property
+    def metrics(self):
+        return self.client.metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self.client.metrics = metrics
+
+    def send(self, key_label, interface, method, argument_dic=None,
+             idempotent=False):
+        return self._run(self.client.send(key_label, interface, method,
+                                          argument_dic, idempotent))
+
+    def send_many(self, key_label, commands, depth=PIPELINE_DEPTH,
+                  idempotent=False):
+        return self._run(self.client.send_many(key_label, commands, depth,
+                                               idempotent))
+
+    def connect(self, key, ip, port):
+        return self._run(self.client.connect(key, ip, port))
+
+    def disconnect(self, key):
+        return self._run(self.client.disconnect(key))
+
+    def disconnect_pool(self, key):
+        """
+           See :meth:`~src.ots_client.OtsClient.disconnect_pool`: the
+           asynchronous connections are not shared, as disconnect
+        """
+        return self.disconnect(key)
+
+    def close(self, key):
+        return self._run(self.client.close(key))
+
+    def reconnect(self, key):
+        return self._run(self.client.reconnect(key))
+
+    def is_connected(self, key):
+        return self.client.is_connected(key)
+
+    def try_reconnect(self, key):
+        return self._run(self.client.try_reconnect(key))
+
+    def check_connection(self, key, max_age=LIVENESS_TTL):
+        return self._run(self.client.check_connection(key, max_age))
+
+    def close_all(self):
+        return self._run(self.client.close_all())
+
+    def stop(self):
+        """
+           Close all connections and stop the event loop
+        """
+        self.close_all()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def set_logger(self, logger):
+        self.client.set_logger(logger)
@@ -8,3 +8,6 @@ LOG_LEVEL = ["debug",
              "warning"]
 
 VALID_KEYS_COMPATIBILIES = ['Kali', 'Omnia', 'OTS']
+
+# Max seconds waited for OTS to answer again (eg. after a board reboot)
+OTS_READY_TIMEOUT = 300
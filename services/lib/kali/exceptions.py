@@ -88,3 +88,9 @@ class KaliExceptionAttributeError(KaliException):
 
     def __init__(self, message):
         super(KaliExceptionAttributeError, self).__init__(message)
+
+
+class KaliExceptionTimeout(KaliException):
+
+    def __init__(self, message):
+        super(KaliExceptionTimeout, self).__init__(message)
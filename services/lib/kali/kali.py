@@ -10,6 +10,7 @@ import os
 from collections import OrderedDict
 from configparser import ConfigParser
 from configparser import NoSectionError, NoOptionError
+from .exceptions import KaliException
 from .exceptions import KaliExceptionKeyError
 from .exceptions import KaliExceptionSetupError
 from .exceptions import KaliExceptionValueError
@@ -27,8 +28,13 @@ from .addons.omnia_picaso.addon import KaliPicasoAddon
 from .addons.omnia_ftclient.addon import KaliFTClient
 from .addons.main.addon import KaliMainAddon
 from .define import LOG_LEVEL
+from .define import OTS_READY_TIMEOUT
 from .test_case import KaliTestResultManager
+from .tags import TagFilter
 from .ots_client import OtsClient
+from .probes import OtsPingProbe
+from .addon_pool import AddonPool
+from .metrics import StepRecord
 
 
 class Kali(object):
@@ -41,17 +47,34 @@ class Kali(object):
             objects.
         ots_client (object): :exc:`~src.ots_client.OtsClient` object to handle 
         ots connections
+        addon_pool (object): :exc:`~src.addon_pool.AddonPool` object keeping
+        removed addons for reuse, None to close them on removal
+        metrics (object): :exc:`~src.metrics.Metrics` object receiving the
+        step records of checks, OTS round trips and addon actions, None to
+        disable them (see set_metrics)
+        reporters (list): :exc:`~src.reporters.ResultReporter` objects each
+        test case is written to as soon as it ends
+        skip_tests (set): (number, title) of the test cases already completed
+        by a previous run, not run again (see run)
     """
 
     def __init__(self):
         self.addons = {}
+        self.addon_pool = AddonPool()
+        self._addons_kwargs = {}
         self.logger = None
         self.test_cases = OrderedDict()
         self.ots_client = None
+        self.metrics = None
+        self.reporters = []
+        self.skip_tests = set()
         self._accepted_tags = None
         self._refused_tags = None
+        self._tag_expression = None
+        self._tag_filter = None
 
         self._cur_test_case = None
+        self._cur_test_key = None
 
     @property
     def accepted_tags(self):
@@ -61,6 +84,7 @@ class Kali(object):
     def accepted_tags(self, tags):
         if isinstance(tags, list) and all(isinstance(tag, str) for tag in tags):
             self._accepted_tags = tags
+            self._tag_filter = None
 
     @property
     def refused_tags(self):
@@ -70,6 +94,47 @@ class Kali(object):
     def refused_tags(self, tags):
         if isinstance(tags, list) and all(isinstance(tag, str) for tag in tags):
             self._refused_tags = tags
+            self._tag_filter = None
+
+    @property
+    def tag_filter(self):
+        """:class:`~src.tags.TagFilter` built from accepted tags, refused
+        tags and tag expression."""
+        if self._tag_filter is None:
+            self._tag_filter = TagFilter(allow=self._accepted_tags,
+                                         deny=self._refused_tags,
+                                         expression=self._tag_expression)
+        return self._tag_filter
+
+    def set_tag_expression(self, expression):
+        """
+        Set a boolean tag expression tests must satisfy, eg.
+        "smoke and (webui or dbus) and not slow".
+
+        Args:
+            expression (str): tag expression, None to remove it.
+
+        Raises:
+            KaliExceptionValueError:
+                :exc:`~src.exceptions.KaliExceptionValueError` if expression
+                is not valid.
+        """
+        self._tag_filter = TagFilter(allow=self._accepted_tags,
+                                     deny=self._refused_tags,
+                                     expression=expression)
+        self._tag_expression = expression
+
+    def is_test_allowed(self, tags):
+        """
+        Check tags against accepted tags, refused tags and tag expression.
+
+        Args:
+            tags (iterable): test tags.
+
+        Returns:
+            bool: True if the test must run, False otherwise.
+        """
+        return self.tag_filter.match(tags)
 
     def __del__(self):
         try:
@@ -83,6 +148,66 @@ class Kali(object):
             self.ots_client.close_all()
         for key in self.addons.keys():
             self.addons[key].close()
+        # Closed addons must not be given back to the pool
+        self.addons.clear()
+        self._addons_kwargs.clear()
+        if self.addon_pool is not None:
+            self.addon_pool.close()
+        if self.metrics is not None:
+            self.metrics.close()
+            self.set_metrics(None)
+        while self.reporters:
+            self.reporters.pop().close()
+
+    def add_reporter(self, reporter):
+        """
+        Write each test case to a reporter as soon as it ends.
+
+        Args:
+            reporter (object): :exc:`~src.reporters.ResultReporter` object,
+                closed by Kali.close.
+        """
+        self.reporters.append(reporter)
+
+    def resume(self, journal):
+        """
+        Load the results of the test cases completed by an interrupted run:
+        they are not run again. The interrupted test cases run again.
+
+        Args:
+            journal (object): :class:`~src.reporters.CheckpointJournal`
+                object of the interrupted run.
+
+        Returns:
+            OrderedDict: restored test case results, indexed by (number,
+            title).
+        """
+        restored = journal.restore()
+        self.test_cases.update(restored)
+        self.skip_tests.update(restored)
+        if restored:
+            self.info('Resuming run: %d tests already completed' %
+                      len(restored))
+        for number, title in journal.interrupted:
+            self.warning('Test %s %s was interrupted, running it again' %
+                         (number, title))
+        return restored
+
+    def set_metrics(self, metrics):
+        """
+        Enable step records on checks, OTS round trips and addon actions.
+
+        Args:
+            metrics (object): :exc:`~src.metrics.Metrics` object, None to
+                disable.
+        """
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.current_test = self._cur_test_case
+        if self.ots_client:
+            self.ots_client.metrics = metrics
+        for key in self.addons:
+            self.addons[key].metrics = metrics
 
     # OTS METHODS
     def start_connection_ots(self, conn_key, ip, port):
@@ -104,6 +229,7 @@ class Kali(object):
         try:
             if not self.ots_client:
                 self.ots_client = OtsClient(conn_key, ip, port, self.logger)
+                self.ots_client.metrics = self.metrics
                 if self.logger:
                     self.ots_client.set_logger(self.logger)
             else:
@@ -151,6 +277,24 @@ class Kali(object):
             return False
         return self.ots_client.disconnect(conn_key)
 
+    def disconnect_pool_ots(self, conn_key):
+        """
+        Close the OTS connections of conn_key for every label sharing them
+        (same OMNIA address), eg. before a reboot.
+
+        Args:
+            conn_key (str): A label to index the client.
+
+        Returns:
+            bool: True if the connections have been closed, False otherwise.
+        """
+        if self.ots_client is None:
+            self.error(
+                "No OTS client created yet, unable to disconnect from %s" %
+                conn_key)
+            return False
+        return self.ots_client.disconnect_pool(conn_key)
+
     def reconnect_connection_ots(self, conn_key):
         if self.ots_client is None:
             self.error(
@@ -173,6 +317,25 @@ class Kali(object):
                 self._cur_test_case.add_failed()
         return connection_status
 
+    def wait_ots_ready(self, conn_key, timeout=OTS_READY_TIMEOUT):
+        """
+        Wait until OTS answers to ping (eg. after a board reboot), instead
+        of sleeping a fixed time.
+
+        Args:
+            conn_key (str): connection key.
+            timeout (float): max seconds to wait.
+
+        Returns:
+            bool: True if OTS answered before timeout, False otherwise.
+        """
+        if self.ots_client is None:
+            self.error(
+                "No OTS client created yet, unable to wait for %s" %
+                conn_key)
+            return False
+        return OtsPingProbe(self.ots_client, conn_key, timeout).wait()
+
     # LOGS METHODS
     def set_logger(self, logger):
         """
@@ -281,16 +444,28 @@ Missing %s" % level)
         if key in self.addons:
             raise KaliExceptionKeyError(
                 "Key %s already present in addons list" % key)
+        # Reusing an addon released by a previous test, if any
+        pooled = None
+        if self.addon_pool is not None:
+            pooled = self.addon_pool.acquire(addon_type, kwargs)
         # Creating new addon and setting standard object
-        new = addon_type(**kwargs)
+        new = pooled or addon_type(**kwargs)
+        new.metrics = self.metrics
+        new.addon_key = key
         if self.logger:
             new.set_logger(self.logger)
         # Adding connection Object
         if isinstance(new, KaliOtsAddOn):
             new.set_ots_client(self.ots_client, kwargs['ots_label'])
+        if pooled is not None:
+            self.addons[key] = new
+            self._addons_kwargs[key] = dict(kwargs)
+            new.debug("Addon %s (%s) reused" % (key, type(new).__name__))
+            return True
         # Running setup initialization
         if new.setup():
             self.addons[key] = new
+            self._addons_kwargs[key] = dict(kwargs)
             new.debug("Addon %s (%s) added successfully" %
                       (key, type(new).__name__))
             return True
@@ -326,6 +501,13 @@ Missing %s" % level)
         if not callable(addon.close):
             raise KaliExceptionValueError(
                 "Addon %s is not callable" % type(self.addons[key]).__name__)
+        # Giving back the addon to the pool, closed if it cannot be reused
+        if self.addon_pool is not None and key in self._addons_kwargs:
+            kwargs = self._addons_kwargs.pop(key)
+            del self.addons[key]
+            if self.addon_pool.release(type(addon), kwargs, addon):
+                addon.debug(str(addon) + " released to addon pool")
+            return True
         # Running close addon method
         if addon.close():
             addon.debug(str(addon) + " correctly removed")
@@ -450,6 +632,11 @@ Missing %s" % level)
             browser(str): either 'Firefox' or 'Chrome'. Defaults to 'Chrome'.
             download_folder(str): file download path. Defaults to 'download' in
             working dir.
+            headless(bool): run the browser headless, without virtual display.
+            Defaults to False.
+            shared_session(bool/str): attach to the browser session shared by
+            addons with the same name, browser and options, started once per
+            run and keeping cookies and login state. Defaults to False.
 
         Returns:
             bool: True if addon has been created, raise an exception otherwise.
@@ -588,7 +775,17 @@ Missing %s" % level)
         """
         if key not in self.addons:
             raise KaliExceptionKeyError("No addon found with key %s " % key)
-        result = self.addons[key].get_result(operation, **kwargs)
+        addon = self.addons[key]
+        if self.metrics is None:
+            result = addon.get_result(operation, **kwargs)
+        else:
+            record = StepRecord('check', key, operation)
+            result = False
+            try:
+                result = addon.get_result(operation, **kwargs)
+            finally:
+                self.metrics.emit(record.finish(result,
+                                                polls=addon.poll_count))
 
         if self._cur_test_case is not None:
             if not self._cur_test_case.is_closed():
@@ -634,6 +831,15 @@ Missing %s" % level)
             self.logger.debug("Starting test case %s %s" % (number, title))
             self.test_cases[(number, title)] = KaliTestResultManager()
             self._cur_test_case = self.test_cases[(number, title)]
+            self._cur_test_key = (number, title)
+            for reporter in self.reporters:
+                try:
+                    reporter.start(number, title)
+                except OSError as e:
+                    self.error("Unable to report test case %s on %s: %s" %
+                               (number, reporter.path, e))
+            if self.metrics is not None:
+                self.metrics.current_test = self._cur_test_case
             for addon_key in self.addons:
                 self.addons[addon_key].set_current_test(self._cur_test_case)
 
@@ -654,7 +860,23 @@ Missing %s" % level)
         else:
             self.logger.debug("Ending test case")
             self._cur_test_case.close()
+            self.__report(self._cur_test_key, self._cur_test_case)
             self._cur_test_case = None
+            if self.metrics is not None:
+                self.metrics.current_test = None
+
+    def __report(self, key, test_case):
+        """
+        Write a closed test case to the reporters. Reporter errors are
+        logged, they do not stop the run.
+        """
+        number, title = key
+        for reporter in self.reporters:
+            try:
+                reporter.report(number, title, test_case)
+            except OSError as e:
+                self.error("Unable to report test case %s on %s: %s" %
+                           (number, reporter.path, e))
 
     def test_case_result(self):
         """
@@ -688,29 +910,59 @@ Missing %s" % level)
             kwargs(dict): All the test needed parameters
 
         """
+        # Refused tags declared on the class skip the test before instancing
+        # it (and running its setup). Setup may add tags, so the class tags
+        # can only prove a rejection: the whole filter is checked after setup
+        if not self.check_refused_tags(KaliTestObj):
+            self.logger.skipped("TEST SKIPPED")
+            return False
+        previous_addons = set(self.addons)
         test_obj = KaliTestObj(kali=self, logger=self.logger, **kwargs)
-        try:
-            test_obj.setup()
-        except AttributeError as e:
-            self.logger.error("Something wrong in test setup: %s" % e)
-            self.close()
+        if (test_obj.test_number, test_obj.test_title) in self.skip_tests:
+            self.logger.skipped("TEST ALREADY COMPLETED")
             return False
-        if self.check_refused_tags(test_obj) and self.check_accepted_tags(test_obj):
-            if max_duration and test_obj.get_duration() > max_duration:
+        try:
+            try:
+                test_obj.setup()
+            except AttributeError as e:
+                # Kali is closed with its addons: nothing left to release
+                self.logger.error("Something wrong in test setup: %s" % e)
+                self.close()
                 return False
-            self.start_test_case(test_obj.test_number, test_obj.test_title)
-            notes = ""
-            if len(test_obj.get_notes()) > 0:
-                notes = test_obj.get_notes()
-                self.logger.info("NOTE: %s" % notes)
-            test_obj.run()
-            if notes != test_obj.get_notes():
-                self.logger.info("NOTE: %s" % test_obj.get_notes())
-            self.end_test_case()
-            return True
-        else:
-            self.logger.skipped("TEST SKIPPED")
-        return False
+            if self.is_test_allowed(test_obj.tags):
+                if max_duration and test_obj.get_duration() > max_duration:
+                    return False
+                self.start_test_case(test_obj.test_number, test_obj.test_title)
+                notes = ""
+                if len(test_obj.get_notes()) > 0:
+                    notes = test_obj.get_notes()
+                    self.logger.info("NOTE: %s" % notes)
+                test_obj.run()
+                if notes != test_obj.get_notes():
+                    self.logger.info("NOTE: %s" % test_obj.get_notes())
+                self.end_test_case()
+                return True
+            else:
+                self.logger.skipped("TEST SKIPPED")
+            return False
+        finally:
+            self.__release_addons(previous_addons)
+
+    def __release_addons(self, keep):
+        """
+        Give back to the addon pool the addons added by a test, so that the
+        next tests get them reset (no-op if the addon pool is disabled).
+
+        Args:
+            keep (set): keys of the addons to be kept.
+        """
+        if self.addon_pool is None:
+            return
+        for key in [key for key in self.addons if key not in keep]:
+            try:
+                self.remove_addon(key)
+            except KaliException as e:
+                self.error("Unable to release addon %s: %s" % (key, e))
 
     def check_refused_tags(self, test_case):
         """
@@ -719,7 +971,7 @@ Missing %s" % level)
         Params:
             test_case(obj): KaliTestCase object to be checked
         """
-        return not self.refused_tags or not any(tag in self.refused_tags for tag in test_case.tags)
+        return self.tag_filter.deny.isdisjoint(test_case.tags)
 
     def check_accepted_tags(self, test_case):
         """
@@ -728,7 +980,7 @@ Missing %s" % level)
         Params:
             test_case(obj): KaliTestCase object to be checked
         """
-        return not self.accepted_tags or all(tag in test_case.tags for tag in self.accepted_tags)
+        return self.tag_filter.allow.issubset(test_case.tags)
 
     def get_addon_by_name(self, addon_name):
         """
@@ -745,6 +997,8 @@ Missing %s" % level)
 
     def reload_addon(self, addon_name, **kwargs):
         #import pdb;pdb.set_trace()
+        if addon_name in self._addons_kwargs:
+            self._addons_kwargs[addon_name].update(kwargs)
         self.addons[addon_name].__dict__.update(**kwargs)
         # self.addons[addon_name].close()
         self.addons[addon_name].setup()
@@ -765,7 +1019,8 @@ Missing %s" % level)
 
     def prettyprint_test_cases_result(self):
         """
-        Return a pretty-printed string with results of each TestCase.
+        Return a pretty-printed string with results of each TestCase. The
+        current TestCase, if still open, is shown as running.
 
         +-------+----------+----------+
         |  NUM  |   TITLE  |  RESULT  |
@@ -779,56 +1034,36 @@ Missing %s" % level)
             str: pretty-printed string with results of each TestCase.
 
         Raises:
-            :exc:`~src.exceptions.KaliExceptionTestCase` if a TestCase is open
-            or there are no TestCases.
+            :exc:`~src.exceptions.KaliExceptionTestCase` if there are no
+            TestCases.
         """
         if not self.test_cases:
             raise KaliExceptionTestCase(
                 'Cannot print results: the are no recorded TestCases.')
-        elif self._cur_test_case and not self._cur_test_case.is_closed():
-            raise KaliExceptionTestCase(
-                'Cannot print results: the current TestCase is open.')
-
-        pretty = str()
 
         # find longest name and number
-        lmax_name = 5
-        lmax_num = 3
-        for k in self.test_cases.keys():
-            num, name = k
-            if len(str(num)) > lmax_num:
-                lmax_num = len(str(num))
-            if len(name) > lmax_name:
-                lmax_name = len(name)
+        lmax_num = max([3] + [len(str(num)) for num, _ in self.test_cases])
+        lmax_name = max([5] + [len(name) for _, name in self.test_cases])
 
         # print header
-        padding = 2
-        sep = '+' + ('-' * (lmax_num + (padding * 2))) + '+' + \
-              ('-' * (lmax_name + (padding * 2))) + '+' + \
-              ('-' * (len('result') + (padding * 2))) + '+'
-        pretty += sep + '\n'
-        pretty += '|' + (' ' * padding) + 'NUM' + \
-                  (' ' * (padding + (lmax_num - len('num')))) + '|' + \
-                  (' ' * padding) + 'TITLE' + \
-                  (' ' * (padding + (lmax_name - len('name')))) + '|' + \
-                  (' ' * padding) + 'RESULT' + (' ' * padding) + '|'
-        pretty += '\n'
-        pretty += sep + '\n'
+        padding = ' ' * 2
+        sep = '+' + '-' * (lmax_num + 4) + '+' + '-' * (lmax_name + 4) + \
+              '+' + '-' * (len('result') + 4) + '+'
+        row = '|' + padding + '%-' + str(lmax_num) + 's' + padding + '|' + \
+              padding + '%-' + str(lmax_name) + 's' + padding + '|' + \
+              padding + '%-6s' + padding + '|'
+        lines = [sep, row % ('NUM', 'TITLE', 'RESULT'), sep]
 
         # print testcases result
-        for k, test in self.test_cases.items():
-            num, name = k
-            result = 'passed' if test.result else 'failed'
-            pretty += '|' + (' ' * padding) + str(num) + \
-                      (' ' * (padding + (lmax_num - len(str(num))))) + '|' + \
-                      (' ' * padding) + name + \
-                      (' ' * (padding + (lmax_name - len(name)))) + '|' + \
-                      (' ' * padding) + result + (' ' * padding) + '|'
-            pretty += '\n'
-            pretty += sep + '\n'
-
-        pretty += '|' + (' ' * padding) + 'total' + \
-            (' ' * (padding + (lmax_num - 5)))\
-            + '|' + (' ' * padding) + str(len(self.test_cases.items()))
-
-        return pretty
+        for (num, name), test in self.test_cases.items():
+            if not test.is_closed():
+                result = 'run...'
+            else:
+                result = 'passed' if test.result else 'failed'
+            lines.append(row % (num, name, result))
+            lines.append(sep)
+
+        lines.append('|' + padding + 'total' +
+                     ' ' * (len(padding) + lmax_num - 5) + '|' + padding +
+                     str(len(self.test_cases)))
+        return '\n'.join(lines)
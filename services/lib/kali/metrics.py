@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KALI Metrics
+============
+
+Structured step records (checks, OTS round trips, WebUI actions) and the
+sinks they are written to: in memory, JSONL file, Prometheus text file.
+Sinks are thread safe: records are emitted by the test thread, the OTS
+keepalive and the async clients.
+
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class StepRecord(object):
+    """StepRecord class definition: timing of a single step.
+
+    Attributes:
+        kind (str): 'check', 'ots' or 'webui'.
+        addon (str): addon key (or OTS connection label).
+        method (str): check operation, OTS method or WebUI action.
+        start (float): monotonic start time.
+        end (float): monotonic end time.
+        result (bool): step outcome, None if not meaningful.
+        bytes_sent (int): bytes sent to OTS.
+        bytes_received (int): bytes received from OTS.
+        polls (int): checker poll iterations.
+    """
+
+    __slots__ = ('kind', 'addon', 'method', 'start', 'end', 'result',
+                 'bytes_sent', 'bytes_received', 'polls')
+
+    def __init__(self, kind, addon, method):
+        self.kind = kind
+        self.addon = addon
+        self.method = method
+        self.start = time.monotonic()
+        self.end = None
+        self.result = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.polls = 0
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+    def finish(self, result=None, bytes_sent=0, bytes_received=0, polls=0):
+        """
+        Record the end of the step.
+
+        Returns:
+            object: the record itself.
+        """
+        self.end = time.monotonic()
+        self.result = None if result is None else bool(result)
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.polls = polls
+        return self
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MetricsSink(object):
+    """Metrics sink abstract class: emit, flush and close are serialized by
+    the sink lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        raise NotImplementedError("emit method not overridden")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemorySink(MetricsSink):
+    """Keep the last records in memory.
+
+    Args:
+        maxlen (int): max number of records kept, None for unbounded.
+    """
+
+    def __init__(self, maxlen=None):
+        MetricsSink.__init__(self)
+        self.records = deque(maxlen=maxlen)
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self):
+        """
+        Returns:
+            list: copy of the records kept.
+        """
+        with self._lock:
+            return list(self.records)
+
+
+class JsonlSink(MetricsSink):
+    """Append one JSON line per record to a file.
+
+    Args:
+        path (str): output file.
+        flush_every (int): flush the file every flush_every records.
+    """
+
+    def __init__(self, path, flush_every=1):
+        MetricsSink.__init__(self)
+        self.path = path
+        self.flush_every = flush_every
+        self._pending = 0
+        self._fp = open(path, 'a')
+
+    def emit(self, record):
+        line = json.dumps(record.to_dict()) + '\n'
+        with self._lock:
+            if self._fp.closed:
+                return
+            self._fp.write(line)
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self.__flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._fp.closed:
+                self.__flush()
+
+    def close(self):
+        with self._lock:
+            if not self._fp.closed:
+                self.__flush()
+                self._fp.close()
+
+    def __flush(self):
+        self._pending = 0
+        self._fp.flush()
+
+
+class PrometheusSink(MetricsSink):
+    """Aggregate records by kind, addon and method and write them as a
+    Prometheus text file (eg. for node_exporter textfile collector).
+
+    Args:
+        path (str): output file, replaced atomically.
+        interval (float): min seconds between two writes, the file is
+            always written on close.
+    """
+
+    _COUNTERS = (
+        ('kali_steps_total', 'Number of steps', None),
+        ('kali_step_failures_total', 'Number of failed steps', None),
+        ('kali_step_seconds_total', 'Time spent in steps', 'duration'),
+        ('kali_bytes_sent_total', 'Bytes sent to OTS', 'bytes_sent'),
+        ('kali_bytes_received_total', 'Bytes received from OTS',
+         'bytes_received'),
+        ('kali_poll_iterations_total', 'Checker poll iterations', 'polls'),
+    )
+
+    def __init__(self, path, interval=1.0):
+        MetricsSink.__init__(self)
+        self.path = path
+        self.interval = interval
+        self.totals = {}
+        self._written = 0.0
+
+    def emit(self, record):
+        labels = (record.kind, record.addon, record.method)
+        with self._lock:
+            totals = self.totals.get(labels)
+            if totals is None:
+                totals = self.totals[labels] = [0] * len(self._COUNTERS)
+            totals[0] += 1
+            totals[1] += record.result is False
+            for index, (_, _, attribute) in enumerate(self._COUNTERS[2:], 2):
+                totals[index] += getattr(record, attribute) or 0
+            if time.monotonic() - self._written >= self.interval:
+                self.__flush()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: copy of the counters, indexed by (kind, addon, method).
+        """
+        with self._lock:
+            return {labels: list(totals)
+                    for labels, totals in self.totals.items()}
+
+    def flush(self):
+        with self._lock:
+            self.__flush()
+
+    def __flush(self):
+        lines = []
+        for index, (name, description, _) in enumerate(self._COUNTERS):
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s counter' % name)
+            for (kind, addon, method), totals in sorted(self.totals.items()):
+                lines.append('%s{kind="%s",addon="%s",method="%s"} %s' % (
+                    name, _escape(kind), _escape(addon), _escape(method),
+                    totals[index]))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+        self._written = time.monotonic()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class Metrics(object):
+    """Metrics class definition: dispatch step records to the current test
+    case and to the sinks.
+
+    Attributes:
+        sinks (list): :class:`MetricsSink` objects.
+        current_test (object): :class:`~src.test_case.KaliTestResultManager`
+            collecting the steps, None between test cases.
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self.current_test = None
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+
+    def emit(self, record):
+        """
+        Args:
+            record (object): finished :class:`StepRecord`.
+        """
+        if self.current_test is not None and \
+                not self.current_test.is_closed():
+            self.current_test.add_step(record)
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def timed_action(method):
+    """
+    Decorator recording an addon method as a step, when the addon has a
+    metrics object. Actions called by another timed action are part of its
+    step and are not recorded on their own.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None or self._timed_action:
+            return method(self, *args, **kwargs)
+        record = StepRecord(self.addon_type or type(self).__name__,
+                            self.addon_key, method.__name__)
+        result = None
+        self._timed_action = True
+        try:
+            result = method(self, *args, **kwargs)
+            return result
+        finally:
+            self._timed_action = False
+            metrics.emit(record.finish(result))
+    return wrapper
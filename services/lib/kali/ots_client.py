@@ -5,19 +5,103 @@ OMNIA TESTING SERVER CLIENT
 ===========================
 
 """
+import contextlib
 import json
+import random
 import socket
+import threading
+import time
 
 from .exceptions import KaliExceptionOtsConnection
 from .exceptions import KaliExceptionOtsInvalidHeader
 from .exceptions import KaliExceptionValueError
 
+from .metrics import StepRecord
+
 from .COMMON.TLV import TLV
+from .COMMON.TLV import APDU2TLV
 from .protocol_header import check_header
 from .protocol_header import create_header
+from .protocol_header import decode_header
 
 SOCK_TIMEOUT = 60
 MAX_PACKET_SIZE = 65536
+PIPELINE_DEPTH = 16
+JSON_FORMAT_CODE = 0x00
+# Reconnection backoff: first delay, max delay (seconds), randomized by
+# RECONNECT_JITTER so that many clients do not retry in lockstep
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+RECONNECT_JITTER = 0.5
+# Max seconds an idempotent request waits for the connection to come back
+RECONNECT_TIMEOUT = 180.0
+# Idle seconds after which a connection is pinged (None to disable)
+KEEPALIVE_INTERVAL = 30.0
+# A round trip younger than this proves the connection alive (seconds)
+LIVENESS_TTL = 2.0
+# Connections kept open to each OTS (ip, port), and max opened at once
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 4
+# Idle seconds after which connections above POOL_MIN_SIZE are closed
+POOL_IDLE_TIMEOUT = 300.0
+# Max seconds a request waits for a free connection
+POOL_CHECKOUT_TIMEOUT = SOCK_TIMEOUT
+
+
+def backoff_delay(attempts):
+    """
+        Delay before a reconnection attempt: exponential in the number of
+        failed attempts, capped and jittered
+
+        Args:
+            attempts (int): failed attempts so far
+        Returns:
+            float: seconds
+    """
+    delay = min(RECONNECT_MAX_DELAY,
+                RECONNECT_BASE_DELAY * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(1 - RECONNECT_JITTER, 1)
+
+
+def read_header_length(raw_header):
+    """
+        Validate a raw E0 header and return the length of the data following
+
+        Args:
+            raw_header (bytes): header received (tag, length and value)
+        Returns:
+            int: data length
+        Raises:
+            KaliExceptionOtsInvalidHeader:
+             :exc:`~src.exceptions.KaliExceptionOtsInvalidHeader`
+                if the header is not valid
+    """
+    decoded = decode_header(raw_header)
+    if decoded is not None:
+        data_length, code = decoded
+        if code != JSON_FORMAT_CODE:
+            raise KaliExceptionOtsInvalidHeader(
+                "Invalid header: unexpected format %02X" % code)
+        return data_length
+    # Unusual layout, falling back to generic TLV parsing
+    try:
+        tag, length, value = APDU2TLV(raw_header, 0)[0]
+        header = TLV(tag, value, length)
+        fields = APDU2TLV(value, 0)
+    except IndexError:
+        raise KaliExceptionOtsInvalidHeader(
+            "Invalid header: %s" % bytes(raw_header).hex())
+    if len(fields) != 2:
+        raise KaliExceptionOtsInvalidHeader(
+            "Invalid header: %s" % header.getTag())
+    len_tlv = TLV(fields[0][0], fields[0][2], fields[0][1])
+    format_tlv = TLV(fields[1][0], fields[1][2], fields[1][1])
+
+    if not (check_header(header) and check_header(
+            len_tlv) and check_header(format_tlv)):
+        raise KaliExceptionOtsInvalidHeader(
+            "Invalid header: %s" % header.getTag())
+    return int.from_bytes(len_tlv.getVal(), byteorder='big')
 
 
 class ConnectionHandler(object):
@@ -29,13 +113,31 @@ class ConnectionHandler(object):
             port      (int): ots port
             socket    (object): socket object
             connected (bool): connection status
+            bytes_sent     (int): bytes sent since creation
+            bytes_received (int): bytes received since creation
+            auto_reconnect (bool): reconnect lost connections, with jittered
+                exponential backoff between attempts
+            lock      (object): serializes the round trips on the socket and
+                the connection state changes
+            last_activity (float): monotonic time of the last round trip
     """
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, auto_reconnect=True):
         self.ip = ip
         self.port = port
         self.socket = None
         self.connected = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.auto_reconnect = auto_reconnect
+        self.lock = threading.RLock()
+        # notified at the end of each reconnection attempt
+        self._attempt_done = threading.Condition(self.lock)
+        self._connecting = False
+        self.last_activity = None
+        self._attempts = 0
+        self._next_attempt = 0.0
+        self._closed = False
         self.connect(ip, port)
 
     def connect(self, ip, port):
@@ -55,20 +157,56 @@ class ConnectionHandler(object):
         """
         if self.connected:
             return True
+        sock = self._open(ip, port)
+        with self.lock:
+            if self.connected:
+                sock.close()
+                return True
+            self.ip, self.port = ip, port
+            self._attach(sock)
+        return True
+
+    @staticmethod
+    def _open(ip, port):
+        """
+           Open a connected socket, without touching the connection state
+           (the connection lock is not needed)
+        """
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(SOCK_TIMEOUT)
-            self.socket.connect((str(ip), int(port)))
-            self.connected = True
+            address = (str(ip), int(port))
         except ValueError as e:
             raise KaliExceptionValueError(e)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(SOCK_TIMEOUT)
+        try:
+            sock.connect(address)
         except (OSError, socket.timeout) as e:
+            sock.close()
             raise KaliExceptionOtsConnection("Connection refused: %s" % e)
-        return True
+        return sock
+
+    def _attach(self, sock):
+        """
+           Use a socket opened by _open, under the connection lock
+        """
+        self.socket = sock
+        self.connected = True
+        self._closed = False
+        self.last_activity = time.monotonic()
+        self._attempts = 0
+        self._next_attempt = 0.0
 
     def disconnect(self):
         """
-           Close socket
+           Close socket, the connection is not reestablished automatically
+           until connect or reconnect is called
+        """
+        self._closed = True
+        self._drop()
+
+    def _drop(self):
+        """
+           Close the socket of a lost connection
         """
         self.connected = False
         self.socket.close()
@@ -78,6 +216,94 @@ class ConnectionHandler(object):
             self.disconnect()
         return self.connect(self.ip, self.port)
 
+    def backoff_delay(self):
+        """
+            Delay before the next reconnection attempt, see
+            :func:`backoff_delay`
+
+            Returns:
+                float: seconds
+        """
+        return backoff_delay(self._attempts)
+
+    def try_reconnect(self, blocking=True):
+        """
+            Attempt a reconnection, unless the backoff delay since the last
+            failed attempt has not elapsed yet. If another thread is already
+            attempting it, its outcome is returned. The state is checked and
+            updated under the connection lock, the socket is connected out
+            of it: a round trip is not blocked up to SOCK_TIMEOUT by another
+            thread connecting.
+
+            Args:
+                blocking (bool): wait for the connection lock and for the
+                    attempt of another thread, if False give up instead
+            Returns:
+                bool: True if connected
+        """
+        if not self.lock.acquire(blocking=blocking):
+            return False
+        try:
+            if self._connecting:
+                if not blocking:
+                    return False
+                while self._connecting:
+                    self._attempt_done.wait()
+                return self.connected
+            if self.connected:
+                return True
+            if not self.auto_reconnect or self._closed or \
+                    time.monotonic() < self._next_attempt:
+                return False
+            self._connecting = True
+        finally:
+            self.lock.release()
+        try:
+            sock = self._open(self.ip, self.port)
+        except KaliExceptionOtsConnection:
+            sock = None
+        with self.lock:
+            self._connecting = False
+            self._attempt_done.notify_all()
+            if sock is None:
+                self._attempts += 1
+                self._next_attempt = time.monotonic() + self.backoff_delay()
+                return False
+            if self.connected or self._closed:
+                sock.close()
+                return self.connected
+            self._attach(sock)
+            return True
+
+    def wait_reconnect(self, timeout=RECONNECT_TIMEOUT):
+        """
+            Reconnect, retrying with backoff until timeout (eg. while the
+            board reboots). The connection lock is released while waiting.
+
+            Args:
+                timeout (float): max seconds to wait
+            Returns:
+                bool: True if connected
+        """
+        deadline = time.monotonic() + timeout
+        while not self.try_reconnect():
+            with self.lock:
+                if self.connected:
+                    return True
+                if not self.auto_reconnect or self._closed:
+                    return False
+                now = time.monotonic()
+                if self._connecting:
+                    # another thread is attempting: wait for its outcome
+                    if now >= deadline:
+                        return False
+                    self._attempt_done.wait(deadline - now)
+                elif self._next_attempt > deadline:
+                    return False
+                else:
+                    self._attempt_done.wait(max(self._next_attempt - now, 0))
+        return True
+
     def is_connected(self):
         """
            Check if socket is connected
@@ -87,12 +313,147 @@ class ConnectionHandler(object):
         """
         return self.connected
 
-    def communicate(self, json_):
+    def is_alive(self, max_age=LIVENESS_TTL):
+        """
+           Check if a round trip succeeded in the last max_age seconds, no
+           need to ping the server again
+
+            Returns:
+                bool: True if the connection is known alive
+        """
+        return self.connected and self.last_activity is not None and \
+            time.monotonic() - self.last_activity < max_age
+
+    def idle_time(self):
+        if self.last_activity is None:
+            return None
+        return time.monotonic() - self.last_activity
+
+    def _recv_into(self, view):
+        """
+            Fill the given memoryview with data read from socket
+
+            Args:
+                view (memoryview): writable buffer to be filled
+            Raises:
+                OSError: if socket is closed by peer
+        """
+        received = 0
+        size = len(view)
+        while received < size:
+            chunk = self.socket.recv_into(
+                view[received:received + MAX_PACKET_SIZE])
+            if chunk == 0:
+                # If no data received, socket is disconnected
+                raise OSError("Connection closed by peer")
+            received += chunk
+        self.bytes_received += received
+        return received
+
+    def _recv_exactly(self, size):
+        """
+            Read exactly size bytes from socket into a preallocated buffer
+
+            Args:
+                size (int): number of bytes to be read
+            Returns:
+                bytearray: data read
+        """
+        buffer = bytearray(size)
+        self._recv_into(memoryview(buffer))
+        return buffer
+
+    def _recv_header(self):
+        """
+            Read the E0 header TLV from socket
+
+            Returns:
+                bytes: raw header (tag, length and value)
+        """
+        # Header tag is a single byte (E0), followed by first length byte
+        header = self._recv_exactly(2)
+        length = header[1]
+        if length & 0x80:
+            len_bytes = self._recv_exactly(length & 0x7F)
+            header += len_bytes
+            length = int.from_bytes(len_bytes, byteorder='big')
+        header += self._recv_exactly(length)
+        return bytes(header)
+
+    def _send_request(self, json_):
+        """
+            Send a json request, prefixed by its header
+
+            Args:
+                json_ (str): json data to be sent
+        """
+        data = create_header(len(json_), 'json') + json_.encode()
+        self.socket.sendall(data)
+        self.bytes_sent += len(data)
+
+    def _recv_response(self):
+        """
+            Read a single framed response from socket
+
+            Returns:
+                str: server response
+            Raises:
+                KaliExceptionOtsInvalidHeader:
+                 :exc:`~src.exceptions.KaliExceptionOtsInvalidHeader`
+                    if the header received is not valid
+        """
+        data_length = read_header_length(self._recv_header())
+        # receiving data
+        if data_length == 0:
+            # If no data received, socket is disconnected
+            raise OSError
+        return self._recv_exactly(data_length).decode()
+
+    def _round_trip(self, function, retry):
+        """
+            Run a round trip under the connection lock, reconnecting a lost
+            connection first. When the round trip fails the connection is
+            dropped: an idempotent request (retry True) waits for the
+            reconnection and is sent again, others fail at once and the
+            connection is reestablished by the next round trip (or the
+            keepalive). After an invalid header the stream is out of sync
+            (the rest of the reply and the replies still in flight are
+            unread), the connection is dropped too.
+        """
+        with self.lock:
+            if not self.connected and not (
+                    self.wait_reconnect() if retry else self.try_reconnect()):
+                raise KaliExceptionOtsConnection(
+                    "Communication error: not connected to %s:%s" %
+                    (self.ip, self.port))
+            try:
+                try:
+                    response = function()
+                except (OSError, BrokenPipeError) as e:
+                    self._drop()
+                    if not retry or not self.wait_reconnect():
+                        raise KaliExceptionOtsConnection(
+                            "Communication error: %s" % e)
+                    try:
+                        response = function()
+                    except (OSError, BrokenPipeError) as e:
+                        self._drop()
+                        raise KaliExceptionOtsConnection(
+                            "Communication error: %s" % e)
+            except KaliExceptionOtsInvalidHeader:
+                self._drop()
+                raise
+            self.last_activity = time.monotonic()
+            return response
+
+    def communicate(self, json_, retry=False):
         """
             Send a json to server and wait for answer
 
             Args:
                 json_ (str): json data to be sent
+                retry (bool): the request is idempotent, send it again if
+                    the connection is lost before the answer
             Returns:
                 str: server response
             Raises:
@@ -100,50 +461,298 @@ class ConnectionHandler(object):
                  :exc:`~src.exceptions.KaliExceptionKeyError`
                     if communication error
         """
-        header = TLV()
+        def round_trip():
+            self._send_request(json_)
+            return self._recv_response()
+        return self._round_trip(round_trip, retry)
+
+    def communicate_many(self, json_list, depth=PIPELINE_DEPTH, retry=False):
+        """
+            Send several jsons back-to-back and collect the answers.
+
+            OTS answers requests of a connection in the order they are
+            received, so responses are matched to requests by position. At
+            most `depth` requests are in flight at the same time, so neither
+            side can block on a full socket buffer.
+
+            Args:
+                json_list (list): json data to be sent
+                depth     (int):  max number of requests waiting for answer
+                retry     (bool): the requests are idempotent, send the
+                    whole batch again if the connection is lost
+            Returns:
+                list: server responses, in the same order of json_list
+            Raises:
+                KaliOtsConnectionException:
+                 :exc:`~src.exceptions.KaliExceptionKeyError`
+                    if communication error
+        """
+        if depth < 1:
+            raise KaliExceptionValueError(
+                "Pipeline depth must be at least 1, not %s" % depth)
+
+        def round_trip():
+            responses = []
+            sent = 0
+            while len(responses) < len(json_list):
+                while sent < len(json_list) and sent - len(responses) < depth:
+                    self._send_request(json_list[sent])
+                    sent += 1
+                responses.append(self._recv_response())
+            return responses
+        return self._round_trip(round_trip, retry)
+
+
+class ConnectionPool(object):
+    """
+        ConnectionPool class definition. Connections to a single ots shared
+        by every label on the same (ip, port): each round trip checks out a
+        free connection, so requests of different threads (eg. addons) run
+        in parallel on their own sockets.
+
+        Args:
+            ip        (str): ots ip address
+            port      (int): ots port
+            min_size  (int): connections kept open, the first one is opened
+                immediately
+            max_size  (int): max connections open at the same time
+            idle_timeout (float): idle seconds after which connections above
+                min_size are closed
+        Raises:
+            KaliOtsConnectionException:
+             :exc:`~src.exceptions.KaliOtsConnectionException`
+                if connection refused
+    """
+
+    def __init__(self, ip, port, min_size=POOL_MIN_SIZE,
+                 max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        if not 1 <= min_size <= max_size:
+            raise KaliExceptionValueError(
+                "Invalid pool size: min %s, max %s" % (min_size, max_size))
+        self.ip = ip
+        self.port = port
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._condition = threading.Condition()
+        # idle connections, last checked in last, with checkin time
+        self._idle = []
+        # connections, None for the ones being opened by checkout
+        self._all = []
+        self._closed = False
+        # bytes of the connections already closed
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        for _ in range(min_size):
+            self.__add(ConnectionHandler(ip, port))
+
+    def __add(self, connection):
+        self._all.append(connection)
+        self._idle.append((connection, time.monotonic()))
+
+    def __remove(self, connection):
+        self._all.remove(connection)
+        self._bytes_sent += connection.bytes_sent
+        self._bytes_received += connection.bytes_received
+        if connection.is_connected():
+            connection.disconnect()
+
+    @property
+    def size(self):
+        return len(self._all)
+
+    @property
+    def bytes_sent(self):
+        with self._condition:
+            return self._bytes_sent + sum(c.bytes_sent
+                                          for c in self.connections())
+
+    @property
+    def bytes_received(self):
+        with self._condition:
+            return self._bytes_received + sum(c.bytes_received
+                                              for c in self.connections())
+
+    def checkout(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        """
+            Take a connection: an idle one (connected first), a new one if
+            the pool is not full, otherwise wait for a checkin
+
+            Args:
+                timeout (float): max seconds to wait for a free connection
+            Returns:
+                object: ConnectionHandler object, give it back with checkin
+            Raises:
+                KaliOtsConnectionException:
+                 :exc:`~src.exceptions.KaliOtsConnectionException`
+                    if no connection is available in time, or if the pool
+                    is closed
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise KaliExceptionOtsConnection(
+                        "Pool of %s:%s closed" % (self.ip, self.port))
+                if self._idle:
+                    # the most recently used connection is the most likely
+                    # alive one
+                    connected = [entry for entry in self._idle
+                                 if entry[0].is_connected()]
+                    entry = (connected or self._idle)[-1]
+                    self._idle.remove(entry)
+                    return entry[0]
+                if len(self._all) < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise KaliExceptionOtsConnection(
+                        "No free connection to %s:%s" % (self.ip, self.port))
+            # reserving the slot while connecting out of the lock
+            self._all.append(None)
+        try:
+            connection = ConnectionHandler(self.ip, self.port)
+        except Exception:
+            with self._condition:
+                self._all.remove(None)
+                self._condition.notify()
+            raise
+        with self._condition:
+            if self._closed:
+                # closed while connecting: the connection is not installed
+                self._all.remove(None)
+                connection.disconnect()
+                raise KaliExceptionOtsConnection(
+                    "Pool of %s:%s closed" % (self.ip, self.port))
+            self._all[self._all.index(None)] = connection
+        return connection
+
+    def checkin(self, connection):
+        """
+            Give back a connection taken with checkout
+
+            Args:
+                connection (object): ConnectionHandler object
+        """
+        with self._condition:
+            if connection in self._all:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+            self.__expire()
 
-        json_ = create_header(len(json_), 'json') + json_.encode()
-        sent = 0
+    @contextlib.contextmanager
+    def connection(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        """
+            Context manager checking out a connection and checking it in
+        """
+        connection = self.checkout(timeout)
         try:
-            # sending data
-            while sent < len(json_):
-                sent = self.socket.send(json_[sent:])
-            # receiving header
-            while not header.complete:
-                byte = self.socket.recv(1)
-                header.populate(byte)
-
-            len_tlv = TLV()
-            i = 0
-            while not len_tlv.complete:
-                byte = header.getVal()[i:i + 1]
-                i += 1
-                len_tlv.populate(byte)
-
-            format_tlv = TLV()
-            i = len(len_tlv.hexdump())
-            while not format_tlv.complete:
-                byte = header.getVal()[i:i + 1]
-                i += 1
-                format_tlv.populate(byte)
-
-            if not (check_header(header) and check_header(
-                    len_tlv) and check_header(format_tlv)):
-                raise KaliExceptionOtsInvalidHeader(
-                    "Invalid header: %s" % header.getTag())
-            # receiving data
-            data_length = int.from_bytes(len_tlv.getVal(), byteorder='big')
-            data = b''
-            while len(data) < data_length:
-                data += self.socket.recv(1)
-            if len(data) == 0:
-                # If no data received, socket is disconnected
-                raise OSError
-            if data:
-                return data.decode()
-        except (OSError, BrokenPipeError) as e:
-            self.disconnect()
-            raise KaliExceptionOtsConnection("Communication error: %s" % e)
+            yield connection
+        finally:
+            self.checkin(connection)
+
+    def __expire(self):
+        if self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        for entry in list(self._idle):
+            if len(self._all) <= self.min_size:
+                break
+            if entry[1] < deadline:
+                self._idle.remove(entry)
+                self.__remove(entry[0])
+
+    def expire(self):
+        """
+            Close the connections above min_size idle for more than
+            idle_timeout
+        """
+        with self._condition:
+            self.__expire()
+
+    def idle_connections(self):
+        """
+            Returns:
+                list: idle ConnectionHandler objects (snapshot)
+        """
+        with self._condition:
+            return [connection for connection, _ in self._idle]
+
+    def connections(self):
+        """
+            Returns:
+                list: all ConnectionHandler objects (snapshot)
+        """
+        with self._condition:
+            return [connection for connection in self._all
+                    if connection is not None]
+
+    def communicate(self, json_, retry=False):
+        """
+            See :meth:`ConnectionHandler.communicate`
+        """
+        with self.connection() as connection:
+            return connection.communicate(json_, retry)
+
+    def communicate_many(self, json_list, depth=PIPELINE_DEPTH, retry=False):
+        """
+            See :meth:`ConnectionHandler.communicate_many`
+        """
+        with self.connection() as connection:
+            return connection.communicate_many(json_list, depth, retry)
+
+    def connect(self):
+        """
+            Reopen the connections closed by disconnect
+        """
+        for connection in self.connections():
+            connection.connect(self.ip, self.port)
+        return True
+
+    def disconnect(self):
+        for connection in self.connections():
+            if connection.is_connected():
+                connection.disconnect()
+
+    def reconnect(self):
+        for connection in self.connections():
+            connection.reconnect()
+        return True
+
+    def is_connected(self):
+        """
+            Check if the pool has a connected connection, without round
+            trips nor reconnections
+
+            Returns:
+                bool: True if connected, False otherwise
+        """
+        return any(c.is_connected() for c in self.connections())
+
+    def try_reconnect(self):
+        """
+            Reestablish the lost connections whose backoff delay has
+            elapsed, see :meth:`ConnectionHandler.try_reconnect`
+
+            Returns:
+                bool: True if the pool has a connected connection
+        """
+        connections = self.connections()
+        return any([c.try_reconnect() for c in connections])
+
+    def is_alive(self, max_age=LIVENESS_TTL):
+        return any(c.is_alive(max_age) for c in self.connections())
+
+    def close(self):
+        """
+            Close all the connections, the pool cannot be used anymore
+        """
+        with self._condition:
+            self._closed = True
+            for connection in self.connections():
+                self.__remove(connection)
+            self._idle = []
+            self._condition.notify_all()
 
 
 class OtsClient(object):
@@ -152,15 +761,41 @@ class OtsClient(object):
 
         Attributes:
             logger (object): logger object.
-            connections (dict): dict of `~src.ots_client.ConnectionHandler`
+            connections (dict): dict of `~src.ots_client.ConnectionPool`
+                indexed by connection key, keys on the same (ip, port) share
+                the pool
+            pools (dict): dict of `~src.ots_client.ConnectionPool` indexed
+                by (ip, port)
+            metrics (object): :class:`~src.metrics.Metrics` object receiving
+                a step record for each round trip, None to disable
+            keepalive (float): idle seconds after which connections are
+                pinged by a background thread, which also reconnects lost
+                connections. None to disable.
+
+        The first connection (key, ip, port) is opened at creation, unless
+        key is None. A key disconnected with disconnect cannot send until
+        connect or reconnect, the other keys sharing its pool are not
+        affected.
     """
 
-    def __init__(self, key, ip, port, logger):
+    def __init__(self, key=None, ip=None, port=None, logger=None,
+                 keepalive=KEEPALIVE_INTERVAL):
         self.logger = logger
         self.connections = {}
-        self.connect(key, ip, port)
+        self.pools = {}
+        self.metrics = None
+        self.keepalive = keepalive
+        self._keepalive_thread = None
+        self._keepalive_stop = threading.Event()
+        # keys disconnected by disconnect
+        self._disconnected = set()
+        if key is not None:
+            self.connect(key, ip, port)
+        if keepalive:
+            self.start_keepalive()
 
-    def send(self, key_label, interface, method, argument_dic=None):
+    def send(self, key_label, interface, method, argument_dic=None,
+             idempotent=False):
         """
             Send a json command to specified ots and wait for response
 
@@ -169,6 +804,8 @@ class OtsClient(object):
                 interface    (str):  target interface on ots
                 method       (str):  method of interface to be executed
                 argument_dic (dict): dict containing method arguments
+                idempotent   (bool): the command can be executed twice: if
+                    the connection is lost, wait for it and send it again
             Returns:
                 str: ots response
         """
@@ -181,18 +818,101 @@ class OtsClient(object):
         json_to_send = self.json_pack(**to_send)
         self.debug("Sending %s to %s" % (method, interface))
         self.debug(json_to_send)
+        if key_label in self._disconnected:
+            self.error("Connection %s is disconnected" % key_label)
+            return False
+        pool = self.connections[key_label]
+        step = None
         try:
-
-            returned = self.connections[key_label].communicate(json_to_send)
+            with pool.connection() as connection:
+                step = self._start_step(key_label, method, connection)
+                returned = connection.communicate(json_to_send,
+                                                  retry=idempotent)
         except KaliExceptionOtsConnection:
             self.error("Unable to communicate with %s" % key_label)
+            self._end_step(step, False)
             return False
         except KaliExceptionOtsInvalidHeader as e:
             self.error(e)
+            self._end_step(step, False)
             return False
+        self._end_step(step, True)
         self.debug("Omnia Test Server respond: %s" % returned)
         return self.json_unpack(returned, interface, method)
 
+    def send_many(self, key_label, commands, depth=PIPELINE_DEPTH,
+                  idempotent=False):
+        """
+            Send several json commands to specified ots in pipeline and wait
+            for all the responses
+
+            Args:
+                key_label (str):  connection key
+                commands  (list): list of (interface, method, argument_dic)
+                    tuples, argument_dic may be omitted
+                depth     (int):  max number of requests waiting for answer
+                idempotent (bool): the commands can be executed twice, see
+                    send
+            Returns:
+                list: ots responses, in the same order of commands. The whole
+                    list is False if the communication fails.
+        """
+        to_send = []
+        for command in commands:
+            interface, method = command[0], command[1]
+            argument_dic = command[2] if len(command) > 2 else None
+            to_send.append(self.json_pack(interface=interface,
+                                          method=method,
+                                          argument_dic=argument_dic))
+            self.debug("Queuing %s to %s" % (method, interface))
+        if key_label in self._disconnected:
+            self.error("Connection %s is disconnected" % key_label)
+            return False
+        pool = self.connections[key_label]
+        step = None
+        try:
+            with pool.connection() as connection:
+                step = self._start_step(key_label, 'send_many', connection)
+                returned = connection.communicate_many(to_send, depth,
+                                                       retry=idempotent)
+        except KaliExceptionOtsConnection:
+            self.error("Unable to communicate with %s" % key_label)
+            self._end_step(step, False)
+            return False
+        except KaliExceptionOtsInvalidHeader as e:
+            self.error(e)
+            self._end_step(step, False)
+            return False
+        self._end_step(step, True)
+        self.debug("Omnia Test Server respond to %d commands" % len(returned))
+        return [self.json_unpack(response, command[0], command[1])
+                for response, command in zip(returned, commands)]
+
+    def _start_step(self, key_label, method, connection):
+        """
+            Open a step record for a round trip, if metrics are enabled
+
+            Args:
+                key_label  (str): connection key
+                method     (str): ots method
+                connection (object): connection used for the round trip
+            Returns:
+                tuple: (record, connection, bytes sent, bytes received)
+                    before the round trip, None if metrics are disabled
+        """
+        if self.metrics is None:
+            return None
+        return (StepRecord('ots', key_label, method), connection,
+                connection.bytes_sent, connection.bytes_received)
+
+    def _end_step(self, step, result):
+        if step is None:
+            return
+        record, connection, sent, received = step
+        self.metrics.emit(record.finish(result,
+                                        connection.bytes_sent - sent,
+                                        connection.bytes_received - received))
+
     def json_pack(self, **kwargs):
         """
             Format the arguments in function of ots json protocol
@@ -253,32 +973,65 @@ class OtsClient(object):
                             self.error('Problem in response')
         return False
 
-    def connect(self, key, ip, port):
+    def connect(self, key, ip, port, min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE):
         """
-           Connect to ots
+           Connect to ots: the key is bound to the connection pool of
+           (ip, port), created if needed
 
             Args:
                 key  (str): connection key
                 ip   (str): ots ip address
                 port (int): ots port
+                min_size (int): connections kept open, for a new pool
+                max_size (int): max connections open, for a new pool
             Returns:
-                object: ConnectionHandler object
+                object: ConnectionPool object
         """
         self.debug("Connecting to: %s:%s" % (ip, port))
-        if key not in self.connections:
+        try:
+            address = (str(ip), int(port))
+        except ValueError as e:
+            raise KaliExceptionValueError(e)
+        pool = self.pools.get(address)
+        if pool is None:
             self.debug("Creating new connection %s" % key)
-            conn = ConnectionHandler(ip, port)
+            pool = ConnectionPool(ip, port, min_size, max_size)
+            self.pools[address] = pool
+            self.debug("New Connection Started")
+        elif self.connections.get(key) is pool:
+            pool.connect()
+        previous = self.connections.get(key)
+        self.connections[key] = pool
+        self._disconnected.discard(key)
+        if previous is not None and previous is not pool:
+            self.__release_pool(previous)
+        return pool
 
-            if conn.is_connected():
-                self.connections[key] = conn
-                self.debug("New Connection Started")
-                return conn
-        else:
-            self.connections[key].connect(ip, port)
+    def __release_pool(self, pool):
+        """
+           Close a pool no longer used by any key
+        """
+        if any(used is pool for used in self.connections.values()):
+            return
+        pool.close()
+        self.pools = {address: used for address, used in self.pools.items()
+                      if used is not pool}
+
+    def __shared(self, key):
+        """
+           Check if other keys not disconnected use the pool of key
+        """
+        pool = self.connections[key]
+        return any(used is pool and other != key and
+                   other not in self._disconnected
+                   for other, used in self.connections.items())
 
     def disconnect(self, key):
         """
-           Connect to ots
+           Disconnect the key from ots until connect or reconnect. The
+           connections of its pool are closed only if no other key uses
+           them, see disconnect_pool
 
             Args:
                 key  (str): connection key
@@ -288,33 +1041,65 @@ class OtsClient(object):
         self.debug("Disconnecting from: %s" % key)
         if key not in self.connections:
             self.error("Key %s not present in connection dictionary" % key)
-        else:
+            return False
+        if not self.__shared(key):
             self.connections[key].disconnect()
+        self._disconnected.add(key)
+        return True
+
+    def disconnect_pool(self, key):
+        """
+           Close the connections of the pool of key, for every key sharing
+           it (eg. before rebooting the board): they stay closed until
+           connect or reconnect
+
+            Args:
+                key  (str): connection key
+            Returns:
+                bool: True if disconnection has been done properly
+        """
+        self.debug("Disconnecting all the connections of: %s" % key)
+        if key not in self.connections:
+            self.error("Key %s not present in connection dictionary" % key)
+            return False
+        self.connections[key].disconnect()
+        return True
 
     def close(self, key):
         """
-           Close connection to specified ots
+           Close connection to specified ots, the pool is closed when no
+           other key uses it
 
             Args:
                 key  (str): connection key
         """
         self.debug('Closing connection %s' % key)
-        self.disconnect(key)
-        del self.connections[key]
+        if key not in self.connections:
+            self.error("Key %s not present in connection dictionary" % key)
+            return
+        self._disconnected.discard(key)
+        self.__release_pool(self.connections.pop(key))
 
     def reconnect(self, key):
         """
-           Reconnect to specified ots
+           Reconnect to specified ots. The connections of its pool are
+           reopened from scratch only if no other key uses them, otherwise
+           only the closed ones are reopened
 
             Args:
                 key  (str): connection key
         """
         self.debug("Reconnecting connection %s" % key)
-        self.connections[key].reconnect()
+        shared = self.__shared(key)
+        self._disconnected.discard(key)
+        if shared:
+            return self.connections[key].connect()
+        return self.connections[key].reconnect()
 
     def is_connected(self, key):
         """
-           Check if specified ots is connected
+           Check if specified ots is connected, without round trips nor
+           reconnections
 
             Args:
                 key  (str): connection key
@@ -322,33 +1107,114 @@ class OtsClient(object):
                 bool: True if ots is connected, False otherwise
         """
         try:
-            return self.connections[key].is_connected()
+            pool = self.connections[key]
         except KeyError:
             self.error("Connection key %s doesn't exist" % key)
             return False
+        return key not in self._disconnected and pool.is_connected()
 
-    def check_connection(self, key):
+    def try_reconnect(self, key):
         """
-           Check if specified ots is connected
+           Reestablish the lost connections of specified ots whose backoff
+           delay has elapsed (eg. before sending a command)
 
             Args:
                 key  (str): connection key
             Returns:
                 bool: True if ots is connected, False otherwise
         """
+        try:
+            pool = self.connections[key]
+        except KeyError:
+            self.error("Connection key %s doesn't exist" % key)
+            return False
+        return key not in self._disconnected and pool.try_reconnect()
+
+    def check_connection(self, key, max_age=LIVENESS_TTL):
+        """
+           Check if specified ots is connected, pinging it unless a round
+           trip succeeded in the last max_age seconds
+
+            Args:
+                key  (str): connection key
+                max_age (float): seconds a round trip proves the connection
+                    alive, 0 to always ping
+            Returns:
+                bool: True if ots is connected, False otherwise
+        """
+        pool = self.connections.get(key)
+        if pool is not None and key not in self._disconnected and \
+                pool.is_alive(max_age):
+            return True
         if self.send(key, "dbus", "ping", {}):
-            self.debug("OTS %s connected!")
+            self.debug("OTS %s connected!" % key)
             return True
         else:
             self.debug("OTS %s not connected!" % key)
             return False
 
+    def start_keepalive(self):
+        """
+           Start the thread pinging idle connections and reconnecting the
+           lost ones
+        """
+        if self._keepalive_thread is not None and \
+                self._keepalive_thread.is_alive():
+            return
+        self._keepalive_stop.clear()
+        self._keepalive_thread = threading.Thread(target=self.__keepalive,
+                                                  name='ots-keepalive',
+                                                  daemon=True)
+        self._keepalive_thread.start()
+
+    def stop_keepalive(self):
+        self._keepalive_stop.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
+
+    def __keepalive(self):
+        ping = self.json_pack(interface="dbus", method="ping")
+        while not self._keepalive_stop.wait(min(self.keepalive / 2, 1.0)):
+            for (ip, port), pool in list(self.pools.items()):
+                pool.expire()
+                for connection in pool.idle_connections():
+                    self.__ping_idle(ping, "%s:%s" % (ip, port), connection)
+
+    def __ping_idle(self, ping, key, connection):
+        if not connection.is_connected():
+            # Never waits for a round trip holding the connection
+            if connection.try_reconnect(blocking=False):
+                self.debug("Connection %s reestablished" % key)
+            return
+        idle = connection.idle_time()
+        if idle is None or idle < self.keepalive:
+            return
+        # Busy connections are alive, no need to queue a ping
+        if not connection.lock.acquire(blocking=False):
+            return
+        try:
+            if not connection.is_connected():
+                # lost meanwhile, reconnected out of the lock next time
+                return
+            connection.communicate(ping)
+        except (KaliExceptionOtsConnection,
+                KaliExceptionOtsInvalidHeader) as e:
+            self.debug("Keepalive of %s failed: %s" % (key, e))
+        finally:
+            connection.lock.release()
+
     def close_all(self):
         """
            Close all connections
         """
-        while len(self.connections) > 0:
-            self.close(list(self.connections.keys())[0])
+        self.stop_keepalive()
+        self.debug('Closing all connections')
+        for pool in self.pools.values():
+            pool.close()
+        self.pools = {}
+        self.connections = {}
+        self._disconnected = set()
         return True
 
     # LOGS METHODS
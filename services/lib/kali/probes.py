@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KALI Readiness Probes
+=====================
+
+Conditions polled until they hold, or until a max timeout expires, in place
+of fixed sleeps: the board answering over HTTP, Angular having no pending
+request, OTS answering to ping, a downloaded file appearing... A wait lasts
+as long as the board actually needs, and never more than the timeout.
+
+    probe = HttpProbe('http://10.0.0.1:3000/getInfo', timeout=300)
+    probe.wait_down(60)     # reboot started
+    probe.require()         # back up, KaliExceptionTimeout otherwise
+
+"""
+import os
+import time
+import urllib.error
+import urllib.request
+
+from selenium.common.exceptions import WebDriverException
+
+from .exceptions import KaliExceptionOtsConnection
+from .exceptions import KaliExceptionOtsInvalidHeader
+from .exceptions import KaliExceptionTimeout
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_INTERVAL = 1.0
+# Suffixes of the files still being downloaded (Chrome, Firefox)
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.tmp')
+# Seconds the driver script timeout exceeds the in-page waits
+SCRIPT_TIMEOUT_MARGIN = 5
+
+# True when the document is loaded and Angular has no pending request (or
+# the page has no Angular)
+_ANGULAR_IDLE_FUNCTION = """
+function idle() {
+    if (document.readyState !== 'complete') return false;
+    if (!window.angular) return true;
+    try {
+        return angular.element(document).injector().get('$http')
+            .pendingRequests.length === 0;
+    } catch (error) {
+        return true;
+    }
+}
+"""
+ANGULAR_IDLE_JS = _ANGULAR_IDLE_FUNCTION + "return idle();"
+# Async script polling idle() in the page every 50 ms: resolves true when
+# idle, false after arguments[0] seconds
+ANGULAR_IDLE_ASYNC_JS = _ANGULAR_IDLE_FUNCTION + """
+var done = arguments[arguments.length - 1];
+var deadline = Date.now() + arguments[0] * 1000;
+(function poll() {
+    if (idle()) return done(true);
+    if (Date.now() >= deadline) return done(false);
+    setTimeout(poll, 50);
+})();
+"""
+
+
+class Probe(object):
+    """Readiness probe abstract class.
+
+    Args:
+        timeout (float): max seconds waited by default.
+        interval (float): seconds between two checks.
+        name (str): probe description, used in messages.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, interval=DEFAULT_INTERVAL,
+                 name=None):
+        self.timeout = timeout
+        self.interval = interval
+        self.name = name or type(self).__name__
+
+    def check(self):
+        """
+        Check the condition once.
+
+        Returns:
+            bool: True if ready.
+        """
+        raise NotImplementedError("check method not overridden")
+
+    def wait(self, timeout=None, ready=True):
+        """
+        Poll the condition until it is ready (or not ready).
+
+        Args:
+            timeout (float): max seconds to wait, default is the probe one.
+            ready (bool): wait for the condition to hold (True) or to stop
+                holding (False).
+
+        Returns:
+            bool: True if reached, False if timed out.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            if bool(self.check()) == ready:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+
+    def wait_down(self, timeout=None):
+        """
+        Wait for the condition to stop holding (eg. board rebooting).
+        """
+        return self.wait(timeout, ready=False)
+
+    def require(self, timeout=None, ready=True):
+        """
+        As :meth:`wait`, raising on timeout.
+
+        Raises:
+            KaliExceptionTimeout:
+                :exc:`~src.exceptions.KaliExceptionTimeout` if timed out.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self.wait(timeout, ready):
+            raise KaliExceptionTimeout("%s still %s after %ss" % (
+                self.name, 'not ready' if ready else 'ready', timeout))
+        return True
+
+
+class ConditionProbe(Probe):
+    """Probe polling a callable.
+
+    Args:
+        condition (callable): returns True when ready.
+    """
+
+    def __init__(self, condition, timeout=DEFAULT_TIMEOUT,
+                 interval=DEFAULT_INTERVAL, name=None):
+        Probe.__init__(self, timeout, interval,
+                       name or getattr(condition, '__name__', None))
+        self.condition = condition
+
+    def check(self):
+        return self.condition()
+
+
+class StableProbe(Probe):
+    """Probe ready when a value stops changing between two checks (eg.
+    scroll position after an animation).
+
+    Args:
+        getter (callable): returns the value.
+    """
+
+    def __init__(self, getter, timeout=DEFAULT_TIMEOUT, interval=0.2,
+                 name=None):
+        Probe.__init__(self, timeout, interval, name)
+        self.getter = getter
+        self._last = self
+
+    def check(self):
+        value = self.getter()
+        stable = value == self._last
+        self._last = value
+        return stable
+
+
+class HttpProbe(Probe):
+    """Probe ready when an HTTP endpoint answers (eg. board /getInfo):
+    any response below 500 counts, errors and refused connections do not.
+
+    Args:
+        url (str): endpoint url.
+        request_timeout (float): max seconds of each request.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, interval=2.0,
+                 request_timeout=5.0, name=None):
+        Probe.__init__(self, timeout, interval, name or url)
+        self.url = url
+        self.request_timeout = request_timeout
+
+    def check(self):
+        try:
+            with urllib.request.urlopen(self.url,
+                                        timeout=self.request_timeout):
+                return True
+        except urllib.error.HTTPError as e:
+            return e.code < 500
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+
+class AngularIdleProbe(Probe):
+    """Probe ready when the page is loaded and Angular has no pending
+    $http request. Waiting for it is a single async script polling in the
+    page: the driver script timeout is set to exceed the wait timeout
+    before each wait, since the driver (and its script timeout) may be
+    shared with other addons.
+
+    Args:
+        driver (object): selenium WebDriver.
+    """
+
+    def __init__(self, driver, timeout=DEFAULT_TIMEOUT, interval=0.1,
+                 name='Angular'):
+        Probe.__init__(self, timeout, interval, name)
+        self.driver = driver
+
+    def check(self):
+        try:
+            return self.driver.execute_script(ANGULAR_IDLE_JS) is True
+        except WebDriverException:
+            return False
+
+    def wait(self, timeout=None, ready=True):
+        timeout = self.timeout if timeout is None else timeout
+        if ready:
+            start = time.monotonic()
+            try:
+                self.driver.set_script_timeout(
+                    timeout + SCRIPT_TIMEOUT_MARGIN)
+                return self.driver.execute_async_script(
+                    ANGULAR_IDLE_ASYNC_JS, timeout) is True
+            except WebDriverException:
+                # Script timeout or page reloading
+                timeout = max(timeout - (time.monotonic() - start), 0)
+        return Probe.wait(self, timeout, ready)
+
+
+class ElementProbe(Probe):
+    """Probe ready when an element is displayed.
+
+    Args:
+        driver (object): selenium WebDriver.
+        by (str): selenium locator strategy.
+        value (str): locator.
+    """
+
+    def __init__(self, driver, by, value, timeout=DEFAULT_TIMEOUT,
+                 interval=DEFAULT_INTERVAL, name=None):
+        Probe.__init__(self, timeout, interval, name or value)
+        self.driver = driver
+        self.by = by
+        self.value = value
+
+    def check(self):
+        try:
+            return any(element.is_displayed() for element in
+                       self.driver.find_elements(by=self.by,
+                                                 value=self.value))
+        except WebDriverException:
+            return False
+
+
+class OtsPingProbe(Probe):
+    """Probe ready when OTS answers to ping.
+
+    Args:
+        ots_client (object): :class:`~src.ots_client.OtsClient`.
+        key (str): connection key.
+    """
+
+    def __init__(self, ots_client, key, timeout=DEFAULT_TIMEOUT,
+                 interval=2.0, name=None):
+        Probe.__init__(self, timeout, interval, name or 'OTS %s' % key)
+        self.ots_client = ots_client
+        self.key = key
+
+    def check(self):
+        try:
+            return self.ots_client.try_reconnect(self.key) and \
+                self.ots_client.check_connection(self.key, max_age=0)
+        except (KaliExceptionOtsConnection, KaliExceptionOtsInvalidHeader):
+            return False
+
+
+class FileProbe(Probe):
+    """Probe ready when a new complete file is in a folder, and no partial
+    download is pending.
+
+    Args:
+        folder (str): folder to watch.
+        existing (iterable): names of the files already there, ignored.
+
+    Attributes:
+        found (str): path of the new file, once ready.
+    """
+
+    def __init__(self, folder, existing=(), timeout=DEFAULT_TIMEOUT,
+                 interval=0.2, name=None):
+        Probe.__init__(self, timeout, interval, name or folder)
+        self.folder = folder
+        self.existing = frozenset(existing)
+        self.found = None
+
+    def check(self):
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return False
+        if any(name.endswith(PARTIAL_SUFFIXES) for name in names):
+            return False
+        new = [os.path.join(self.folder, name) for name in names
+               if name not in self.existing]
+        new = [path for path in new if os.path.isfile(path)]
+        if not new:
+            return False
+        self.found = max(new, key=os.path.getctime)
+        return True
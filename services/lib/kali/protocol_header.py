@@ -1,8 +1,22 @@
 from .COMMON.TLV import TLV, APDU2TLV
 import math
+import struct
 
 valid_tags = [b'\xe0', b'\xdf\x01', b'\xdf\x02']
 
+# The header has always the same shape: E0 {DF01 <data length>, DF02 <format>}
+# E0 tag, value length, DF01 tag, data length size
+_HEADER_HEAD = struct.Struct('>BBHB')
+# DF02 tag, format length, format code
+_HEADER_TAIL = struct.Struct('>HBB')
+_MAX_LENGTH_SIZE = 8
+_FORMAT_CODES = {'json': 0x00}
+# Precompiled header prefixes, indexed by data length size
+_HEADER_PREFIXES = [_HEADER_HEAD.pack(0xe0, 7 + size, 0xdf01, size)
+                    for size in range(_MAX_LENGTH_SIZE + 1)]
+_HEADER_SUFFIXES = {_format: _HEADER_TAIL.pack(0xdf02, 1, code)
+                    for _format, code in _FORMAT_CODES.items()}
+
 
 def format_to_bytes(_format):
     """ Return a byte code based on format
@@ -24,13 +38,33 @@ def bytes_to_format(code):
     Returns:
         str: format string
     """
-    if code == 'b\x00':
+    if code == b'\x00':
         return 'json'
 
 
 def create_header(length, _format):
     """ Return a tlv header.
 
+    Uses the precompiled fixed layout when possible, the generic TLV encoder
+    otherwise.
+
+    Args:
+        length (int): data length to be sent
+        _format (str): data format
+
+    Returns:
+        byte: hexdump of tlv object
+    """
+    size = (length.bit_length() + 7) // 8
+    suffix = _HEADER_SUFFIXES.get(_format.lower())
+    if suffix is None or size > _MAX_LENGTH_SIZE:
+        return create_header_tlv(length, _format)
+    return _HEADER_PREFIXES[size] + length.to_bytes(size, 'big') + suffix
+
+
+def create_header_tlv(length, _format):
+    """ Return a tlv header built through generic TLV objects.
+
     Args:
         length (int): data length to be sent
         _format (str): data format
@@ -45,6 +79,27 @@ def create_header(length, _format):
     return tlv.hexdump()
 
 
+def decode_header(header):
+    """ Decode a header having the fixed E0 {DF01, DF02} layout.
+
+    Args:
+        header (byte): header to be decoded (tag, length and value)
+    Returns:
+        tuple: data length (int) and format code (int), None if the header
+        doesn't match the fixed layout and must be parsed as generic TLV
+    """
+    if len(header) < _HEADER_HEAD.size + _HEADER_TAIL.size:
+        return None
+    tag, val_len, len_tag, size = _HEADER_HEAD.unpack_from(header, 0)
+    if tag != 0xe0 or len_tag != 0xdf01 or val_len != 7 + size or \
+            len(header) != 9 + size:
+        return None
+    format_tag, format_len, code = _HEADER_TAIL.unpack_from(header, 5 + size)
+    if format_tag != 0xdf02 or format_len != 1:
+        return None
+    return int.from_bytes(header[5:5 + size], 'big'), code
+
+
 def parse_header(header):
     """ Parse a tlv header
     Args:
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KALI Reporters
+==============
+
+Streaming test result reporters: Kali hands them each test case as soon as
+it is closed, they append it to their file and keep nothing in memory. The
+files are valid after every test (the JUnit closing tag is rewritten after
+each test case), so a crashed run still leaves readable results.
+
+The checkpoint journal is a reporter too: it also records each test before
+it starts, and it is read back to resume an interrupted run.
+
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+from .exceptions import KaliExceptionValueError
+from .test_case import KaliTestResultManager
+
+# fsync policies: after each test, on close only, never (flush only)
+FSYNC_ALWAYS = 'always'
+FSYNC_CLOSE = 'close'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_CLOSE, FSYNC_NEVER)
+
+JUNIT_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+JUNIT_CLOSING = b'</testsuite>\n'
+
+
+class ResultReporter(object):
+    """Result reporter abstract class: append-only file, flushed after each
+    test and synced according to the fsync policy.
+
+    Args:
+        path (str): output file, parent folders are created.
+        fsync (str/int): one of FSYNC_POLICIES, or an int N to sync every N
+            tests.
+
+    Raises:
+        KaliExceptionValueError:
+            :exc:`~src.exceptions.KaliExceptionValueError` if fsync is not a
+            valid policy.
+    """
+
+    def __init__(self, path, fsync=FSYNC_ALWAYS):
+        if fsync not in FSYNC_POLICIES and \
+                not (isinstance(fsync, int) and fsync > 0):
+            raise KaliExceptionValueError("Invalid fsync policy: %s" % fsync)
+        self.path = path
+        self.fsync = fsync
+        self.reported = 0
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._fp = None
+
+    def start(self, number, title):
+        """
+        Called when a test case starts, before any of its steps.
+
+        Args:
+            number (str): test case number.
+            title (str): test case title.
+        """
+        pass
+
+    def report(self, number, title, test_case):
+        """
+        Append a closed test case.
+
+        Args:
+            number (str): test case number.
+            title (str): test case title.
+            test_case (object): closed
+                :class:`~src.test_case.KaliTestResultManager`.
+        """
+        self._write(number, title, test_case)
+        self.reported += 1
+        if isinstance(self.fsync, int) and self.reported % self.fsync == 0:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+        else:
+            self._sync()
+
+    def close(self):
+        if self._fp is None or self._fp.closed:
+            return
+        self._fp.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._fp.fileno())
+        self._fp.close()
+
+    def _sync(self):
+        self._fp.flush()
+        if self.fsync == FSYNC_ALWAYS:
+            os.fsync(self._fp.fileno())
+
+    def _write(self, number, title, test_case):
+        raise NotImplementedError("_write method not overridden")
+
+
+def _counts(test_case):
+    failed = test_case.steps_result.count(False)
+    return len(test_case.steps_result) - failed, failed
+
+
+class JsonlReporter(ResultReporter):
+    """Append one JSON line per test case.
+
+    Args:
+        path (str): output file.
+        fsync (str/int): see :class:`ResultReporter`.
+        extra (dict): fields added to each record (eg. environment name).
+        resume (bool): append to an existing file instead of replacing it.
+    """
+
+    def __init__(self, path, fsync=FSYNC_ALWAYS, extra=None, resume=False):
+        ResultReporter.__init__(self, path, fsync)
+        self.extra = dict(extra or {})
+        self._fp = open(path, 'a' if resume else 'w')
+
+    def _write(self, number, title, test_case):
+        passed, failed = _counts(test_case)
+        record = {
+            'number': number,
+            'title': title,
+            'result': test_case.result,
+            'duration': test_case.duration,
+            'steps_passed': passed,
+            'steps_failed': failed,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        if test_case.steps:
+            record['steps'] = [
+                {'kind': kind, 'addon': addon, 'method': method,
+                 'seconds': seconds}
+                for (kind, addon, method), seconds in
+                test_case.step_durations().items()]
+        record.update(self.extra)
+        self._fp.write(json.dumps(record) + '\n')
+
+
+class JunitReporter(ResultReporter):
+    """Append one testcase element per test case to a JUnit XML file. The
+    closing tag is overwritten by each new test case and written again after
+    it, so the file is always a complete document.
+
+    Args:
+        path (str): output file.
+        fsync (str/int): see :class:`ResultReporter`.
+        suite (str): testsuite name, used as classname of the test cases.
+        resume (bool): continue a file written by a previous (eg.
+            interrupted) run instead of replacing it.
+    """
+
+    def __init__(self, path, fsync=FSYNC_ALWAYS, suite='kali', resume=False):
+        ResultReporter.__init__(self, path, fsync)
+        self.suite = suite
+        if resume and os.path.isfile(path):
+            self._fp = open(path, 'r+b')
+            size = self._fp.seek(0, os.SEEK_END)
+            if size >= len(JUNIT_CLOSING):
+                self._fp.seek(size - len(JUNIT_CLOSING))
+                if self._fp.read() == JUNIT_CLOSING:
+                    self._end = size - len(JUNIT_CLOSING)
+                    return
+            self._fp.close()
+        self._fp = open(path, 'w+b')
+        self._fp.write(JUNIT_HEADER + (
+            '<testsuite name=%s>\n' % quoteattr(suite)).encode() +
+            JUNIT_CLOSING)
+        self._end = self._fp.tell() - len(JUNIT_CLOSING)
+        # Valid (empty) document even if no test case ends
+        self._fp.flush()
+
+    def _write(self, number, title, test_case):
+        passed, failed = _counts(test_case)
+        element = '  <testcase classname=%s name=%s time="%.3f"' % (
+            quoteattr(self.suite), quoteattr('%s - %s' % (number, title)),
+            test_case.duration or 0.0)
+        if test_case.result:
+            element += '/>\n'
+        else:
+            element += '>\n    <failure message=%s>%s</failure>\n' \
+                       '  </testcase>\n' % (
+                           quoteattr('%d of %d steps failed' %
+                                     (failed, passed + failed)),
+                           escape('%s %s failed' % (number, title)))
+        data = element.encode()
+        self._fp.seek(self._end)
+        self._fp.write(data + JUNIT_CLOSING)
+        self._fp.truncate()
+        self._end += len(data)
+
+
+class CheckpointJournal(ResultReporter):
+    """Write-ahead journal of a run, one JSON line per event:
+
+    - run: written once when the journal is created, with run_info (eg.
+      OTS address, environments) needed to reattach on resume.
+    - start: a test case is about to run.
+    - end: a test case completed, with its step results.
+
+    A test case with a start but no end was interrupted: it is run again on
+    resume. A line torn by a crash is dropped when the journal is resumed.
+
+    Args:
+        path (str): journal file.
+        fsync (str/int): see :class:`ResultReporter`, default syncs each
+            event.
+        resume (bool): load and continue an existing journal instead of
+            replacing it.
+        run_info (dict): information on the run, written in a new journal.
+
+    Attributes:
+        run_info (dict): information on the run (read back on resume).
+        completed (OrderedDict): end records of the completed test cases,
+            indexed by (number, title).
+        interrupted (list): (number, title) of the test cases started but not
+            completed.
+    """
+
+    def __init__(self, path, fsync=FSYNC_ALWAYS, resume=False, run_info=None):
+        ResultReporter.__init__(self, path, fsync)
+        self.run_info = dict(run_info or {})
+        self.completed = OrderedDict()
+        self.interrupted = []
+        if resume and os.path.isfile(path):
+            self.__load()
+            self._fp = open(path, 'a')
+        else:
+            self._fp = open(path, 'w')
+            self.__append({'event': 'run', 'info': self.run_info})
+
+    def __load(self):
+        with open(self.path, 'rb') as fp:
+            data = fp.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            # Torn write: the last event never completed
+            with open(self.path, 'r+b') as fp:
+                fp.truncate(end)
+        started = OrderedDict()
+        for line in data[:end].splitlines():
+            try:
+                event = json.loads(line.decode())
+            except ValueError:
+                continue
+            if event.get('event') == 'run':
+                self.run_info = event.get('info', {})
+            elif event.get('event') == 'start':
+                started[(event['number'], event['title'])] = True
+            elif event.get('event') == 'end':
+                key = (event['number'], event['title'])
+                started.pop(key, None)
+                self.completed[key] = event
+        self.interrupted = [key for key in started
+                            if key not in self.completed]
+
+    def __append(self, event):
+        self._fp.write(json.dumps(event) + '\n')
+        self._sync()
+
+    def is_completed(self, number, title):
+        return (number, title) in self.completed
+
+    def start(self, number, title):
+        self.__append({'event': 'start', 'number': number, 'title': title})
+
+    def _write(self, number, title, test_case):
+        self._fp.write(json.dumps({
+            'event': 'end',
+            'number': number,
+            'title': title,
+            'result': test_case.result,
+            'duration': test_case.duration,
+            'steps_result': test_case.steps_result,
+        }) + '\n')
+
+    def restore(self):
+        """
+        Rebuild the results of the completed test cases.
+
+        Returns:
+            OrderedDict: closed :class:`~src.test_case.KaliTestResultManager`
+            objects indexed by (number, title), as Kali.test_cases.
+        """
+        restored = OrderedDict()
+        for key, event in self.completed.items():
+            test_case = KaliTestResultManager()
+            test_case.steps_result = list(event['steps_result'])
+            test_case.close()
+            test_case.duration = event['duration']
+            restored[key] = test_case
+        return restored
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KALI Tag Filter
+===============
+
+Compiled, set based filter deciding which tests run according to their
+tags. Besides allow/deny lists, a boolean expression can be given, eg.:
+
+    smoke and (webui or dbus) and not slow
+
+"""
+import re
+
+from .exceptions import KaliExceptionValueError
+
+_TOKENS = re.compile(r'\s*(\(|\)|&|\||!|[^\s()&|!]+)')
+_OPERATORS = {'and': '&', 'or': '|', 'not': '!'}
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKENS.match(expression, position)
+        if match is None:
+            raise KaliExceptionValueError(
+                "Invalid tag expression: %s" % expression)
+        token = match.group(1)
+        tokens.append(_OPERATORS.get(token.lower(), token))
+        position = match.end()
+    return tokens
+
+
+class _Parser(object):
+    """Recursive descent parser of tag expressions, building closures
+    which take a frozenset of tags."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise KaliExceptionValueError("Empty tag expression")
+        function = self._or()
+        if self.position != len(self.tokens):
+            self._error()
+        return function
+
+    def _error(self):
+        raise KaliExceptionValueError(
+            "Invalid tag expression: %s" % self.expression)
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            self._error()
+        self.position += 1
+        return token
+
+    def _or(self):
+        terms = [self._and()]
+        while self._peek() == '|':
+            self._next()
+            terms.append(self._and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda tags: any(term(tags) for term in terms)
+
+    def _and(self):
+        terms = [self._not()]
+        while self._peek() == '&':
+            self._next()
+            terms.append(self._not())
+        if len(terms) == 1:
+            return terms[0]
+        # A conjunction of plain tags is a single subset check
+        required = frozenset(getattr(term, 'tag', None) for term in terms)
+        if None not in required:
+            return lambda tags: required <= tags
+        return lambda tags: all(term(tags) for term in terms)
+
+    def _not(self):
+        if self._peek() == '!':
+            self._next()
+            term = self._not()
+            return lambda tags: not term(tags)
+        return self._atom()
+
+    def _atom(self):
+        token = self._next()
+        if token == '(':
+            term = self._or()
+            if self._next() != ')':
+                self._error()
+            return term
+        if token in (')', '&', '|'):
+            self._error()
+
+        def term(tags):
+            return token in tags
+        term.tag = token
+        return term
+
+
+def compile_expression(expression):
+    """
+    Compile a tag expression.
+
+    Args:
+        expression (str): tags combined with and/or/not (or &, |, !) and
+            parentheses.
+
+    Returns:
+        callable: function taking a frozenset of tags and returning bool.
+
+    Raises:
+        KaliExceptionValueError:
+            :exc:`~src.exceptions.KaliExceptionValueError` if expression is
+            not valid.
+    """
+    return _Parser(expression).parse()
+
+
+class TagFilter(object):
+    """TagFilter class definition.
+
+    Args:
+        allow (list): tags which must all be present.
+        deny (list): tags which must not be present.
+        any_of (list): tags of which at least one must be present.
+        expression (str): boolean tag expression, see
+            :func:`compile_expression`.
+    """
+
+    def __init__(self, allow=None, deny=None, any_of=None, expression=None):
+        self.allow = frozenset(allow or ())
+        self.deny = frozenset(deny or ())
+        self.any_of = frozenset(any_of or ())
+        self.expression = expression
+        self._expression = compile_expression(expression) \
+            if expression else None
+
+    def __call__(self, tags):
+        return self.match(tags)
+
+    def match(self, tags):
+        """
+        Check if a test having the given tags must run.
+
+        Args:
+            tags (iterable): test tags.
+
+        Returns:
+            bool: True if tags pass the filter, False otherwise.
+        """
+        if not isinstance(tags, frozenset):
+            tags = frozenset(tags)
+        return self.deny.isdisjoint(tags) and self.allow <= tags and \
+            (not self.any_of or not self.any_of.isdisjoint(tags)) and \
+            (self._expression is None or self._expression(tags))
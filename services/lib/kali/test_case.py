@@ -4,6 +4,7 @@ Abstract KALI Test Case
 =======================
 
 """
+import time
 from .addons.dbus.addon import KaliDbusOmniaAddon
 from .addons.main.addon import KaliMainAddon
 from .addons.omnia_bash.addon import KaliBashAddon
@@ -23,12 +24,19 @@ class KaliTestResultManager:
     Args:
         steps_result (list): list of bool representing steps results.
         result (bool):  result of test case.
+        duration (float): seconds elapsed between creation and close.
+        steps (list): :class:`~src.metrics.StepRecord` objects of the checks,
+            OTS round trips and addon actions (only if Kali metrics are
+            enabled).
     """
 
     def __init__(self):
         """Class setup."""
         self.steps_result = []
+        self.steps = []
         self.result = None
+        self.duration = None
+        self._started = time.monotonic()
 
         self._closed = False
 
@@ -56,6 +64,28 @@ class KaliTestResultManager:
                 'Cannot register step result: TestCase is closed.')
         self.steps_result.append(False)
 
+    def add_step(self, record):
+        """
+        Register a step record.
+
+        Args:
+            record (object): :class:`~src.metrics.StepRecord` object.
+        """
+        self.steps.append(record)
+
+    def step_durations(self):
+        """
+        Sum the durations of the steps by kind, addon and method.
+
+        Returns:
+            dict: seconds indexed by (kind, addon, method).
+        """
+        durations = {}
+        for step in self.steps:
+            key = (step.kind, step.addon, step.method)
+            durations[key] = durations.get(key, 0.0) + (step.duration or 0.0)
+        return durations
+
     def close(self):
         """
         Calculate test result and deny registration of additional step results.
@@ -74,6 +104,7 @@ class KaliTestResultManager:
             self.result = False
         else:
             self.result = True
+        self.duration = time.monotonic() - self._started
         self._closed = True
 
     def is_closed(self):
@@ -87,7 +118,17 @@ class KaliTestResultManager:
 
 
 class KaliTestCase:
-    """Main object ot create new test for Kali automation"""
+    """Main object ot create new test for Kali automation
+
+    Attributes:
+        tags (list): tags declared by the test class: Kali checks them
+            against the refused tags before instancing the test, so refused
+            tests skip setup. All the tags, also the ones added at runtime
+            (set_tags, add_tags), are checked against the whole filter after
+            setup.
+    """
+
+    tags = []
 
     def __init__(self, kali, logger, test_title, test_number, **kwargs):
         """
@@ -99,7 +140,7 @@ class KaliTestCase:
             kwargs (dict): All need to setup new addon to do the test
         """
         self.kali = kali
-        self.tags = []
+        self.tags = list(type(self).tags)
         self.test_title = test_title
         self.logger = logger
         self.test_number = test_number
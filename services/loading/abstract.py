@@ -2,12 +2,18 @@ import os
 import configparser
 import time
 
+from ..lib.kali.probes import HttpProbe
+
 
 ADDRESS_SECTION = "ADDRESS"
 STATUS_SECTION = "STATUS"
 FREE_VALUE = "free"
 BUSY_VALUE = "busy"
 SEPARATE_CHAR = ","
+# Max seconds waited for the board to go down after a reboot request, and to
+# answer again
+REBOOT_DOWN_TIMEOUT = 120
+REBOOT_UP_TIMEOUT = 300
 
 
 class LoadingModule(object):
@@ -57,6 +63,31 @@ class LoadingModule(object):
             secs -= 1
             time.sleep(1)
 
+    def wait_reboot(self, url, down_timeout=REBOOT_DOWN_TIMEOUT,
+                    up_timeout=REBOOT_UP_TIMEOUT):
+        """
+        Wait for the board to reboot: for url to stop answering, then to
+        answer again
+
+        Args:
+            url(str): board HTTP endpoint (eg. /getInfo)
+            down_timeout(int): max seconds waited for the board to go down
+            up_timeout(int): max seconds waited for the board to come back
+
+        Returns:
+            True if the board answers again
+            False otherwise
+        """
+        probe = HttpProbe(url)
+        if not probe.wait_down(down_timeout):
+            self.logger.warning("Board still answering on %s after %ss" %
+                                (url, down_timeout))
+        if not probe.wait(up_timeout):
+            self.logger.error("Board not answering on %s after %ss" %
+                              (url, up_timeout))
+            return False
+        return True
+
     def _find_1st_free(self, config_path):
         if not os.path.isfile(config_path):
             self.logger.error('Unable to load config file: %s' % config_path)
@@ -5,7 +5,6 @@ import configparser
 import sys
 import subprocess
 import os
-import time
 
 
 class HttpApiUpdate(LoadingModule):
@@ -70,8 +69,7 @@ class HttpApiUpdate(LoadingModule):
                 return False
         self.logger.info("Update complete! Rebooting board...")
         subprocess.call("curl http://" + str(self.ip) + ":" + str(self.port) + "/reboot --insecure", shell=True)
-        time.sleep(80)
-        return True
+        return self.wait_reboot("http://%s:%s/getInfo" % (self.ip, self.port))
 
     def _check_loaded_version(self, new_version):
         if self.ip is None:
@@ -5,10 +5,15 @@ from .abstract import LoadingModule, SEPARATE_CHAR
 from ..lib.kali.kali import Kali
 from ..lib.helpers import check_ip, check_path
 
+# Headless browser shared by the update and the version check: it starts once
+WEBUI_ADDON_KWARGS = {'headless': True, 'shared_session': 'loading'}
+# Max seconds waited for the update to complete
+UPDATE_TIMEOUT = 900
+
 
 class OmniaWebUiLoading(LoadingModule):
     def __init__(self, config_ini, logger):
-        LoadingModule.__init__(self)
+        LoadingModule.__init__(self, config_ini, logger)
         self.ip = None
         self.port = None
         self.kali = None
@@ -35,7 +40,8 @@ class OmniaWebUiLoading(LoadingModule):
         if self.ip is None:
             self.logger.debug("No free environment for this platform")
             return False
-        self.kali.add_omnia_webui_addon('webui', ip=self.ip)
+        self.kali.add_omnia_webui_addon('webui', ip=self.ip,
+                                        **WEBUI_ADDON_KWARGS)
         if not (check_ip(self.ip) and
                 check_path(self.build_path) and
                 isinstance(self.port, int)):
@@ -54,21 +60,29 @@ class OmniaWebUiLoading(LoadingModule):
                                       hidden=True)
         self.kali.do_addon_method('webui', 'click_button', label='Upload all')
         self.kali.info('Updating... Please wait for about 5 minutes')
-        self.countdown(300)
+        if not self.kali.do_addon_method('webui', 'wait_for_label',
+                                         label='Reboot now',
+                                         timeout=UPDATE_TIMEOUT):
+            self.kali.error('Update not completed after %ss' % UPDATE_TIMEOUT)
+            self.kali.remove_addon("webui")
+            return False
         self.kali.do_addon_method('webui', 'click_button', label='Reboot now')
         self.kali.info('Update completed successfully')
         self.kali.info('Rebooting board...')
-        self.countdown(60)
+        rebooted = self.wait_reboot("http://%s:%s/getInfo" % (self.ip, self.port))
         self.kali.remove_addon("webui")
-        return True
+        return rebooted
 
     def _check_loaded_version(self, new_version_string):
-        self.kali.add_omnia_webui_addon('webui', ip=self.ip)
+        self.kali.add_omnia_webui_addon('webui', ip=self.ip,
+                                        **WEBUI_ADDON_KWARGS)
         self.kali.do_addon_method('webui', 'macro_login')
         self.kali.info('Login successfully')
         self.kali.do_addon_method("webui", "get_value", label="Core-FWR[Build]")
         self.kali.set_check("webui", new_version_string)
-        return self.kali.get_result("webui", "equal")
+        result = self.kali.get_result("webui", "equal")
+        self.kali.remove_addon("webui")
+        return result
 
     def _get_envirnoment_in_use(self):
         return self.env
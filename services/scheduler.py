@@ -0,0 +1,295 @@
+"""
+TEST SCHEDULER
+==============
+
+Shard the discovered tests across every free OMNIA environment listed in the
+environments config file (see config/omnia.ini) and run one Kali instance
+per environment in a worker process.
+
+Tests durations are recorded in a timing history: the scheduler uses it to
+balance the environments and to flag tests whose runtime regressed.
+
+"""
+import configparser
+import heapq
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from defines import SECTION_ADDRESS, SECTION_STATUS, FREE_STATE, BUSY_STATE
+
+SEPARATE_CHAR = ","
+# Weight of the last run in the estimated duration of a test
+HISTORY_ALPHA = 0.5
+# Duration assumed for tests never run, if the history is empty
+DEFAULT_DURATION = 1.0
+# A run slower than the estimate by this ratio is a regression
+REGRESSION_RATIO = 1.5
+# Regressions shorter than this (seconds) are considered noise
+REGRESSION_MIN_DELTA = 1.0
+
+
+def read_environments(config_path, only_free=True):
+    """
+    Read the environments from config file
+
+    Params:
+        config_path(str): environments config file (eg. config/omnia.ini)
+        only_free(bool): skip environments not in free state
+
+    Returns:
+        (list): list of (name, ip) tuples, in config file order
+    """
+    cfg = configparser.ConfigParser()
+    if not cfg.read(config_path):
+        return []
+    environments = []
+    for name in cfg.options(SECTION_ADDRESS):
+        if only_free and cfg.get(SECTION_STATUS, name, fallback=None) != FREE_STATE:
+            continue
+        address = cfg.get(SECTION_ADDRESS, name).split(SEPARATE_CHAR)
+        environments.append((name, address[0].strip()))
+    return environments
+
+
+def set_environments_state(config_path, names, state):
+    """
+    Mark the environments as busy/free on config file
+
+    Params:
+        config_path(str): environments config file
+        names(list): environment names
+        state(str): FREE_STATE or BUSY_STATE
+    """
+    cfg = configparser.ConfigParser()
+    cfg.read(config_path)
+    for name in names:
+        cfg.set(SECTION_STATUS, name, state)
+    with open(config_path, "w") as fp:
+        cfg.write(fp)
+
+
+def reserve_environments(config_path, names):
+    set_environments_state(config_path, names, BUSY_STATE)
+
+
+def release_environments(config_path, names):
+    set_environments_state(config_path, names, FREE_STATE)
+
+
+def shard(items, count):
+    """
+    Split items in count shards, dealing them round robin
+
+    Params:
+        items(list): items to be split
+        count(int): number of shards
+
+    Returns:
+        (list): list of count lists (some of them may be empty)
+    """
+    shards = [[] for _ in range(count)]
+    for index, item in enumerate(items):
+        shards[index % count].append(item)
+    return shards
+
+
+def bin_pack(weights, count):
+    """
+    Assign items to count bins minimizing the largest bin load, with the
+    Longest Processing Time first heuristic
+
+    Params:
+        weights(list): weight (eg. expected duration) of each item
+        count(int): number of bins
+
+    Returns:
+        (list): list of count lists of item indexes, each one ordered by
+            decreasing weight
+    """
+    bins = [[] for _ in range(count)]
+    loads = [(0.0, index) for index in range(count)]
+    for item in sorted(range(len(weights)), key=lambda i: weights[i], reverse=True):
+        load, index = heapq.heappop(loads)
+        bins[index].append(item)
+        heapq.heappush(loads, (load + weights[item], index))
+    return bins
+
+
+def history_key(number, title):
+    return '%s - %s' % (number, title)
+
+
+class TimingHistory:
+    """
+    Persistent per-test timing history, stored as a JSON file
+
+    Params:
+        path(str): history file (created at first save)
+        ratio(float): a run slower than the expected duration by this ratio
+            is a regression
+    """
+    def __init__(self, path, ratio=REGRESSION_RATIO):
+        self.path = path
+        self.ratio = ratio
+        self.tests = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as fp:
+                    self.tests = json.load(fp)
+            except ValueError:
+                self.tests = {}
+
+    def estimate(self, number, title, default=None):
+        """
+        Return the expected duration of a test
+
+        Params:
+            number(str): test number
+            title(str): test title
+            default(float): duration returned for tests never run, if None
+                the median of the known durations is used
+
+        Returns:
+            (float): seconds
+        """
+        entry = self.tests.get(history_key(number, title))
+        if entry is not None:
+            return entry['mean']
+        if default:
+            return default
+        means = sorted(known['mean'] for known in self.tests.values())
+        if not means:
+            return DEFAULT_DURATION
+        return means[len(means) // 2]
+
+    def record(self, test_cases):
+        """
+        Update the history with the durations of a run
+
+        Params:
+            test_cases(OrderedDict): KaliTestResultManager objects indexed by
+                (number, title), as Kali.test_cases
+
+        Returns:
+            (list): regressions found, as (number, title, expected, duration)
+                tuples
+        """
+        regressions = []
+        for (number, title), result in test_cases.items():
+            if result.duration is None:
+                continue
+            key = history_key(number, title)
+            entry = self.tests.get(key)
+            if entry is None:
+                self.tests[key] = {'mean': result.duration, 'last': result.duration, 'runs': 1}
+                continue
+            if result.duration > entry['mean'] * self.ratio and \
+                    result.duration - entry['mean'] > REGRESSION_MIN_DELTA:
+                regressions.append((number, title, entry['mean'], result.duration))
+            entry['mean'] = HISTORY_ALPHA * result.duration + (1 - HISTORY_ALPHA) * entry['mean']
+            entry['last'] = result.duration
+            entry['runs'] += 1
+        return regressions
+
+    def save(self):
+        """
+        Write the history on file (atomically)
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.tests, fp, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def merge_results(parts):
+    """
+    Merge the results returned by the workers in tests order
+
+    Params:
+        parts(list): lists of (index, key, result) tuples, where index is
+            the position of the test in the scheduled list, key the
+            (number, title) tuple and result a KaliTestResultManager
+
+    Returns:
+        (OrderedDict): results indexed by (number, title), as
+            Kali.test_cases
+    """
+    merged = OrderedDict()
+    for _, key, result in sorted((item for part in parts for item in part),
+                                 key=lambda item: item[0]):
+        merged[key] = result
+    return merged
+
+
+class ParallelScheduler:
+    """
+    ParallelScheduler class definition
+
+    Params:
+        environments(list): list of (name, ip) tuples, one worker each
+        worker(callable): module level function called in the worker
+            process as worker(environment, entries, *args). entries is a
+            list of (index, item) tuples, it must return a list of
+            (index, key, KaliTestResultManager) tuples
+        logger(obj): logger object
+        on_crash(callable): called in this process as on_crash(environment,
+            entries, error) when a worker fails, it must return the (index,
+            key, KaliTestResultManager) tuples recorded for the lost shard
+            (eg. its tests marked as failed). If None the shard results are
+            dropped
+    """
+    def __init__(self, environments, worker, logger, on_crash=None):
+        self.environments = environments
+        self.worker = worker
+        self.logger = logger
+        self.on_crash = on_crash
+
+    def split(self, items, weights=None):
+        """
+        Assign the items to the environments: round robin or, if weights are
+        given, balancing the expected load (longest items first)
+
+        Params:
+            items(list): items to be run
+            weights(list): expected duration of each item
+
+        Returns:
+            (list): list of (environment, entries) tuples
+        """
+        entries = list(enumerate(items))
+        if weights is None:
+            shards = shard(entries, len(self.environments))
+        else:
+            shards = [[entries[i] for i in indexes]
+                      for indexes in bin_pack(weights, len(self.environments))]
+        return [(env, entries) for env, entries in zip(self.environments, shards)
+                if entries]
+
+    def run(self, items, *args, weights=None):
+        """
+        Run the items on all environments and wait for them
+
+        Params:
+            items(list): items to be run
+            args: further arguments passed to worker
+            weights(list): expected duration of each item, see split
+
+        Returns:
+            (OrderedDict): merged results, see merge_results
+        """
+        assignments = self.split(items, weights)
+        parts = []
+        with ProcessPoolExecutor(max_workers=max(len(assignments), 1)) as executor:
+            futures = {}
+            for env, entries in assignments:
+                self.logger.info('Scheduling %d tests on %s (%s)' % (len(entries), env[0], env[1]))
+                futures[executor.submit(self.worker, env, entries, *args)] = (env, entries)
+            for future, (env, entries) in futures.items():
+                try:
+                    parts.append(future.result())
+                except Exception as e:
+                    self.logger.error('Environment %s failed: %s' % (env[0], e))
+                    if self.on_crash is not None:
+                        parts.append(self.on_crash(env, entries, e))
+        return merge_results(parts)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test configuration: the kali library and the services are importable as the
+launcher imports them (from services/ and services/lib/).
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, 'services'),
+             os.path.join(ROOT, 'services', 'lib'),
+             os.path.dirname(os.path.abspath(__file__))):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fake_ots import FakeOts  # noqa: E402
+
+
+@pytest.fixture
+def fake_ots():
+    server = FakeOts()
+    yield server
+    server.close()
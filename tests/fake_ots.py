@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fake OMNIA Testing Server
+=========================
+
+Local stand-in for OTS, speaking the E0 framed json protocol: every request
+is answered in order with an "ok" execution echoing the call. Faults can be
+injected to exercise the client (connection dropped before the answer,
+invalid header, server down while the board reboots).
+
+"""
+import json
+import socket
+import threading
+import time
+
+from kali.protocol_header import create_header
+
+
+def read_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def read_request(sock):
+    """
+    Read a framed json request.
+
+    Returns:
+        dict: decoded request
+    """
+    header = read_exactly(sock, 2)
+    header += read_exactly(sock, header[1])
+    size = header[4]
+    length = int.from_bytes(header[5:5 + size], byteorder='big')
+    return json.loads(read_exactly(sock, length).decode())
+
+
+def request_call(request):
+    """
+    Returns:
+        tuple: (interface, method, arguments) of a request
+    """
+    interface, calls = next(iter(request['run'][0].items()))
+    call = calls[0]
+    if isinstance(call, str):
+        return interface, call, None
+    method, arguments = next(iter(call.items()))
+    return interface, method, arguments
+
+
+def echo_reply(request, value=None):
+    """
+    Build the "ok" reply of a request, its value is the call by default.
+
+    Returns:
+        str: json reply
+    """
+    interface, method, arguments = request_call(request)
+    if value is None:
+        value = {'echo': {method: arguments} if arguments else method}
+    return json.dumps({'return': [{interface: [
+        {method: {'execution': 'ok', 'value': value}}]}]})
+
+
+class FakeOts(object):
+    """Fake OTS server listening on 127.0.0.1.
+
+    Args:
+        reply_size (int): if set, replies carry a string value of this size
+            (eg. a big journal) instead of the echo.
+        handler (callable): builds the json reply of a request, overrides
+            the default echo.
+
+    Attributes:
+        port (int): listening port, kept across down/up.
+        requests (list): requests received, in order.
+        drop (int): next requests to answer by closing the connection.
+        corrupt (int): next requests to answer with an invalid header.
+        delay (float): seconds to wait before each answer.
+        chunk (int): if set, answers are sent by chunks of this size.
+    """
+
+    def __init__(self, reply_size=None, handler=None):
+        self.reply_size = reply_size
+        self.handler = handler
+        self.port = 0
+        self.requests = []
+        self.drop = 0
+        self.corrupt = 0
+        self.delay = 0.0
+        self.chunk = None
+        self._server = None
+        self._clients = []
+        self._lock = threading.Lock()
+        self.up()
+
+    def up(self):
+        """
+        Start listening (again, on the same port).
+        """
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', self.port))
+        server.listen(16)
+        self.port = server.getsockname()[1]
+        self._server = server
+        threading.Thread(target=self.__accept, args=(server,),
+                         daemon=True).start()
+
+    def down(self):
+        """
+        Stop listening and close the connections (eg. board rebooting).
+        """
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server.close()
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    close = down
+
+    @property
+    def connections(self):
+        """Connections currently open"""
+        with self._lock:
+            return len(self._clients)
+
+    def methods(self):
+        """
+        Returns:
+            list: methods of the requests received, in order
+        """
+        return [request_call(request)[1] for request in self.requests]
+
+    def __accept(self, server):
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self.__serve, args=(client,),
+                             daemon=True).start()
+
+    def __reply(self, request):
+        if self.handler is not None:
+            return self.handler(request)
+        if self.reply_size:
+            return echo_reply(request, 'x' * self.reply_size)
+        return echo_reply(request)
+
+    def __serve(self, client):
+        try:
+            while True:
+                request = read_request(client)
+                self.requests.append(request)
+                if self.delay:
+                    time.sleep(self.delay)
+                if self.drop:
+                    self.drop -= 1
+                    break
+                reply = self.__reply(request).encode()
+                header = bytearray(create_header(len(reply), 'json'))
+                if self.corrupt:
+                    # Unknown data format, the reply still follows
+                    self.corrupt -= 1
+                    header[-1] = 0x07
+                data = bytes(header) + reply
+                step = self.chunk or len(data)
+                for start in range(0, len(data), step):
+                    client.sendall(data[start:start + step])
+        except (EOFError, OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+            client.close()
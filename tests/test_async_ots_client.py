@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AsyncOtsClient and AsyncOtsClientAdapter tests, against the local fake OTS
+server.
+"""
+import socket
+import threading
+import time
+
+import pytest
+
+from kali import async_ots_client
+from kali.async_ots_client import AsyncOtsClient
+from kali.async_ots_client import AsyncOtsClientAdapter
+from kali.metrics import MemorySink
+from kali.metrics import Metrics
+from kali.ots_client import OtsClient
+
+
+@pytest.fixture
+def adapter(fake_ots):
+    adapter = AsyncOtsClientAdapter()
+    adapter.connect('ots', '127.0.0.1', fake_ots.port)
+    yield adapter
+    adapter.stop()
+
+
+def test_client_has_base_attributes():
+    client = AsyncOtsClient()
+    base = OtsClient(keepalive=None)
+    assert set(vars(base)) <= set(vars(client))
+    assert client.connections == {}
+
+
+def test_disconnect_pool(adapter):
+    assert adapter.send('ots', 'dbus', 'ping')
+    adapter.disconnect_pool('ots')
+    assert not adapter.is_connected('ots')
+    adapter.reconnect('ots')
+    assert adapter.send('ots', 'dbus', 'ping')
+
+
+def test_send_many(adapter):
+    commands = [('dbus', 'do_method', {'i': i}) for i in range(20)]
+    returned = adapter.send_many('ots', commands, depth=4)
+    assert [value['echo']['do_method']['i'] for value in returned] == \
+        list(range(20))
+
+
+def test_check_connection_max_age(fake_ots, adapter):
+    assert adapter.send('ots', 'dbus', 'do_method', {'i': 1})
+    count = len(fake_ots.requests)
+    # a round trip just succeeded, no ping needed
+    assert adapter.check_connection('ots')
+    assert len(fake_ots.requests) == count
+    assert adapter.check_connection('ots', max_age=0)
+    assert fake_ots.methods()[count:] == ['ping']
+
+
+def test_ots_ping_probe(adapter):
+    probes = pytest.importorskip('kali.probes')
+    assert probes.OtsPingProbe(adapter, 'ots', timeout=1).wait()
+
+
+def test_send_idempotent_retried(fake_ots, adapter):
+    fake_ots.drop = 1
+    assert adapter.send('ots', 'dbus', 'do_method', {'i': 1},
+                        idempotent=True) == {'echo': {'do_method': {'i': 1}}}
+    fake_ots.drop = 1
+    assert adapter.send('ots', 'dbus', 'do_method', {'i': 2}) is False
+
+
+def test_invalid_header_resyncs_connection(fake_ots, adapter):
+    fake_ots.corrupt = 1
+    assert adapter.send('ots', 'dbus', 'do_method', {'i': 1}) is False
+    adapter.reconnect('ots')
+    assert adapter.send('ots', 'dbus', 'do_method', {'i': 2}) == \
+        {'echo': {'do_method': {'i': 2}}}
+
+
+def test_metrics_forwarded(adapter):
+    sink = MemorySink()
+    adapter.metrics = Metrics([sink])
+    assert adapter.client.metrics is adapter.metrics
+    adapter.send('ots', 'dbus', 'ping')
+    assert [(record.kind, record.method) for record in sink.records] == \
+        [('ots', 'ping')]
+
+
+def test_header_read_timeout(monkeypatch):
+    # board sending the first header byte, then nothing
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    clients = []
+
+    def stall():
+        client, _ = server.accept()
+        clients.append(client)
+        client.recv(4096)
+        client.sendall(b'\xe0')
+
+    threading.Thread(target=stall, daemon=True).start()
+    monkeypatch.setattr(async_ots_client, 'SOCK_TIMEOUT', 0.5)
+    adapter = AsyncOtsClientAdapter()
+    try:
+        adapter.connect('ots', '127.0.0.1', server.getsockname()[1])
+        start = time.monotonic()
+        assert adapter.send('ots', 'dbus', 'ping') is False
+        assert time.monotonic() - start < 5
+        assert not adapter.is_connected('ots')
+    finally:
+        adapter.stop()
+        for client in clients:
+            client.close()
+        server.close()
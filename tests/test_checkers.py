@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checker tests: waits woken by notifications instead of busy loops,
+incremental matching of growing logs.
+"""
+import re
+import threading
+import time
+
+import pytest
+
+from kali.addons.abstract import KaliAddOn
+from kali.addons.checkers import Checker
+from kali.addons.checkers import LineMatcher
+from kali.exceptions import KaliExceptionTypeError
+from kali.exceptions import KaliExceptionValueError
+
+
+class Addon(KaliAddOn):
+
+    def setup(self):
+        return True
+
+    def close(self):
+        return True
+
+
+def later(delay, function, *args):
+    timer = threading.Timer(delay, function, args)
+    timer.start()
+    return timer
+
+
+def test_failed_check_sleeps():
+    checker = Checker()
+    checker.set_timeout(1.0)
+    checker.set_returned('x')
+    checker.set_expected('y')
+    wall, cpu = time.monotonic(), time.process_time()
+    assert checker.equal() is False
+    wall, cpu = time.monotonic() - wall, time.process_time() - cpu
+    assert wall >= 1.0
+    # a busy loop would burn the whole timeout
+    assert cpu < 0.2 * wall
+    assert checker.expected is None and checker.returned is None
+
+
+def test_set_returned_wakes_check():
+    checker = Checker()
+    checker.set_timeout(5.0)
+    checker.set_polling(interval_max=None)
+    checker.set_returned('x')
+    checker.set_expected('y')
+    later(0.2, checker.set_returned, 'y')
+    start = time.monotonic()
+    assert checker.equal() is True
+    assert time.monotonic() - start < 1.0
+
+
+def test_notify_wakes_find_on_list():
+    checker = Checker()
+    checker.set_timeout(5.0)
+    checker.set_polling(interval_max=None)
+    lines = []
+    checker.set_returned(lines)
+    checker.set_expected('READY')
+
+    def append():
+        lines.append('board READY')
+        checker.notify()
+
+    later(0.2, append)
+    start = time.monotonic()
+    assert checker.find() is True
+    assert time.monotonic() - start < 1.0
+
+
+def test_polling_sees_in_place_changes():
+    # no notification: the backoff polling picks the change up
+    checker = Checker()
+    checker.set_timeout(5.0)
+    checker.set_polling(0.005, 0.05)
+    lines = []
+    checker.set_returned(lines)
+    checker.set_expected('READY')
+    later(0.2, lines.append, 'board READY')
+    start = time.monotonic()
+    assert checker.find() is True
+    assert time.monotonic() - start < 1.0
+
+
+def test_wait_for_update():
+    checker = Checker()
+    since = checker.updates
+    assert checker.wait_for_update(since, 0.05) is False
+    later(0.05, checker.notify)
+    assert checker.wait_for_update(since, 5.0) is True
+    assert checker.updates == since + 1
+
+
+def test_check_requires_values():
+    checker = Checker()
+    with pytest.raises(KaliExceptionValueError):
+        checker.equal()
+
+
+def test_get_result():
+    addon = Addon()
+    addon.set_check_timeout(0.5)
+    addon.checker.set_returned('value')
+    addon.set_check('value')
+    assert addon.get_result('equal') is True
+    assert addon.poll_count == 1
+    addon.checker.set_returned('value')
+    addon.set_check('other')
+    wall, cpu = time.monotonic(), time.process_time()
+    assert addon.get_result('equal') is False
+    wall, cpu = time.monotonic() - wall, time.process_time() - cpu
+    assert cpu < 0.2 * wall
+    with pytest.raises(KaliExceptionValueError):
+        addon.get_result('unknown')
+
+
+def test_get_result_notified_during_check():
+    addon = Addon()
+    addon.set_check_timeout(3.0)
+    addon.checker.set_timeout(0.01)
+    addon.checker.set_polling(interval_max=None)
+    addon.checker.set_returned('value')
+    addon.set_check('value')
+    calls = []
+
+    def racy_check():
+        calls.append(addon.checker.returned)
+        if len(calls) == 1:
+            # a value notified while the check runs
+            addon.checker.notify()
+            return False
+        return True
+    addon.checker.racy_check = racy_check
+    start = time.monotonic()
+    assert addon.get_result('racy_check') is True
+    assert time.monotonic() - start < 1.0
+    assert calls == ['value', 'value']
+
+
+def test_get_result_keeps_new_value():
+    addon = Addon()
+    addon.set_check_timeout(3.0)
+    addon.checker.set_timeout(0.01)
+    addon.checker.set_polling(interval_max=None)
+    addon.checker.set_returned('old')
+    addon.set_check('new')
+    later(0.2, addon.checker.set_returned, 'new')
+    start = time.monotonic()
+    assert addon.get_result('equal') is True
+    assert time.monotonic() - start < 1.0
+
+
+class CountingList(list):
+    """List counting the lines read by index"""
+
+    reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return list.__getitem__(self, index)
+
+
+def test_line_matcher_scans_new_lines_only():
+    lines = CountingList(['line %d' % i for i in range(1000)])
+    matcher = LineMatcher('READY')
+    assert matcher.scan(lines) is False
+    assert lines.reads == 1000
+    lines.extend(['line', 'board READY'])
+    assert matcher.scan(lines) is True
+    assert lines.reads == 1002
+    assert matcher.offset == 1002
+
+
+def test_line_matcher_all_expectations():
+    matcher = LineMatcher(['boot', re.compile(r'READY \d+')])
+    assert matcher.scan(['a boot', 'b ok']) is False
+    assert matcher.pending == {1}
+    assert matcher.scan(['a boot', 'b ok', 'c READY 42']) is True
+
+
+def test_line_matcher_any_expectation():
+    matcher = LineMatcher(['missing', 'boot'], match_all=False)
+    assert matcher.scan(['a boot']) is True
+
+
+def test_line_matcher_mixed_flags():
+    # expectations with different flags are not combined
+    matcher = LineMatcher([re.compile('ready', re.I), 'boot'])
+    assert matcher.scan(['READY', 'boot']) is True
+
+
+def test_line_matcher_list_cleared():
+    matcher = LineMatcher('READY')
+    lines = ['a', 'b', 'c']
+    assert matcher.scan(lines) is False
+    lines[:] = ['READY']
+    assert matcher.scan(lines) is True
+
+
+def test_line_matcher_invalid_expectations():
+    with pytest.raises(KaliExceptionValueError):
+        LineMatcher([])
+    with pytest.raises(KaliExceptionTypeError):
+        LineMatcher([42])
+
+
+def test_line_matcher_log_buffer():
+    loglib = pytest.importorskip('kali.addons.lib.Loglib.Loglib')
+    buffer = loglib.LogBuffer(max_lines=10)
+    buffer.extend('line %d' % i for i in range(100))
+    matcher = LineMatcher(['line 95', 'line 120'])
+    assert matcher.scan(buffer) is False
+    # evicted lines move the indexes, the cursor keeps its place
+    buffer.extend('line %d' % i for i in range(100, 130))
+    assert matcher.scan(buffer) is True
+
+
+def test_find():
+    checker = Checker()
+    checker.set_timeout(0.2)
+    checker.set_returned(['a boot', 'b ok', 'c READY 42'])
+    checker.set_expected(['boot', re.compile(r'READY \d+')])
+    assert checker.find() is True
+    checker.set_returned(['a boot'])
+    checker.set_expected(['boot', 'missing'])
+    assert checker.find() is False
+    checker.set_returned(['a boot'])
+    checker.set_expected(['missing', 'boot'])
+    assert checker.find_any() is True
+    checker.set_returned('hello world')
+    checker.set_expected('world')
+    assert checker.find() is True
+    checker.set_returned('hello world')
+    checker.set_expected([re.compile('w.r')])
+    assert checker.find() is True
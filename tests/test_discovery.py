@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Discovery tests: test metadata read from the source, without importing it.
+"""
+from discovery import DiscoveryIndex, parse_test
+
+TEST = b'''
+class KaliTest(KaliTestCase):
+    tags = ['smoke']
+
+    def __init__(self, kali, logger):
+        super().__init__(kali, logger, 'Boot', '1.2')
+
+    def setup(self):
+        self.add_tags(['webui'])
+'''
+
+
+def test_parse_test():
+    assert parse_test(TEST) == {'number': '1.2', 'title': 'Boot',
+                                'tags': ['smoke', 'webui']}
+    assert parse_test(b'class Other(object):\n    pass\n') is None
+
+
+def test_parse_keywords():
+    info = parse_test(b'''
+class KaliTest(KaliTestCase):
+    def __init__(self, kali, logger):
+        KaliTestCase.__init__(self, kali, logger, test_title='Boot',
+                              test_number='3')
+''')
+    assert (info['number'], info['title']) == ('3', 'Boot')
+
+
+def test_only_setup_methods_read():
+    info = parse_test(TEST + b'''
+    def run(self):
+        self.set_tags(['other'])
+        self.tags.append('late')
+        Helper.__init__(self, None, None, 'Wrong', '9')
+
+    def setup_helper(self):
+        def nested():
+            self.set_tags(['nested'])
+''')
+    assert info == {'number': '1.2', 'title': 'Boot', 'tags': ['smoke', 'webui']}
+
+
+def test_nested_definitions_skipped():
+    info = parse_test(TEST + b'''
+        def later():
+            self.tags.append('late')
+        self.callback = later
+''')
+    assert info['tags'] == ['smoke', 'webui']
+
+
+def test_dynamic_tags():
+    info = parse_test(b'''
+class KaliTest(KaliTestCase):
+    def setup(self):
+        self.tags.append(read_tag())
+''')
+    assert info['tags'] is None
+
+
+def test_not_literal_values():
+    # literal_eval raises ValueError, TypeError or SyntaxError on these
+    for value in (b'read_tags()', b'[1] + 2', b'-"a"', b'{[]: 1}'):
+        info = parse_test(b'''
+class KaliTest(KaliTestCase):
+    tags = %s
+
+    def __init__(self, kali, logger):
+        super().__init__(kali, logger, %s, '1')
+''' % (value, value))
+        assert info == {'number': '1', 'title': None, 'tags': None}
+
+
+def test_index_parses_changed_files_only(tmp_path):
+    test_file = tmp_path / 'test_boot.py'
+    test_file.write_bytes(TEST)
+    index = DiscoveryIndex(str(tmp_path / 'index.json'))
+    entry = index.get(str(test_file), 'tests.a.b.test_boot')
+    assert (entry.number, entry.title, entry.tags) == ('1.2', 'Boot', ['smoke', 'webui'])
+    index.save()
+    reloaded = DiscoveryIndex(str(tmp_path / 'index.json'))
+    assert reloaded.files == index.files
+    test_file.write_bytes(b'broken(')
+    assert reloaded.get(str(test_file), 'tests.a.b.test_boot') is None
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kali tests: addons added by a test go back to the addon pool, except after
+Kali has been closed; tests are filtered by their tags, also the ones added
+by setup.
+"""
+import pytest
+
+from kali.addons.main.addon import KaliMainAddon
+from kali.kali import Kali
+from kali.test_case import KaliTestCase
+
+
+class Logger(object):
+
+    def __init__(self):
+        self.errors = []
+
+    def debug(self, message):
+        pass
+
+    info = passed = failed = skipped = warning = debug
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def make_test(failure=None, tags=(), setup_tags=None, setups=None):
+    class KaliTest(KaliTestCase):
+
+        def __init__(self, kali, logger):
+            KaliTestCase.__init__(self, kali, logger, 'Pool', '1')
+
+        def setup(self):
+            if setups is not None:
+                setups.append(self)
+            self.kali.add_omnia_main_addon('main', ots_label='ots')
+            if setup_tags:
+                self.add_tags(setup_tags)
+            if failure is not None:
+                raise failure
+
+        def run(self):
+            self.kali._cur_test_case.add_passed()
+    KaliTest.tags = list(tags)
+    return KaliTest
+
+
+@pytest.fixture
+def kali():
+    k = Kali()
+    k.set_logger(Logger())
+    yield k
+    k.close()
+
+
+def test_addons_released_to_pool(kali):
+    assert kali.run(make_test()) is True
+    assert not kali.addons
+    assert len(kali.addon_pool) == 1
+
+
+def test_setup_error_releases_addons(kali):
+    with pytest.raises(RuntimeError):
+        kali.run(make_test(RuntimeError('setup failed')))
+    assert not kali.addons
+    assert len(kali.addon_pool) == 1
+
+
+def test_no_release_after_close(kali, monkeypatch):
+    closed = []
+    monkeypatch.setattr(KaliMainAddon, 'close', lambda self: closed.append(self) or True)
+    # Kali is closed on setup AttributeError
+    assert kali.run(make_test(AttributeError('missing'))) is False
+    assert len(closed) == 1
+    assert not kali.addons
+    assert len(kali.addon_pool) == 0
+    assert kali.logger.errors
+    # the closed addon is not reused, its key is free again
+    assert kali.run(make_test()) is True
+    assert kali.addon_pool.hits == 0
+
+
+def test_setup_tags_accepted(kali):
+    kali.accepted_tags = ['webui']
+    assert kali.run(make_test(tags=['smoke'], setup_tags=['webui'])) is True
+    assert kali.run(make_test(tags=['smoke'])) is False
+
+
+def test_setup_tags_expression(kali):
+    kali.set_tag_expression('smoke and webui')
+    assert kali.run(make_test(tags=['smoke'], setup_tags=['webui'])) is True
+    assert kali.run(make_test(tags=['smoke'], setup_tags=['dbus'])) is False
+
+
+def test_refused_class_tags_skip_setup(kali):
+    setups = []
+    kali.refused_tags = ['slow']
+    assert kali.run(make_test(tags=['slow'], setups=setups)) is False
+    assert setups == []
+    # refused tags added by setup are checked after it
+    assert kali.run(make_test(setup_tags=['slow'], setups=setups)) is False
+    assert len(setups) == 1
+    assert len(kali.addon_pool) == 1
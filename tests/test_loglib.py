@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Loglib tests: the log buffer budgets, spill file and cursors, and TCP
+handlers served by the shared selector reactor, against local log
+generators.
+"""
+import socket
+import threading
+import time
+
+import pytest
+
+loglib = pytest.importorskip('kali.addons.lib.Loglib.Loglib')
+
+
+def lines(start, stop):
+    return ["line %04d" % i for i in range(start, stop)]
+
+
+def test_buffer_list_behaviour():
+    buffer = loglib.LogBuffer()
+    buffer.append("héllo")
+    buffer.extend(["a", "", "b"])
+    assert len(buffer) == 4
+    assert buffer == ["héllo", "a", "", "b"]
+    assert buffer[0] == "héllo" and buffer[-1] == "b"
+    assert buffer[1:3] == ["a", ""]
+    assert buffer.get_bytes() == len("héllo".encode()) + 6
+    assert buffer.dump() == "héllo\na\n\nb"
+    with pytest.raises(IndexError):
+        buffer[4]
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.dump() == ""
+    assert buffer.evicted == 4
+
+
+def test_line_budget():
+    buffer = loglib.LogBuffer(max_lines=10)
+    buffer.extend(lines(0, 25))
+    assert list(buffer) == lines(15, 25)
+    assert buffer.evicted == 15
+    buffer.append("line 0025")
+    assert list(buffer) == lines(16, 26)
+
+
+def test_byte_budget():
+    # "line 0000" plus EOL is 10 bytes
+    buffer = loglib.LogBuffer(max_bytes=35)
+    buffer.extend(lines(0, 10))
+    assert list(buffer) == lines(7, 10)
+    assert buffer.get_bytes() == 30
+    # a line larger than the budget is evicted too
+    buffer.append("x" * 50)
+    assert list(buffer) == []
+    assert buffer.evicted == 11
+    buffer.set_budget(max_lines=1, max_bytes=None)
+    buffer.extend(lines(0, 3))
+    assert list(buffer) == ["line 0002"]
+
+
+def test_set_budget_evicts():
+    buffer = loglib.LogBuffer()
+    buffer.extend(lines(0, 20))
+    buffer.set_budget(max_lines=5)
+    assert list(buffer) == lines(15, 20)
+    buffer.set_budget(max_bytes=20)
+    assert list(buffer) == lines(18, 20)
+
+
+def test_spill(tmp_path):
+    path = str(tmp_path / 'spill.log')
+    buffer = loglib.LogBuffer(max_lines=3, spill_path=path)
+    assert buffer.spilled() is None
+    buffer.extend(lines(0, 5))
+    buffer.append("line 0005")
+    # the evicted lines are read back from the spill file
+    spilled = buffer.spilled()
+    try:
+        assert spilled[:].decode().splitlines() == lines(0, 3)
+    finally:
+        spilled.close()
+    assert list(buffer) == lines(3, 6)
+    buffer.close()
+    with open(path) as fp:
+        assert fp.read().splitlines() == lines(0, 3)
+
+
+def test_spill_path_changed(tmp_path):
+    first, second = str(tmp_path / 'first.log'), str(tmp_path / 'second.log')
+    buffer = loglib.LogBuffer(max_lines=2, spill_path=first)
+    buffer.extend(lines(0, 4))
+    buffer.set_budget(max_lines=1, spill_path=second)
+    buffer.close()
+    with open(first) as fp:
+        assert fp.read().splitlines() == lines(0, 2)
+    with open(second) as fp:
+        assert fp.read().splitlines() == lines(2, 3)
+
+
+def test_cursor_reads_new_lines():
+    buffer = loglib.LogBuffer()
+    buffer.extend(lines(0, 3))
+    cursor = buffer.cursor()
+    tail = buffer.cursor(from_start=False)
+    assert cursor.read(max_lines=2) == lines(0, 2)
+    assert cursor.read() == lines(2, 3)
+    assert cursor.read() == []
+    buffer.extend(lines(3, 5))
+    assert cursor.read_bytes() == b"line 0003\nline 0004"
+    assert cursor.read_bytes() == b""
+    assert tail.read() == lines(3, 5)
+    assert cursor.lost == 0 and tail.lost == 0
+
+
+def test_cursor_across_eviction(tmp_path):
+    buffer = loglib.LogBuffer(max_lines=5, spill_path=str(tmp_path / 's'))
+    buffer.extend(lines(0, 4))
+    cursor = buffer.cursor()
+    assert cursor.read(max_lines=1) == lines(0, 1)
+    buffer.extend(lines(4, 10))
+    # lines evicted before being read are counted as lost, they are in
+    # the spill file
+    assert cursor.read() == lines(5, 10)
+    assert cursor.lost == 4
+    buffer.extend(lines(10, 12))
+    assert cursor.read() == lines(10, 12)
+    assert cursor.lost == 4
+    spilled = buffer.spilled()
+    try:
+        assert spilled[:].decode().splitlines() == lines(0, 7)
+    finally:
+        spilled.close()
+    buffer.close()
+
+
+def test_cursor_across_compaction(monkeypatch):
+    monkeypatch.setattr(loglib, 'COMPACT_THRESHOLD', 64)
+    buffer = loglib.LogBuffer(max_lines=4)
+    cursor = buffer.cursor()
+    read = []
+    for start in range(0, 102, 3):
+        buffer.extend(lines(start, start + 3))
+        read.extend(cursor.read())
+    # the storage has been compacted, offsets of retained lines moved
+    assert len(buffer._data) < 100
+    assert list(buffer) == lines(98, 102)
+    assert read == lines(0, 102)
+    assert cursor.lost == 0
+
+
+class LogGenerator(object):
+    """TCP server sending a payload to the first client, by chunks"""
+
+    def __init__(self, payload, chunk=None, delay=0.0, keep_open=True):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.payload = payload
+        self.chunk = chunk or len(payload) or 1
+        self.delay = delay
+        self.keep_open = keep_open
+        self.client = None
+        threading.Thread(target=self.__serve, daemon=True).start()
+
+    def __serve(self):
+        self.client, _ = self.server.accept()
+        for start in range(0, len(self.payload), self.chunk):
+            self.client.sendall(self.payload[start:start + self.chunk])
+            if self.delay:
+                time.sleep(self.delay)
+        if not self.keep_open:
+            self.client.close()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.server.close()
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def generators():
+    started = []
+
+    def start(*args, **kwargs):
+        generator = LogGenerator(*args, **kwargs)
+        started.append(generator)
+        return generator
+
+    yield start
+    for generator in started:
+        generator.close()
+
+
+def test_multibyte_characters_split_across_chunks(generators):
+    generator = generators("héllo wörld €\nsecond ✓ line\npartial".encode(),
+                           chunk=3, delay=0.005)
+    log = loglib.LogLib()
+    log.add_tcp_handler('127.0.0.1', generator.port)
+    try:
+        assert wait_until(lambda: len(log.cache) == 2)
+        time.sleep(0.1)
+        # the last line has no EOL yet, it is not recorded
+        assert list(log.cache) == ["héllo wörld €", "second ✓ line"]
+    finally:
+        log.close()
+
+
+def test_handlers_share_one_reactor_thread(generators):
+    count = 20000
+    line = b"Jan 01 00:00:00 omnia ots[123]: journal message %08d\n"
+    payload = b"".join(line % i for i in range(count))
+    logs = []
+    try:
+        for _ in range(4):
+            log = loglib.LogLib()
+            log.add_tcp_handler('127.0.0.1', generators(payload).port)
+            logs.append(log)
+        assert wait_until(lambda: all(len(log.cache) == count
+                                      for log in logs))
+        for log in logs:
+            assert log.cache[count - 1].endswith("%08d" % (count - 1))
+            assert log.get_size() == len(payload) - count
+        reactors = [thread for thread in threading.enumerate()
+                    if thread.name == "LogReactor"]
+        assert len(reactors) == 1
+    finally:
+        for log in logs:
+            log.close()
+
+
+def test_listeners_notified(generators):
+    generator = generators(b"first\nsecond\n", chunk=6, delay=0.05)
+    log = loglib.LogLib()
+    notified = []
+    log.add_listener(lambda: notified.append(len(log.cache)))
+    log.add_tcp_handler('127.0.0.1', generator.port)
+    try:
+        assert wait_until(lambda: len(log.cache) == 2)
+        assert notified and notified[-1] == 2
+    finally:
+        log.close()
+
+
+def test_peer_closing(generators):
+    generator = generators(b"last line\n", keep_open=False)
+    log = loglib.LogLib()
+    log.add_tcp_handler('127.0.0.1', generator.port)
+    try:
+        assert wait_until(lambda: not log.is_alive())
+        assert list(log.cache) == ["last line"]
+    finally:
+        log.close()
+
+
+def test_limit(generators):
+    generator = generators(b"".join(b"%04d\n" % i for i in range(100)),
+                           chunk=50, delay=0.01)
+    log = loglib.LogLib()
+    log.add_tcp_handler('127.0.0.1', generator.port)
+    log.handlers[0].set_limit(100)
+    try:
+        time.sleep(0.5)
+        assert log.get_size() <= 100
+        assert len(log.cache) <= 25
+    finally:
+        log.close()
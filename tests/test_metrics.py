@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metrics tests: sinks fed by several threads at the same time (test thread,
+OTS keepalive, async clients).
+"""
+import json
+import sys
+import threading
+
+import pytest
+
+from kali.metrics import JsonlSink, MemorySink, Metrics, PrometheusSink, StepRecord
+
+THREADS = 8
+RECORDS = 2000
+
+
+@pytest.fixture(autouse=True)
+def frequent_switches():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def emit_concurrently(metrics):
+    def emit(thread):
+        for index in range(RECORDS):
+            metrics.emit(StepRecord('ots', 'ots%d' % thread, 'ping').finish(
+                index % 2 == 0, bytes_sent=10, bytes_received=20))
+
+    threads = [threading.Thread(target=emit, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_memory_sink():
+    sink = MemorySink(maxlen=THREADS * RECORDS // 2)
+    emit_concurrently(Metrics([sink]))
+    assert len(sink.snapshot()) == THREADS * RECORDS // 2
+
+
+def test_jsonl_sink(tmp_path):
+    path = str(tmp_path / 'steps.jsonl')
+    sink = JsonlSink(path, flush_every=7)
+    metrics = Metrics([sink])
+    emit_concurrently(metrics)
+    metrics.close()
+    with open(path) as fp:
+        lines = fp.read().splitlines()
+    assert len(lines) == THREADS * RECORDS
+    assert all(json.loads(line)['method'] == 'ping' for line in lines)
+    # records emitted after close are dropped
+    sink.emit(StepRecord('ots', 'ots', 'ping').finish())
+
+
+def test_prometheus_sink(tmp_path):
+    path = str(tmp_path / 'kali.prom')
+    sink = PrometheusSink(path, interval=0.001)
+    metrics = Metrics([sink])
+    emit_concurrently(metrics)
+    metrics.close()
+    totals = sink.snapshot()
+    assert len(totals) == THREADS
+    for steps, failures, _, sent, received, _ in totals.values():
+        assert (steps, failures, sent, received) == (RECORDS, RECORDS // 2, 10 * RECORDS, 20 * RECORDS)
+    with open(path) as fp:
+        text = fp.read()
+    assert 'kali_steps_total{kind="ots",addon="ots0",method="ping"} %d' % RECORDS in text
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OtsClient tests, against the local fake OTS server.
+"""
+import time
+
+import pytest
+
+from kali.exceptions import KaliExceptionValueError
+from kali.ots_client import OtsClient
+
+from fake_ots import FakeOts
+
+
+@pytest.fixture
+def client(fake_ots):
+    client = OtsClient('ots', '127.0.0.1', fake_ots.port, None,
+                       keepalive=None)
+    yield client
+    client.close_all()
+
+
+def test_send_echo(client):
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1}) == \
+        {'echo': {'do_method': {'i': 1}}}
+
+
+@pytest.mark.parametrize('size', [1, 127, 128, 65535, 65536, 5 * 1024 * 1024])
+def test_receive_large_reply(size):
+    server = FakeOts(reply_size=size)
+    client = OtsClient('ots', '127.0.0.1', server.port, None, keepalive=None)
+    try:
+        assert client.send('ots', 'journal', 'get', {}) == 'x' * size
+    finally:
+        client.close_all()
+        server.close()
+
+
+def test_receive_reply_in_small_chunks(fake_ots, client):
+    # header and payload split over many recv calls
+    fake_ots.chunk = 3
+    for i in range(3):
+        assert client.send('ots', 'dbus', 'do_method', {'i': i}) == \
+            {'echo': {'do_method': {'i': i}}}
+
+
+def test_bytes_counters(fake_ots, client):
+    pool = client.connections['ots']
+    client.send('ots', 'dbus', 'ping')
+    sent, received = pool.bytes_sent, pool.bytes_received
+    assert sent > 0 and received > 0
+    client.send('ots', 'dbus', 'ping')
+    assert pool.bytes_sent == 2 * sent
+    assert pool.bytes_received == 2 * received
+
+
+def test_connection_closed_before_reply(fake_ots, client):
+    fake_ots.drop = 1
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1}) is False
+    # the lost connection is reestablished for the next request
+    assert client.send('ots', 'dbus', 'do_method', {'i': 2}) == \
+        {'echo': {'do_method': {'i': 2}}}
+
+
+def test_send_many_keeps_order(fake_ots, client):
+    commands = [('dbus', 'do_method', {'i': i}) for i in range(50)]
+    returned = client.send_many('ots', commands, depth=4)
+    assert [value['echo']['do_method']['i'] for value in returned] == \
+        list(range(50))
+    # one connection, requests pipelined on it
+    assert fake_ots.connections == 1
+
+
+def test_send_many_invalid_depth(client):
+    with pytest.raises(KaliExceptionValueError):
+        client.send_many('ots', [('dbus', 'ping')], depth=0)
+
+
+def test_invalid_header_resyncs_connection(fake_ots, client):
+    fake_ots.corrupt = 1
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1}) is False
+    # the unread reply must not answer the next request
+    assert client.send('ots', 'dbus', 'do_method', {'i': 2}) == \
+        {'echo': {'do_method': {'i': 2}}}
+
+
+def test_invalid_header_in_pipelined_batch(fake_ots, client):
+    fake_ots.corrupt = 1
+    commands = [('dbus', 'do_method', {'i': i}) for i in range(8)]
+    assert client.send_many('ots', commands, depth=8) is False
+    returned = client.send_many('ots', commands, depth=8)
+    assert [value['echo']['do_method']['i'] for value in returned] == \
+        list(range(8))
+    assert client.send('ots', 'dbus', 'do_method', {'i': 9}) == \
+        {'echo': {'do_method': {'i': 9}}}
+
+
+def test_addon_batch(client):
+    dbus = pytest.importorskip('kali.addons.dbus.addon')
+    addon = dbus.KaliDbusOmniaAddon()
+    addon.set_ots_client(client, 'ots')
+    returned = addon.do_methods([('iface', 'method', [i]) for i in range(20)])
+    assert [value['echo']['do_method']['arg_dict']['arg_0']
+            for value in returned] == list(range(20))
+    assert addon.checker.returned == returned
+
+
+def wait_closed(fake_ots, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while fake_ots.connections:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def shared(fake_ots, client):
+    # a second label on the same OTS shares the connection pool
+    client.connect('other', '127.0.0.1', fake_ots.port)
+    assert client.connections['other'] is client.connections['ots']
+    return client
+
+
+def test_disconnect_label_only(fake_ots, shared):
+    assert shared.disconnect('ots')
+    assert shared.send('ots', 'dbus', 'ping') is False
+    assert not shared.is_connected('ots')
+    assert not shared.try_reconnect('ots')
+    # the other label keeps using the pool
+    assert shared.is_connected('other')
+    assert shared.send('other', 'dbus', 'ping')
+    assert fake_ots.connections == 1
+    shared.reconnect('ots')
+    assert shared.send('ots', 'dbus', 'ping')
+
+
+def test_disconnect_last_label_closes_pool(fake_ots, shared):
+    shared.disconnect('ots')
+    shared.disconnect('other')
+    assert wait_closed(fake_ots)
+    shared.connect('other', '127.0.0.1', fake_ots.port)
+    assert shared.send('other', 'dbus', 'ping')
+    assert shared.send('ots', 'dbus', 'ping') is False
+
+
+def test_disconnect_pool(fake_ots, shared):
+    assert shared.disconnect_pool('ots')
+    assert shared.send('ots', 'dbus', 'ping') is False
+    assert shared.send('other', 'dbus', 'ping') is False
+    assert wait_closed(fake_ots)
+    shared.reconnect('other')
+    assert shared.send('ots', 'dbus', 'ping')
+    assert shared.send('other', 'dbus', 'ping')
+
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ConnectionPool tests, against the local fake OTS server: checkout and
+checkin, pool sizes, idle expiry and connections opened while the pool is
+used or closed.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from kali.exceptions import KaliExceptionOtsConnection
+from kali.exceptions import KaliExceptionValueError
+from kali.ots_client import ConnectionHandler, ConnectionPool
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def pool(fake_ots):
+    pool = ConnectionPool('127.0.0.1', fake_ots.port, min_size=1,
+                          max_size=2, idle_timeout=None)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def slow_connect(monkeypatch):
+    """Connections take 0.5s to be established"""
+    original = ConnectionHandler._open
+    started = threading.Event()
+
+    def slow_open(ip, port):
+        started.set()
+        time.sleep(0.5)
+        return original(ip, port)
+    monkeypatch.setattr(ConnectionHandler, '_open', staticmethod(slow_open))
+    return started
+
+
+def checkout_later(pool):
+    """Check out a connection in a thread, returning the thread and the
+    checkout result (connection or exception)"""
+    result = []
+
+    def checkout():
+        try:
+            result.append(pool.checkout(timeout=5.0))
+        except KaliExceptionOtsConnection as e:
+            result.append(e)
+    thread = threading.Thread(target=checkout)
+    thread.start()
+    return thread, result
+
+
+def test_min_size(fake_ots):
+    pool = ConnectionPool('127.0.0.1', fake_ots.port, min_size=2,
+                          max_size=3)
+    try:
+        assert pool.size == 2
+        assert len(pool.idle_connections()) == 2
+        assert wait_until(lambda: fake_ots.connections == 2)
+    finally:
+        pool.close()
+
+
+@pytest.mark.parametrize('min_size, max_size', [(0, 1), (2, 1)])
+def test_invalid_size(fake_ots, min_size, max_size):
+    with pytest.raises(KaliExceptionValueError):
+        ConnectionPool('127.0.0.1', fake_ots.port, min_size, max_size)
+
+
+def test_checkout_checkin(pool):
+    first = pool.checkout()
+    assert pool.idle_connections() == []
+    # the pool is not full: a new connection is opened
+    second = pool.checkout()
+    assert second is not first
+    assert pool.size == 2
+    pool.checkin(first)
+    pool.checkin(second)
+    assert pool.idle_connections() == [first, second]
+    # the most recently checked in connection is reused
+    assert pool.checkout() is second
+
+
+def test_checkout_prefers_connected(pool):
+    first = pool.checkout()
+    second = pool.checkout()
+    pool.checkin(first)
+    pool.checkin(second)
+    second.disconnect()
+    assert pool.checkout() is first
+
+
+def test_checkout_timeout_when_full(pool):
+    connections = [pool.checkout(), pool.checkout()]
+    start = time.monotonic()
+    with pytest.raises(KaliExceptionOtsConnection):
+        pool.checkout(timeout=0.2)
+    assert time.monotonic() - start >= 0.2
+    assert pool.size == 2
+    # a checkin wakes a waiting checkout
+    threading.Timer(0.1, pool.checkin, (connections[0],)).start()
+    assert pool.checkout(timeout=5.0) is connections[0]
+
+
+def test_idle_expiry(fake_ots):
+    pool = ConnectionPool('127.0.0.1', fake_ots.port, min_size=1,
+                          max_size=3, idle_timeout=0.1)
+    try:
+        connections = [pool.checkout() for _ in range(3)]
+        for connection in connections:
+            pool.checkin(connection)
+        pool.expire()
+        assert pool.size == 3
+        time.sleep(0.2)
+        pool.expire()
+        # min_size connections are kept, the others are closed
+        assert pool.size == 1
+        assert wait_until(lambda: fake_ots.connections == 1)
+        pool.checkin(pool.checkout())
+        assert pool.size == 1
+    finally:
+        pool.close()
+
+
+def test_closed_connection_bytes_kept(pool):
+    connection = pool.checkout()
+    assert connection.communicate(json.dumps({'run': [{'dbus': ['ping']}]}))
+    sent = pool.bytes_sent
+    assert sent > 0
+    pool.close()
+    assert pool.bytes_sent == sent
+
+
+def test_bytes_while_connecting(pool, slow_connect):
+    pool.checkout()
+    thread, result = checkout_later(pool)
+    try:
+        assert slow_connect.wait(5.0)
+        # the slot reserved by the checkout is not a connection yet
+        assert pool.bytes_sent == 0
+        assert pool.bytes_received == 0
+        assert len(pool.connections()) == 1
+    finally:
+        thread.join()
+    assert isinstance(result[0], ConnectionHandler)
+    assert pool.size == 2
+
+
+def test_close_while_connecting(fake_ots, pool, slow_connect):
+    pool.checkout()
+    thread, result = checkout_later(pool)
+    assert slow_connect.wait(5.0)
+    pool.close()
+    thread.join()
+    assert isinstance(result[0], KaliExceptionOtsConnection)
+    assert pool.size == 0
+    assert wait_until(lambda: fake_ots.connections == 0)
+    with pytest.raises(KaliExceptionOtsConnection):
+        pool.checkout()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OtsClient fault injection: dropped connections, OTS going down and up (eg.
+board reboot), keepalive and reconnection backoff, against the fake OTS.
+"""
+import threading
+import time
+
+import pytest
+
+from kali import ots_client
+from kali.ots_client import ConnectionHandler, OtsClient, backoff_delay
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(ots_client, 'RECONNECT_BASE_DELAY', 0.05)
+    monkeypatch.setattr(ots_client, 'RECONNECT_MAX_DELAY', 0.2)
+
+
+@pytest.fixture
+def client(fake_ots):
+    client = OtsClient('ots', '127.0.0.1', fake_ots.port, None,
+                       keepalive=None)
+    yield client
+    client.close_all()
+
+
+@pytest.fixture
+def slow_connect(monkeypatch):
+    """Connections take 0.5s to be established"""
+    original = ConnectionHandler._open
+    started = threading.Event()
+
+    def slow_open(ip, port):
+        started.set()
+        time.sleep(0.5)
+        return original(ip, port)
+    monkeypatch.setattr(ConnectionHandler, '_open', staticmethod(slow_open))
+    return started
+
+
+def test_dropped_request_fails(fake_ots, client):
+    fake_ots.drop = 1
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1}) is False
+    # checking the connection does not reconnect it
+    assert not client.is_connected('ots')
+    assert not client.is_connected('ots')
+    assert fake_ots.connections == 0
+    assert client.send('ots', 'dbus', 'do_method', {'i': 2}) == \
+        {'echo': {'do_method': {'i': 2}}}
+    assert client.is_connected('ots')
+
+
+def test_dropped_idempotent_request_retried(fake_ots, client):
+    fake_ots.drop = 1
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1},
+                       idempotent=True) == {'echo': {'do_method': {'i': 1}}}
+    assert fake_ots.methods() == ['do_method', 'do_method']
+
+
+def test_idempotent_request_waits_reboot(fake_ots, client):
+    fake_ots.down()
+    threading.Timer(0.5, fake_ots.up).start()
+    start = time.monotonic()
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1},
+                       idempotent=True) == {'echo': {'do_method': {'i': 1}}}
+    assert time.monotonic() - start >= 0.4
+
+
+def test_request_fails_fast_during_reboot(fake_ots, client):
+    fake_ots.down()
+    start = time.monotonic()
+    assert client.send('ots', 'dbus', 'do_method', {'i': 1}) is False
+    assert time.monotonic() - start < 1.0
+    assert not client.try_reconnect('ots')
+    fake_ots.up()
+    assert wait_until(lambda: client.try_reconnect('ots'))
+    assert client.send('ots', 'dbus', 'ping')
+
+
+def test_cached_liveness(fake_ots, client):
+    assert client.send('ots', 'dbus', 'ping')
+    count = len(fake_ots.requests)
+    assert client.check_connection('ots')
+    assert len(fake_ots.requests) == count
+    assert client.check_connection('ots', max_age=0)
+    assert len(fake_ots.requests) == count + 1
+
+
+def test_disconnected_not_reconnected(fake_ots, client):
+    client.disconnect('ots')
+    assert not client.try_reconnect('ots')
+    assert client.send('ots', 'dbus', 'ping') is False
+    client.reconnect('ots')
+    assert client.send('ots', 'dbus', 'ping')
+
+
+def test_keepalive_pings_and_reconnects(fake_ots):
+    client = OtsClient('ots', '127.0.0.1', fake_ots.port, None,
+                       keepalive=0.2)
+    try:
+        assert wait_until(lambda: 'ping' in fake_ots.methods())
+        fake_ots.down()
+        # the ping finds out the connection is lost
+        assert wait_until(lambda: not client.is_connected('ots'))
+        fake_ots.up()
+        assert wait_until(lambda: client.is_connected('ots'))
+        assert client.send('ots', 'dbus', 'ping')
+    finally:
+        client.close_all()
+
+
+def test_reconnect_connects_out_of_lock(fake_ots, client, slow_connect):
+    connection = client.connections['ots'].connections()[0]
+    connection._drop()
+    keepalive = threading.Thread(
+        target=connection.try_reconnect, kwargs={'blocking': False})
+    keepalive.start()
+    try:
+        assert slow_connect.wait(5.0)
+        # the lock is free while the socket connects
+        assert connection.lock.acquire(timeout=0.2)
+        connection.lock.release()
+    finally:
+        keepalive.join()
+    assert connection.is_connected()
+
+
+def test_request_waits_reconnection_in_progress(fake_ots, client,
+                                                slow_connect):
+    connection = client.connections['ots'].connections()[0]
+    connection._drop()
+    keepalive = threading.Thread(
+        target=connection.try_reconnect, kwargs={'blocking': False})
+    keepalive.start()
+    try:
+        assert slow_connect.wait(5.0)
+        # a request does not fail because the keepalive is connecting
+        assert client.send('ots', 'dbus', 'do_method', {'i': 1}) == \
+            {'echo': {'do_method': {'i': 1}}}
+    finally:
+        keepalive.join()
+    assert fake_ots.connections == 1
+
+
+def test_backoff_jitter():
+    delays = [backoff_delay(10) for _ in range(200)]
+    assert all(0.1 <= delay <= 0.2 for delay in delays)
+    assert len(set(delays)) > 1
+    assert backoff_delay(1) <= 0.05 < backoff_delay(3) * 2
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Readiness probe tests: HttpProbe against a local http.server, FileProbe on
+a temporary download folder, StableProbe and AngularIdleProbe with a fake
+driver.
+"""
+import http.server
+import os
+import socket
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from kali.exceptions import KaliExceptionTimeout
+from kali.probes import SCRIPT_TIMEOUT_MARGIN, AngularIdleProbe, FileProbe, \
+    HttpProbe, StableProbe
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Answers with the status code in the path, eg. GET /404"""
+
+    def do_GET(self):
+        self.send_response(int(self.path.strip('/')))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def later(delay, function, *args):
+    timer = threading.Timer(delay, function, args)
+    timer.start()
+    return timer
+
+
+@pytest.mark.parametrize('status, ready', [
+    (200, True), (302, True), (404, True), (500, False), (503, False)])
+def test_http_status(http_server, status, ready):
+    assert HttpProbe('%s/%s' % (http_server, status)).check() is ready
+
+
+def test_http_refused(closed_port):
+    probe = HttpProbe('http://127.0.0.1:%s/' % closed_port, interval=0.05)
+    assert probe.check() is False
+    assert probe.wait_down(0.1)
+    assert not probe.wait(0.1)
+    with pytest.raises(KaliExceptionTimeout):
+        probe.require(0.1)
+
+
+def test_http_invalid_url():
+    assert HttpProbe('not a url').check() is False
+
+
+def test_http_wait(http_server):
+    probe = HttpProbe('%s/200' % http_server, interval=0.05)
+    assert probe.wait(1.0)
+    assert probe.require(1.0)
+    # the board does not go down
+    start = time.monotonic()
+    assert not probe.wait_down(0.2)
+    assert time.monotonic() - start >= 0.2
+
+
+def test_file_new(tmp_path):
+    (tmp_path / 'old.csv').write_text('old')
+    probe = FileProbe(str(tmp_path), existing=os.listdir(str(tmp_path)))
+    assert not probe.check()
+    assert probe.found is None
+    (tmp_path / 'new.csv').write_text('new')
+    assert probe.check()
+    assert probe.found == str(tmp_path / 'new.csv')
+
+
+@pytest.mark.parametrize('suffix', ['.crdownload', '.part', '.tmp'])
+def test_file_partial_download(tmp_path, suffix):
+    (tmp_path / 'done.csv').write_text('done')
+    partial = tmp_path / ('report.csv' + suffix)
+    partial.write_text('partial')
+    probe = FileProbe(str(tmp_path), interval=0.05)
+    # a complete file is not enough while another is downloading
+    assert not probe.check()
+    assert not probe.wait(0.1)
+    later(0.1, os.rename, str(partial), str(tmp_path / 'report.csv'))
+    assert probe.wait(2.0)
+    assert os.path.basename(probe.found) in ('done.csv', 'report.csv')
+
+
+def test_file_ignores_folders(tmp_path):
+    probe = FileProbe(str(tmp_path))
+    (tmp_path / 'folder').mkdir()
+    assert not probe.check()
+
+
+def test_file_missing_folder(tmp_path):
+    probe = FileProbe(str(tmp_path / 'missing'), interval=0.05)
+    assert not probe.check()
+    with pytest.raises(KaliExceptionTimeout):
+        probe.require(0.1)
+
+
+def test_stable():
+    values = iter([0, 10, 20, 30, 30, 30])
+    probe = StableProbe(lambda: next(values), interval=0.01)
+    assert probe.wait(1.0)
+    # two equal values in a row
+    assert next(values) == 30
+
+
+def test_stable_first_check():
+    probe = StableProbe(lambda: None)
+    # the first value is not compared to anything
+    assert not probe.check()
+    assert probe.check()
+
+
+def test_stable_timeout():
+    counter = iter(range(1000))
+    probe = StableProbe(lambda: next(counter), interval=0.01)
+    with pytest.raises(KaliExceptionTimeout):
+        probe.require(0.1)
+
+
+class Driver(object):
+
+    def __init__(self, async_result=True, script_result=True):
+        self.async_result = async_result
+        self.script_result = script_result
+        self.script_timeout = None
+        self.async_calls = []
+        self.scripts = 0
+
+    def set_script_timeout(self, seconds):
+        self.script_timeout = seconds
+
+    def execute_async_script(self, script, *args):
+        self.async_calls.append((args, self.script_timeout))
+        if isinstance(self.async_result, Exception):
+            raise self.async_result
+        return self.async_result
+
+    def execute_script(self, script, *args):
+        self.scripts += 1
+        if callable(self.script_result):
+            return self.script_result()
+        if isinstance(self.script_result, Exception):
+            raise self.script_result
+        return self.script_result
+
+
+def test_angular_idle():
+    driver = Driver()
+    assert AngularIdleProbe(driver, timeout=10).wait()
+    # a single async script, the driver waiting longer than the page
+    assert driver.async_calls == [((10,), 10 + SCRIPT_TIMEOUT_MARGIN)]
+    assert driver.scripts == 0
+
+
+def test_angular_busy():
+    driver = Driver(async_result=False)
+    assert not AngularIdleProbe(driver).wait(2)
+    assert driver.async_calls == [((2,), 2 + SCRIPT_TIMEOUT_MARGIN)]
+
+
+def test_angular_fallback_to_polling():
+    # page reloading: the async script fails, then the page gets idle
+    results = iter([False, None, True])
+    driver = Driver(async_result=WebDriverException('reloading'),
+                    script_result=lambda: next(results))
+    probe = AngularIdleProbe(driver, interval=0.01)
+    assert probe.wait(1.0)
+    assert driver.scripts == 3
+
+
+def test_angular_fallback_timeout():
+    driver = Driver(async_result=WebDriverException('script timeout'),
+                    script_result=WebDriverException('no page'))
+    probe = AngularIdleProbe(driver, interval=0.01)
+    start = time.monotonic()
+    with pytest.raises(KaliExceptionTimeout):
+        probe.require(0.2)
+    # the time spent in the async script counts in the timeout
+    assert time.monotonic() - start < 1.0
+    assert driver.scripts >= 1
+
+
+def test_angular_wait_down():
+    driver = Driver(script_result=False)
+    assert AngularIdleProbe(driver).wait_down(1.0)
+    # no async script waiting for the page to be busy
+    assert driver.async_calls == []
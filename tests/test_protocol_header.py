@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OTS E0 header codec tests: fixed layout fast path against the generic TLV
+encoder and decoder.
+"""
+import pytest
+
+from kali.exceptions import KaliExceptionOtsInvalidHeader
+from kali.ots_client import read_header_length
+from kali.protocol_header import create_header
+from kali.protocol_header import create_header_tlv
+from kali.protocol_header import decode_header
+from kali.protocol_header import parse_header
+
+LENGTHS = [0, 1, 5, 127, 128, 255, 256, 65535, 65536, 1 << 20, 1 << 40]
+
+
+@pytest.mark.parametrize('length', LENGTHS)
+def test_create_header_matches_tlv(length):
+    assert create_header(length, 'json') == create_header_tlv(length, 'json')
+    assert create_header(length, 'JSON') == create_header_tlv(length, 'json')
+
+
+@pytest.mark.parametrize('length', LENGTHS)
+def test_decode_header(length):
+    header = create_header(length, 'json')
+    assert decode_header(header) == (length, 0)
+    assert read_header_length(header) == length
+    assert parse_header(header) == (length, 'json')
+
+
+@pytest.mark.parametrize('header', [
+    # unknown format
+    b'\xe0\x09\xdf\x01\x02\x01\x00\xdf\x02\x01\x07',
+    # outer length not matching the fields
+    b'\xe0\x08\xdf\x01\x02\x01\x00\xdf\x02\x01\x00',
+    b'\xe0\x81\x08\xdf\x01\x02\x01\x00\xdf\x02\x01\x07',
+    # format missing
+    b'\xe0\x04\xdf\x01\x01\x05',
+])
+def test_invalid_header(header):
+    with pytest.raises(KaliExceptionOtsInvalidHeader):
+        read_header_length(header)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reporter tests on real files: JUnit and JSONL results valid after each
+test and continued on resume, fsync policies, and the checkpoint journal of
+a crashed run repaired and resumed, completed tests not run again.
+"""
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from kali import reporters
+from kali.exceptions import KaliExceptionValueError
+from kali.kali import Kali
+from kali.metrics import StepRecord
+from kali.reporters import CheckpointJournal, JsonlReporter, JunitReporter
+from kali.test_case import KaliTestCase, KaliTestResultManager
+
+RUN_INFO = {'ip': '10.0.0.1', 'port': 10000}
+
+
+class Logger(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def debug(self, message):
+        self.messages.append(message)
+
+    info = passed = failed = skipped = warning = error = debug
+
+
+def make_test(number, passed=True, runs=None):
+    class KaliTest(KaliTestCase):
+
+        def __init__(self, kali, logger):
+            KaliTestCase.__init__(self, kali, logger, 'Test %s' % number,
+                                  number)
+
+        def setup(self):
+            pass
+
+        def run(self):
+            if runs is not None:
+                runs.append(number)
+            if passed:
+                self.kali._cur_test_case.add_passed()
+            else:
+                self.kali._cur_test_case.add_failed()
+    return KaliTest
+
+
+def result(*steps, records=()):
+    test_case = KaliTestResultManager()
+    test_case.steps_result = list(steps)
+    for record in records:
+        test_case.add_step(record)
+    test_case.close()
+    return test_case
+
+
+def junit_cases(path):
+    suite = ET.parse(path).getroot()
+    assert suite.tag == 'testsuite'
+    return [(case.get('name'), case.find('failure') is not None)
+            for case in suite.findall('testcase')]
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(reporters.os, 'fsync', calls.append)
+    return calls
+
+
+def new_kali():
+    kali = Kali()
+    kali.set_logger(Logger())
+    return kali
+
+
+def read_events(path):
+    with open(path) as fp:
+        return [json.loads(line) for line in fp.read().splitlines()]
+
+
+@pytest.fixture
+def crashed_journal(tmp_path):
+    """Journal of a run which completed tests 1 and 2 and crashed while
+    writing the end of test 3"""
+    path = str(tmp_path / 'journal.jsonl')
+    kali = new_kali()
+    kali.add_reporter(CheckpointJournal(path, run_info=RUN_INFO))
+    assert kali.run(make_test('1'))
+    assert kali.run(make_test('2', passed=False))
+    kali.start_test_case('3', 'Test 3')
+    kali.close()
+    with open(path, 'a') as fp:
+        fp.write('{"event": "end", "number": "3", "ti')
+    return path
+
+
+def test_new_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with open(path, 'w') as fp:
+        fp.write('{"event": "run", "info": {"ip": "old"}}\n')
+    journal = CheckpointJournal(path, run_info=RUN_INFO)
+    journal.start('1', 'Test 1')
+    journal.close()
+    # without resume the journal is replaced
+    assert read_events(path) == [
+        {'event': 'run', 'info': RUN_INFO},
+        {'event': 'start', 'number': '1', 'title': 'Test 1'}]
+
+
+def test_torn_line_repaired(crashed_journal):
+    journal = CheckpointJournal(crashed_journal, resume=True)
+    journal.close()
+    with open(crashed_journal, 'rb') as fp:
+        assert fp.read().endswith(b'"title": "Test 3"}\n')
+    events = read_events(crashed_journal)
+    assert [event['event'] for event in events] == \
+        ['run', 'start', 'end', 'start', 'end', 'start']
+
+
+def test_reload(crashed_journal):
+    journal = CheckpointJournal(crashed_journal, resume=True)
+    journal.close()
+    # reattaching to the OTS of the interrupted run
+    assert journal.run_info == RUN_INFO
+    assert list(journal.completed) == [('1', 'Test 1'), ('2', 'Test 2')]
+    assert journal.is_completed('1', 'Test 1')
+    assert not journal.is_completed('3', 'Test 3')
+    assert journal.interrupted == [('3', 'Test 3')]
+    restored = journal.restore()
+    assert [result.result for result in restored.values()] == [True, False]
+    assert all(result.is_closed() for result in restored.values())
+
+
+def test_resume_skips_completed(crashed_journal):
+    journal = CheckpointJournal(crashed_journal, resume=True)
+    kali = new_kali()
+    restored = kali.resume(journal)
+    kali.add_reporter(journal)
+    runs = []
+    assert list(restored) == [('1', 'Test 1'), ('2', 'Test 2')]
+    assert not kali.run(make_test('1', runs=runs))
+    assert not kali.run(make_test('2', runs=runs))
+    # the interrupted test runs again
+    assert kali.run(make_test('3', runs=runs))
+    assert runs == ['3']
+    assert kali.test_cases[('2', 'Test 2')].result is False
+    assert kali.test_cases[('3', 'Test 3')].result is True
+    assert any('Test 3 was interrupted' in message
+               for message in kali.logger.messages)
+    kali.close()
+    # a second crash resumes from the continued journal
+    journal = CheckpointJournal(crashed_journal, resume=True)
+    journal.close()
+    assert list(journal.completed) == \
+        [('1', 'Test 1'), ('2', 'Test 2'), ('3', 'Test 3')]
+    assert journal.interrupted == []
+    assert journal.run_info == RUN_INFO
+
+
+def test_junit_valid_after_each_report(tmp_path):
+    path = str(tmp_path / 'junit.xml')
+    reporter = JunitReporter(path, suite='omnia')
+    assert junit_cases(path) == []
+    reporter.report('1', 'Boot', result(True, True))
+    # readable before close, as after a crash
+    assert junit_cases(path) == [('1 - Boot', False)]
+    reporter.report('2', 'Login <admin> & "root"', result(True, False))
+    reporter.close()
+    assert junit_cases(path) == [('1 - Boot', False),
+                                 ('2 - Login <admin> & "root"', True)]
+    suite = ET.parse(path).getroot()
+    assert suite.get('name') == 'omnia'
+    failure = suite.findall('testcase')[1].find('failure')
+    assert failure.get('message') == '1 of 2 steps failed'
+    assert all(case.get('classname') == 'omnia'
+               for case in suite.findall('testcase'))
+
+
+def test_junit_resume(tmp_path):
+    path = str(tmp_path / 'junit.xml')
+    reporter = JunitReporter(path)
+    reporter.report('1', 'Boot', result(True))
+    reporter.close()
+    reporter = JunitReporter(path, resume=True)
+    reporter.report('2', 'Login', result(False))
+    assert junit_cases(path) == [('1 - Boot', False), ('2 - Login', True)]
+    reporter.close()
+    assert junit_cases(path) == [('1 - Boot', False), ('2 - Login', True)]
+
+
+def test_junit_resume_invalid_file(tmp_path):
+    path = str(tmp_path / 'junit.xml')
+    with open(path, 'w') as fp:
+        fp.write('<?xml version="1.0"?>\n<testsuite name="kali">\n  <testc')
+    reporter = JunitReporter(path, resume=True)
+    reporter.report('1', 'Boot', result(True))
+    reporter.close()
+    # a file without the closing tag is replaced
+    assert junit_cases(path) == [('1 - Boot', False)]
+
+
+def test_jsonl_records(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    reporter = JsonlReporter(path, extra={'environment': 'omnia1'})
+    step = StepRecord('ots', 'main', 'ping').finish(True)
+    reporter.report('1', 'Boot', result(True, False, records=[step, step]))
+    reporter.close()
+    reporter = JsonlReporter(path, resume=True)
+    reporter.report('2', 'Login', result(True))
+    reporter.close()
+    with open(path) as fp:
+        first, second = [json.loads(line) for line in fp]
+    assert first['number'] == '1' and first['title'] == 'Boot'
+    assert first['result'] is False
+    assert (first['steps_passed'], first['steps_failed']) == (1, 1)
+    assert first['environment'] == 'omnia1'
+    assert first['steps'] == [{'kind': 'ots', 'addon': 'main',
+                               'method': 'ping',
+                               'seconds': 2 * step.duration}]
+    assert second['number'] == '2' and second['result'] is True
+    assert 'steps' not in second and 'environment' not in second
+    # without resume the file is replaced
+    JsonlReporter(path).close()
+    with open(path) as fp:
+        assert fp.read() == ''
+
+
+@pytest.mark.parametrize('fsync, expected', [
+    ('always', [1, 2, 3, 4, 5]),
+    ('close', [0, 0, 0, 0, 1]),
+    ('never', [0, 0, 0, 0, 0]),
+    (2, [0, 1, 1, 2, 3]),
+])
+def test_fsync_policy(tmp_path, fsyncs, fsync, expected):
+    reporter = JsonlReporter(str(tmp_path / 'results.jsonl'), fsync=fsync)
+    counts = []
+    for number in range(4):
+        reporter.report(str(number), 'Test', result(True))
+        counts.append(len(fsyncs))
+    reporter.close()
+    counts.append(len(fsyncs))
+    assert counts == expected
+
+
+@pytest.mark.parametrize('fsync', ['sometimes', 0, -1])
+def test_invalid_fsync_policy(tmp_path, fsync):
+    with pytest.raises(KaliExceptionValueError):
+        JsonlReporter(str(tmp_path / 'results.jsonl'), fsync=fsync)
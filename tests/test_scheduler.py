@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scheduler tests: the tests of a crashed worker are recorded, not dropped;
+timing history and balancing of the environments.
+"""
+import json
+import os
+from collections import OrderedDict
+
+import pytest
+
+import scheduler
+from scheduler import ParallelScheduler, TimingHistory, bin_pack, \
+    history_key, merge_results, shard
+
+
+class Logger(object):
+
+    def __init__(self):
+        self.errors = []
+
+    def info(self, message):
+        pass
+
+    def error(self, message):
+        self.errors.append(message)
+
+
+def worker(environment, entries, crash):
+    if environment[0] == crash:
+        raise RuntimeError('board unreachable')
+    return [(index, (item, environment[0]), 'passed') for index, item in entries]
+
+
+def dying_worker(environment, entries):
+    os._exit(1)
+
+
+def crashed(environment, entries, error):
+    return [(index, (item, environment[0]), 'failed: %s' % error)
+            for index, item in entries]
+
+
+def test_crashed_shard_recorded():
+    logger = Logger()
+    scheduler = ParallelScheduler([('env1', '10.0.0.1'), ('env2', '10.0.0.2')],
+                                  worker, logger, on_crash=crashed)
+    results = scheduler.run(['a', 'b', 'c', 'd'], 'env2')
+    assert list(results.items()) == [
+        (('a', 'env1'), 'passed'),
+        (('b', 'env2'), 'failed: board unreachable'),
+        (('c', 'env1'), 'passed'),
+        (('d', 'env2'), 'failed: board unreachable'),
+    ]
+    assert len(logger.errors) == 1
+
+
+def test_dead_worker_process_recorded():
+    scheduler = ParallelScheduler([('env1', '10.0.0.1')], dying_worker,
+                                  Logger(), on_crash=crashed)
+    results = scheduler.run(['a', 'b'])
+    assert [key for key in results] == [('a', 'env1'), ('b', 'env1')]
+    assert all(result.startswith('failed') for result in results.values())
+
+
+def test_crashed_shard_dropped_without_handler():
+    scheduler = ParallelScheduler([('env1', '10.0.0.1'), ('env2', '10.0.0.2')],
+                                  worker, Logger())
+    results = scheduler.run(['a', 'b'], 'env2')
+    assert list(results) == [('a', 'env1')]
+
+
+class Result(object):
+
+    def __init__(self, duration):
+        self.duration = duration
+
+
+def run(*durations):
+    """Kali.test_cases of a run of tests '1', '2'... with these durations"""
+    return OrderedDict(((str(number), 'Test'), Result(duration))
+                       for number, duration in enumerate(durations, 1))
+
+
+def test_history_ewma(tmp_path):
+    history = TimingHistory(str(tmp_path / 'history.json'))
+    assert history.record(run(10.0)) == []
+    assert history.tests[history_key('1', 'Test')] == \
+        {'mean': 10.0, 'last': 10.0, 'runs': 1}
+    history.record(run(12.0))
+    history.record(run(6.0))
+    alpha = scheduler.HISTORY_ALPHA
+    mean = alpha * 12.0 + (1 - alpha) * 10.0
+    mean = alpha * 6.0 + (1 - alpha) * mean
+    assert history.estimate('1', 'Test') == pytest.approx(mean)
+    assert history.tests[history_key('1', 'Test')]['last'] == 6.0
+    assert history.tests[history_key('1', 'Test')]['runs'] == 3
+
+
+def test_history_skips_tests_without_duration(tmp_path):
+    history = TimingHistory(str(tmp_path / 'history.json'))
+    history.record(run(None, 2.0))
+    assert list(history.tests) == [history_key('2', 'Test')]
+
+
+def test_estimate_unknown_tests(tmp_path):
+    history = TimingHistory(str(tmp_path / 'history.json'))
+    assert history.estimate('9', 'Test') == scheduler.DEFAULT_DURATION
+    history.record(run(3.0, 1.0, 20.0))
+    # the median of the known tests
+    assert history.estimate('9', 'Test') == 3.0
+    assert history.estimate('9', 'Test', default=7.0) == 7.0
+    assert history.estimate('3', 'Test', default=7.0) == 20.0
+
+
+def test_regression(tmp_path):
+    history = TimingHistory(str(tmp_path / 'history.json'), ratio=1.5)
+    history.record(run(10.0, 0.5, 10.0))
+    regressions = history.record(run(16.0, 1.2, 14.0))
+    # test 2 is 2.4 times slower, but by less than REGRESSION_MIN_DELTA
+    assert regressions == [('1', 'Test', 10.0, 16.0)]
+
+
+def test_history_save_reload(tmp_path):
+    path = str(tmp_path / 'history.json')
+    history = TimingHistory(path)
+    history.record(run(4.0, 8.0))
+    history.save()
+    assert not os.path.exists(path + '.tmp')
+    reloaded = TimingHistory(path)
+    assert reloaded.tests == history.tests
+    assert reloaded.estimate('2', 'Test') == 8.0
+    history.record(run(2.0))
+    history.save()
+    with open(path) as fp:
+        assert json.load(fp) == history.tests
+
+
+def test_history_invalid_file(tmp_path):
+    path = tmp_path / 'history.json'
+    path.write_text('{"1 - Test": {"mean"')
+    assert TimingHistory(str(path)).tests == {}
+
+
+def test_bin_pack_lpt():
+    weights = [2.0, 7.0, 4.0, 5.0, 3.0, 1.0]
+    bins = bin_pack(weights, 2)
+    # each bin is in decreasing weight order, every item is assigned once
+    for items in bins:
+        assert [weights[i] for i in items] == \
+            sorted((weights[i] for i in items), reverse=True)
+    assert sorted(i for items in bins for i in items) == list(range(6))
+    assert sorted(sum(weights[i] for i in items) for items in bins) == \
+        [11.0, 11.0]
+
+
+def test_bin_pack_balances():
+    bins = bin_pack([8.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0], 2)
+    # round robin would give 12 and 4
+    assert sorted(len(items) for items in bins) == [1, 8]
+    assert bin_pack([], 3) == [[], [], []]
+    assert sorted(map(len, bin_pack([1.0, 1.0], 3))) == [0, 1, 1]
+
+
+def test_shard_and_merge():
+    assert shard(['a', 'b', 'c'], 2) == [['a', 'c'], ['b']]
+    merged = merge_results([[(2, 'c', 3)], [(0, 'a', 1), (1, 'b', 2)]])
+    assert list(merged.items()) == [('a', 1), ('b', 2), ('c', 3)]
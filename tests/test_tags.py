@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tag filter tests: expression tokenizer and parser, allow/deny/any_of lists.
+"""
+import pytest
+
+from kali.exceptions import KaliExceptionValueError
+from kali.tags import TagFilter, _tokenize, compile_expression
+
+
+def matches(expression, *tags):
+    return compile_expression(expression)(frozenset(tags))
+
+
+def test_tokenize():
+    assert _tokenize('smoke and (webui or !dbus)') == \
+        ['smoke', '&', '(', 'webui', '|', '!', 'dbus', ')']
+    assert _tokenize('  a&b|c  ') == ['a', '&', 'b', '|', 'c']
+    # operator words are case insensitive, tags are not
+    assert _tokenize('A AND NOT b Or c') == ['A', '&', '!', 'b', '|', 'c']
+    assert _tokenize('ots-v2.1:slow') == ['ots-v2.1:slow']
+
+
+def test_tag():
+    assert matches('smoke', 'smoke', 'webui')
+    assert not matches('smoke', 'webui')
+    assert not matches('Smoke', 'smoke')
+
+
+def test_precedence():
+    # not binds tighter than and, and tighter than or
+    assert matches('a or b and c', 'a')
+    assert not matches('a or b and c', 'b')
+    assert matches('a or b and c', 'b', 'c')
+    assert matches('not a and b', 'b')
+    assert not matches('not a and b', 'a', 'b')
+    assert matches('a and not b or c', 'c', 'b')
+    assert not matches('a and not b or c', 'a', 'b')
+    assert matches('not not a', 'a')
+
+
+def test_parentheses():
+    assert not matches('(a or b) and c', 'a')
+    assert matches('(a or b) and c', 'b', 'c')
+    assert matches('not (a and b)', 'a')
+    assert not matches('not (a and b)', 'a', 'b')
+    assert matches('((a))', 'a')
+    assert matches('smoke and (webui or dbus) and not slow', 'smoke', 'dbus')
+    assert not matches('smoke and (webui or dbus) and not slow',
+                       'smoke', 'dbus', 'slow')
+
+
+def test_conjunction_of_tags():
+    assert matches('a and b and c', 'a', 'b', 'c', 'd')
+    assert not matches('a and b and c', 'a', 'c')
+    assert matches('a & b & !c', 'a', 'b')
+
+
+@pytest.mark.parametrize('expression', [
+    '', '   ', 'a and', 'or a', 'a b', '(a', 'a)', '()', 'a and (b or)',
+    'not', 'a & & b', 'a | ) b'])
+def test_malformed(expression):
+    with pytest.raises(KaliExceptionValueError):
+        compile_expression(expression)
+
+
+def test_allow():
+    tag_filter = TagFilter(allow=['smoke', 'webui'])
+    assert tag_filter(['smoke', 'webui', 'slow'])
+    assert not tag_filter(['smoke'])
+    assert TagFilter()([])
+
+
+def test_deny():
+    tag_filter = TagFilter(deny=['slow', 'manual'])
+    assert tag_filter(['smoke'])
+    assert tag_filter([])
+    assert not tag_filter(['smoke', 'manual'])
+
+
+def test_any_of():
+    tag_filter = TagFilter(any_of=['webui', 'dbus'])
+    assert tag_filter(['dbus'])
+    assert not tag_filter(['smoke'])
+    assert not tag_filter([])
+
+
+def test_combined():
+    tag_filter = TagFilter(allow=['smoke'], deny=['slow'],
+                           any_of=['webui', 'dbus'], expression='not manual')
+    assert tag_filter(['smoke', 'webui'])
+    assert tag_filter(frozenset(['smoke', 'dbus', 'ots']))
+    assert not tag_filter(['webui'])
+    assert not tag_filter(['smoke'])
+    assert not tag_filter(['smoke', 'webui', 'slow'])
+    assert not tag_filter(['smoke', 'webui', 'manual'])
+    # deny wins over allow
+    assert not TagFilter(allow=['a'], deny=['a'])(['a'])
+
+
+def test_invalid_filter_expression():
+    with pytest.raises(KaliExceptionValueError):
+        TagFilter(expression='smoke and')
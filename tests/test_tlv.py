@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLV tests: zero-copy views and indexed TLVs collections.
+"""
+import pytest
+
+from kali.COMMON.TLV import APDU2TLV
+from kali.COMMON.TLV import TLV
+from kali.COMMON.TLV import TLVs
+from kali.COMMON.TLV import dump_tlvs
+from kali.COMMON.TLV import iter_tlv_views
+
+
+def tlv(tag, value):
+    return TLV(tag, value).hexdump()
+
+
+# 70 { 9F02, 5A, A5 { 50, BF0C { 9F4D } } } DF10
+INNER = tlv(b'\x9f\x02', b'\x00\x00\x00\x01\x00\x00') + \
+    tlv(b'\x5a', b'\x41\x11' * 4)
+RECORD = tlv(b'\x70', INNER + tlv(b'\xa5', tlv(b'\x50', b'VISA' * 10) +
+                                  tlv(b'\xbf\x0c', tlv(b'\x9f\x4d',
+                                                       b'\x0b\x0a'))))
+LONG = tlv(b'\xdf\x10', bytes(range(256)) * 2)
+DATA = RECORD + LONG
+
+
+def test_views_match_apdu2tlv():
+    views = list(iter_tlv_views(DATA))
+    parsed = APDU2TLV(RECORD, 0) + APDU2TLV(LONG, 0)
+    assert [(view.getTag(), view.getLen(), view.getVal())
+            for view in views] == [tuple(fields) for fields in parsed]
+    assert views[1].length == 512
+    assert views[1].getLen() == b'\x82\x02\x00'
+
+
+def test_views_share_buffer():
+    buffer = bytearray(DATA)
+    view = next(iter_tlv_views(buffer))
+    assert isinstance(view.value, memoryview)
+    buffer[view.val_offset] = 0x5f
+    assert view.value[0] == 0x5f
+
+
+def test_children_parsed_lazily():
+    record = next(iter_tlv_views(DATA))
+    assert record._children is None
+    assert record.is_constructed()
+    assert [child.getTag() for child in record.children] == \
+        [b'\x9f\x02', b'\x5a', b'\xa5']
+    template = record.children[2]
+    assert template._children is None
+    assert record.find(b'\x9f\x4d').getVal() == b'\x0b\x0a'
+    assert template._children is not None
+    # primitive TLVs have no children, unrelated branches stay undecoded
+    assert record.children[0].children == ()
+    assert record.find(b'\x9f\x99') is None
+
+
+def test_dump_round_trip():
+    views = list(iter_tlv_views(DATA))
+    assert dump_tlvs(views) == DATA
+    assert str(views[0]) == RECORD.hex().upper()
+    converted = views[0].to_tlv()
+    assert type(converted) is TLV
+    assert converted.hexdump() == RECORD
+    collection = TLVs([view.to_tlv() for view in views])
+    assert collection.hexdump() == DATA
+
+
+@pytest.mark.parametrize('size', [1, 2, len(RECORD) - 1, len(DATA) - 3])
+def test_truncated(size):
+    with pytest.raises(ValueError):
+        list(iter_tlv_views(DATA[:size]))
+
+
+def test_copy_is_independent():
+    original = TLV(b'\x9f\x02', b'\x01')
+    copied = original.copy()
+    assert copied is not original
+    copied.setTLV(b'\x5a', b'\x02')
+    assert original.getTag() == b'\x9f\x02'
+    assert original.getVal() == b'\x01'
+
+
+def collection(*items):
+    return TLVs([TLV(tag, value) for tag, value in items])
+
+
+def test_duplicate_tags():
+    tlvs = collection((b'\x9f\x02', b'\x01'), (b'\x5a', b'\x03'),
+                      (b'\x9f\x02', b'\x02'))
+    assert tlvs.get_TLV(b'\x9f\x02').getVal() == b'\x01'
+    assert [item.getVal() for item in tlvs.get_TLVs_by_tag(b'\x9f\x02')] == \
+        [b'\x01', b'\x02']
+    assert tlvs.TLVisPresent(TLV(b'\x9f\x02', b'\x02'))
+    assert not tlvs.TLVisPresent(TLV(b'\x9f\x02', b'\x05'))
+    assert tlvs.get_TLV(b'\x77') is None
+    assert tlvs.get_TLVs_by_tag(b'\x77') == []
+
+
+def test_compare_duplicate_tags():
+    tlvs = collection((b'\x9f\x02', b'\x01'), (b'\x9f\x02', b'\x02'))
+    same = collection((b'\x9f\x02', b'\x02'), (b'\x9f\x02', b'\x01'))
+    subset = collection((b'\x9f\x02', b'\x02'))
+    other = collection((b'\x9f\x02', b'\x01'), (b'\x9f\x02', b'\x03'))
+    assert tlvs.compare_tlvs(same, True) and same.compare_tlvs(tlvs, True)
+    assert tlvs.compare_tlvs(subset)
+    assert not tlvs.compare_tlvs(subset, True)
+    assert not subset.compare_tlvs(tlvs)
+    assert not tlvs.compare_tlvs(other)
+    # multiplicity is not compared, as before the index
+    repeated = collection((b'\x9f\x02', b'\x02'), (b'\x9f\x02', b'\x02'))
+    assert subset.compare_tlvs(repeated, True)
+    with pytest.raises(TypeError):
+        tlvs.compare_tlvs([TLV(b'\x9f\x02', b'\x01')])
+
+
+def test_index_follows_add():
+    tlvs = collection((b'\x9f\x02', b'\x01'))
+    tlvs.addTLV(TLV(b'\x9f\x02', b'\x02'))
+    tlvs.addTLV(TLV(b'\x5a', b'\x03'))
+    assert len(tlvs) == 3
+    assert [item.getVal() for item in tlvs.get_TLVs_by_tag(b'\x9f\x02')] == \
+        [b'\x01', b'\x02']
+    assert tlvs.get_TLV(b'\x5a').getVal() == b'\x03'
+
+
+def test_index_not_stale_after_outside_changes():
+    items = [TLV(b'\x9f\x02', b'\x01'), TLV(b'\x5a', b'\x03')]
+    tlvs = TLVs(items)
+    # same length, different item: the collection must not change
+    items[0] = TLV(b'\x50', b'\x04')
+    assert tlvs.get_TLV(b'\x9f\x02').getVal() == b'\x01'
+    assert tlvs.get_TLV(b'\x50') is None
+    assert tlvs.getTLVs()[0].getTag() == b'\x9f\x02'
+    with pytest.raises(TypeError):
+        tlvs.getTLVs()[0] = TLV(b'\x50', b'\x04')
+    assert [item.getTag() for item in tlvs] == [b'\x9f\x02', b'\x5a']
+
+
+def test_invalid_items():
+    with pytest.raises(TypeError):
+        TLVs([TLV(b'\x5a', b'\x01'), b'\x5a\x01\x01'])
+    with pytest.raises(TypeError):
+        TLVs().addTLV(b'\x5a\x01\x01')
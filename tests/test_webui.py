@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebUI addon tests against a fake selenium driver: the page elements are
+set by the test, also while the addon waits for them.
+"""
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from kali.addons.webui import addon as webui_addon
+from kali.addons.webui.addon import KaliWebUiAddon, LOGIN_PASSWORD_XPATH
+from kali.addons.webui.locators import ANY_ROUTE, LocatorCache
+from kali.addons.webui.pages_data import INPUTS_DICT, LED_BLACK_IMG, \
+    LED_GREEN_IMG
+from kali.exceptions import KaliExceptionWebUiDriver
+from kali.probes import SCRIPT_TIMEOUT_MARGIN
+
+HOME = (INPUTS_DICT['Home_Page']['by'], INPUTS_DICT['Home_Page']['value'])
+LOGIN = (By.XPATH, LOGIN_PASSWORD_XPATH)
+
+
+class Element(object):
+
+    def __init__(self, text=''):
+        self.text = text
+
+    def is_displayed(self):
+        return True
+
+
+class Driver(object):
+
+    def __init__(self):
+        self.elements = {}
+        self.script_timeout = None
+        self.scripts = []
+        self.script_result = True
+        self.async_timeouts = []
+
+    def show(self, locator, element=None):
+        self.elements[locator] = [element or Element()]
+
+    def find_elements(self, by, value):
+        return list(self.elements.get((by, value), []))
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(value)
+        return elements[0]
+
+    def execute_script(self, script, *args):
+        self.scripts.append(args)
+        if callable(self.script_result):
+            return self.script_result()
+        return self.script_result
+
+    def execute_async_script(self, script, *args):
+        self.async_timeouts.append((args[0], self.script_timeout))
+        return True
+
+    def set_script_timeout(self, seconds):
+        self.script_timeout = seconds
+
+
+class Logger(object):
+
+    def debug(self, message):
+        pass
+
+    info = warning = error = debug
+
+
+@pytest.fixture(autouse=True)
+def fast_leds(monkeypatch):
+    monkeypatch.setattr(webui_addon, 'LED_LOADING_TIMEOUT', 0.5)
+    monkeypatch.setattr(webui_addon, 'LED_LOADING_INTERVAL', 0.05)
+
+
+@pytest.fixture
+def webui(monkeypatch):
+    addon = KaliWebUiAddon()
+    addon.logger = Logger()
+    addon.driver = Driver()
+    addon.check_timeout = 2.0
+    addon.logins = []
+    monkeypatch.setattr(addon, 'check_login',
+                        lambda psw: addon.logins.append(psw))
+    return addon
+
+
+def test_login_skipped_on_home_page(webui):
+    webui.is_logged = True
+    webui.driver.show(HOME)
+    assert webui.macro_login() is True
+    assert webui.logins == []
+    assert webui.is_logged
+
+
+def test_login_after_session_expired(webui):
+    webui.is_logged = True
+    # the page is still loading, then redirects to the login page
+    threading.Timer(
+        0.3, webui.driver.show, (LOGIN, Element('Password: 123456'))).start()
+    webui.macro_login()
+    assert webui.logins == ['123456']
+    assert not webui.is_logged
+
+
+def test_check_timeout_sets_script_timeout(webui):
+    webui.set_check_timeout(12)
+    assert webui.driver.script_timeout == 12 + SCRIPT_TIMEOUT_MARGIN
+
+
+def test_wait_script_timeout_on_shared_driver(webui):
+    other = KaliWebUiAddon()
+    other.driver = webui.driver
+    webui.set_check_timeout(30)
+    # the script timeout of the shared driver is the last one set
+    other.set_check_timeout(1)
+    webui.is_logged = True
+    webui.driver.show(HOME)
+    assert webui.macro_login() is True
+    assert webui.driver.async_timeouts == [(30, 30 + SCRIPT_TIMEOUT_MARGIN)]
+
+
+def leds_state(webui, *images):
+    """The page shows the Network status leds, with images in turn"""
+    images = iter(images)
+
+    def state():
+        image = next(images, None)
+        return {'route': '/#/home', 'labels': {}, 'leds': {
+            'Network status': {'SIDE A reachable': image,
+                               'SIDE B reachable': LED_GREEN_IMG}}}
+    webui.driver.script_result = state
+
+
+def test_led_status_waits_loading(webui):
+    leds_state(webui, LED_BLACK_IMG, LED_BLACK_IMG, LED_GREEN_IMG)
+    assert webui.led_is_green('Network status', 'SIDE A reachable')
+    assert len(webui.driver.scripts) == 3
+
+
+def test_led_status_polls_with_interval(webui):
+    leds_state(webui, *[LED_BLACK_IMG] * 100)
+    start = time.monotonic()
+    assert webui.led_is('Network status', 'SIDE A reachable', 'Black', True)
+    assert time.monotonic() - start >= webui_addon.LED_LOADING_TIMEOUT
+    assert len(webui.driver.scripts) <= \
+        webui_addon.LED_LOADING_TIMEOUT / webui_addon.LED_LOADING_INTERVAL + 1
+
+
+def test_led_not_found(webui):
+    leds_state(webui)
+    with pytest.raises(KaliExceptionWebUiDriver):
+        webui.led_status('Network status', 'SIDE A reachable', True)
+    with pytest.raises(KaliExceptionWebUiDriver):
+        webui.led_status('Network status', 'SIDE C reachable', True)
+
+
+def test_index_labels_not_cached_per_route():
+    cache = LocatorCache()
+    driver = Driver()
+    cache.store(driver, 'Home_Page', None, Element())
+    cache.add('Home_Page', None, '/#/status', ('xpath', '/html/body/div[2]'))
+    assert driver.scripts == []
+    assert list(cache.query('Home_Page')['locators']) == [ANY_ROUTE]
+
+
+def test_positional_locator_checked():
+    cache = LocatorCache()
+    driver = Driver()
+    driver.script_result = [
+        '/#/network', ['xpath', '/html/body/div[2]/input[1]', 'DNS', 'input']]
+    cache.store(driver, 'DNS', 'text', Element())
+    assert driver.scripts[0][1] == 'DNS'
+    assert cache.query('DNS', 'text')['locators'] == {
+        '/#/network': ('xpath', '/html/body/div[2]/input[1]', 'DNS', 'input')}
+
+
+def uptime_page(webui, monkeypatch, *uptimes):
+    """The uptime cell shows the uptimes in turn, then the last one"""
+    uptimes = list(uptimes)
+    webui.clicks = []
+    webui.checked = []
+
+    def get_value(label, _type=None):
+        return uptimes.pop(0) if len(uptimes) > 1 else uptimes[0]
+
+    def get_value_and_check(label, expected, _type=None):
+        webui.checked.append(get_value(label) == expected)
+    monkeypatch.setattr(webui_addon, 'UPTIME_INTERVAL', 0.01)
+    monkeypatch.setattr(webui, 'click_button', webui.clicks.append)
+    monkeypatch.setattr(webui, 'get_value', get_value)
+    monkeypatch.setattr(webui, 'get_value_and_check', get_value_and_check)
+
+
+def test_uptime_refreshed_until_reached(webui, monkeypatch):
+    uptime_page(webui, monkeypatch, 'up 2 hours, 9 minutes',
+                'up 2 hours, 9 minutes', 'up 2 hours, 9 minutes',
+                'up 2 hours, 10 minutes')
+    start = time.monotonic()
+    webui.macro_wait_and_check_uptime(wait_minutes=1, click_button='Refresh')
+    assert time.monotonic() - start < 1.0
+    # one refresh before each read, none once the uptime is reached
+    assert webui.clicks == ['Refresh'] * 3
+    assert webui.checked == [True]